@@ -1,24 +1,49 @@
 # -*- coding: utf-8 -*-
 
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, request, jsonify, render_template, send_from_directory, Response, stream_with_context
 import os
+from werkzeug.serving import is_running_from_reloader
 from werkzeug.utils import secure_filename
 import json
+import threading
 import time
-from functools import lru_cache
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import nullcontext
 from flask_cors import CORS
 
+# 確保憑證設置（需在其他模組讀取 .env 設定之前載入）
+import setup_credentials
+
 # 導入我們的模組
-from ocr_service import detect_text, detect_document
-from image_processor import preprocess_image, try_all_preprocessing
-from invoice_parser import InvoiceParser
+# ocr_service（google.cloud.vision）與 image_processor（cv2、numpy）載入較慢，
+# 在第一次使用時才導入，或由 warm_up() 預先載入
+from ocr_cache import get_ocr_cache
+from invoice_parser import InvoiceParser, save_result
+from layout_parser import LayoutParser
 from continuous_learning import collect_feedback_data, analyze_error_patterns
-
-# 確保憑證設置
-import setup_credentials
+from job_queue import JobQueue
+from correction_model import apply_corrections
+from upload_ingest import ingest_upload, sniff_format, verify_header, UploadTooLarge, InvalidUpload
 
 app = Flask(__name__)
 
+def warm_up():
+    """預先載入 OCR 與影像處理模組並建立 Vision client，避免第一個請求承擔載入時間"""
+    start = time.perf_counter()
+    try:
+        import image_processor
+        import ocr_service
+        ocr_service.get_vision_client()
+    except Exception as e:
+        print(f"預熱失敗: {str(e)}")
+        return
+    print(f"預熱完成，耗時 {time.perf_counter() - start:.2f} 秒")
+
+# WARM_UP_ON_START=true 時在背景預熱，不阻塞 worker 啟動
+if os.getenv('WARM_UP_ON_START', 'false').lower() in ('1', 'true', 'yes'):
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
 # 配置 CORS，允許所有來源
 CORS(app, 
      resources={r"/*": {
@@ -31,12 +56,34 @@ CORS(app,
 
 # 添加 OPTIONS 請求處理
 @app.route('/api/upload', methods=['OPTIONS'])
+@app.route('/api/upload/batch', methods=['OPTIONS'])
 def handle_options():
     response = app.make_default_options_response()
     return response
 
 app.config['UPLOAD_FOLDER'] = 'uploads/'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 限制上傳大小為 16MB
+app.config['MAX_FILE_SIZE'] = 16 * 1024 * 1024  # 限制單一文件大小為 16MB
+app.config['MAX_CONTENT_LENGTH'] = 256 * 1024 * 1024  # 批次上傳整個請求的上限
+# 是否保存上傳的原始文件與預處理後的圖像（預處理與 OCR 本身都在記憶體中進行）
+app.config['PERSIST_UPLOADS'] = os.getenv('PERSIST_UPLOADS', 'true').lower() not in ('0', 'false', 'no')
+app.config['PERSIST_PROCESSED'] = os.getenv('PERSIST_PROCESSED', 'false').lower() not in ('0', 'false', 'no')
+# 自動選擇預處理：只對品質分數最高的前 k 個結果做 OCR，信心度達標即停止
+app.config['AUTO_TOP_K'] = int(os.getenv('AUTO_TOP_K', '3'))
+if app.config['AUTO_TOP_K'] < 1:
+    print(f"AUTO_TOP_K={app.config['AUTO_TOP_K']} 無效，改為 1")
+    app.config['AUTO_TOP_K'] = 1
+app.config['AUTO_CONFIDENCE_THRESHOLD'] = float(os.getenv('AUTO_CONFIDENCE_THRESHOLD', '0.85'))
+app.config['AUTO_MIN_FIELDS'] = int(os.getenv('AUTO_MIN_FIELDS', '3'))
+# 先在本地解碼電子發票證明聯的 QR Code，成功時略過預處理與 OCR
+# 每份非電子發票會多花 QR Code 偵測的時間，預設關閉
+app.config['EINVOICE_FAST_PATH'] = os.getenv('EINVOICE_FAST_PATH', 'false').lower() in ('1', 'true', 'yes')
+# document 模式是否使用版面解析（目前比正則表達式慢，預設關閉；layout 模式一律使用）
+app.config['DOCUMENT_LAYOUT_PARSER'] = os.getenv('DOCUMENT_LAYOUT_PARSER', 'false').lower() in ('1', 'true', 'yes')
+# 多頁 PDF / TIFF 同時處理的頁數
+app.config['PAGE_WORKERS'] = int(os.getenv('PAGE_WORKERS', '4'))
+app.config['PREPROCESS_WORKERS'] = int(os.getenv('PREPROCESS_WORKERS', str(os.cpu_count() or 4)))
+# 批次上傳（含 zip 解壓後）最多接受的文件數
+app.config['BATCH_MAX_FILES'] = int(os.getenv('BATCH_MAX_FILES', '100'))
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'tif', 'tiff', 'pdf'}
 
 # 確保上傳目錄存在
@@ -54,6 +101,232 @@ def index():
 def uploaded_file(filename):
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
+def _save_processed(file_path, preprocessing_method, processed):
+    # 只在開啟 PERSIST_PROCESSED 時保存預處理結果，供調試或前端顯示
+    if not app.config['PERSIST_PROCESSED'] or not file_path:
+        return None
+    output_dir = os.path.join(os.path.dirname(file_path), 'processed')
+    os.makedirs(output_dir, exist_ok=True)
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    label = (preprocessing_method or 'original').replace('|', '-')
+    processed_path = os.path.join(output_dir, f"{base_name}_{label}.png")
+    with open(processed_path, 'wb') as f:
+        f.write(processed)
+    return processed_path
+
+def _make_parser(ocr_result):
+    """選擇解析器：layout 模式的文字框列表使用版面解析，純文字使用正則表達式解析；
+    document 模式只在開啟 DOCUMENT_LAYOUT_PARSER 時使用版面解析"""
+    if isinstance(ocr_result, str):
+        return InvoiceParser(ocr_result)
+    if isinstance(ocr_result, dict) and not app.config['DOCUMENT_LAYOUT_PARSER']:
+        return InvoiceParser(ocr_result['text'])
+    return LayoutParser(ocr_result)
+
+def _run_ocr(processed, preprocessing_method, ocr_mode, file_path):
+    """執行 OCR，返回尚未解析的 InvoiceParser / LayoutParser"""
+    from ocr_service import detect_text_content, detect_document_content, detect_layout_content
+    if ocr_mode == 'document':
+        return _make_parser(detect_document_content(processed, preprocessing_method, file_path))
+    if ocr_mode == 'layout':
+        return _make_parser(detect_layout_content(processed, preprocessing_method))
+    return _make_parser(detect_text_content(processed, preprocessing_method))
+
+def _select_preprocessing(candidates, ocr_mode, file_path):
+    """依品質分數排序候選結果，只對前 k 個做 OCR，信心度達標即提前結束
+    
+    Returns:
+        (method, processed, ocr_text, parser, attempts)
+    """
+    from image_processor import rank_preprocessing
+    # 至少要對一個候選結果做 OCR（AUTO_TOP_K=0 時 best 會是 None）
+    ranked = rank_preprocessing(candidates)[:max(1, app.config['AUTO_TOP_K'])]
+    best, best_key, attempts = None, None, []
+    for method, quality in ranked:
+        processed = candidates[method].encode()
+        parser = _run_ocr(processed, method, ocr_mode, file_path)
+        ocr_text = parser.text
+        invoice_data = parser.extract_all()
+        
+        fields = len(invoice_data['confidence'])
+        confidence = invoice_data['overall_confidence']
+        attempts.append({
+            "method": method,
+            "quality": quality,
+            "fields": fields,
+            "overall_confidence": confidence
+        })
+        
+        # 找到的欄位越多越好，其次看整體信心度
+        key = (fields, confidence)
+        if best_key is None or key > best_key:
+            best, best_key = (method, processed, ocr_text, parser), key
+        # 只有一兩個欄位時整體信心度也可能很高，因此同時要求欄位數
+        if confidence >= app.config['AUTO_CONFIDENCE_THRESHOLD'] and fields >= app.config['AUTO_MIN_FIELDS']:
+            break
+    return best + (attempts,)
+
+def _save_parse_result(result, file_path, page):
+    # 同一文件的各頁會在同一秒內完成，需以頁碼區分結果檔
+    if page is None:
+        return save_result(result)
+    os.makedirs('parsing_results', exist_ok=True)
+    label = os.path.splitext(os.path.basename(file_path))[0] if file_path else str(int(time.time()))
+    return save_result(result, os.path.join('parsing_results', f"invoice_{label}_p{page}.json"))
+
+def process_invoice(file_path, preprocessing_method='adaptive', ocr_mode='text', job=None, content=None,
+                    page=None):
+    """執行 預處理 → OCR → 解析 流程，圖像全程在記憶體中傳遞
+    
+    Args:
+        file_path: 已保存的上傳文件路徑，未保存時為 None
+        preprocessing_method: 預處理方法或 "a|b|c" 形式的流水線；
+            'auto'（或 'all'）時執行所有方法，依品質分數挑選候選結果做 OCR
+        ocr_mode: 'text'、'layout' 或 'document'；後兩者依文字框位置解析
+        job: JobContext，在任務佇列中執行時用於回報各階段進度與耗時
+        content: 上傳文件的位元組，未提供時從 file_path 讀取
+        page: 多頁文件中的頁碼，content 為該頁的圖像
+    """
+    from image_processor import preprocess_bytes, run_all_preprocessing
+    
+    stage = job.stage if job else (lambda name: nullcontext())
+    
+    if content is None:
+        with open(file_path, 'rb') as f:
+            content = f.read()
+    
+    # 多頁文件的各頁以頁碼區分輸出的文件名
+    name = file_path
+    if page is not None and file_path:
+        base, ext = os.path.splitext(file_path)
+        name = f"{base}_p{page}{ext}"
+    
+    # 電子發票證明聯：QR Code 已包含發票資料，解碼成功就不需要 OCR
+    if app.config['EINVOICE_FAST_PATH']:
+        from einvoice import decode_einvoice
+        with stage('qr'):
+            invoice_data = decode_einvoice(content)
+        if invoice_data is not None:
+            return {
+                "file_path": file_path,
+                "page": page,
+                "processed_path": None,
+                "preprocessing_method": None,
+                "preprocessing_timings": [],
+                "preprocessing_attempts": None,
+                "ocr_text": None,
+                "invoice_data": invoice_data,
+                "result_path": _save_parse_result(invoice_data, file_path, page)
+            }
+    
+    # 預處理圖像
+    preprocessing_timings = []
+    candidates = None
+    with stage('preprocess'):
+        if preprocessing_method in ('auto', 'all'):
+            candidates = run_all_preprocessing(name, content=content)
+            if not candidates:
+                preprocessing_method, processed = None, content
+        else:
+            processed = preprocess_bytes(content, preprocessing_method, timings=preprocessing_timings)
+    
+    # OCR 識別
+    attempts = None
+    with stage('ocr'):
+        if candidates:
+            preprocessing_method, processed, ocr_text, parser, attempts = \
+                _select_preprocessing(candidates, ocr_mode, name)
+        else:
+            parser = _run_ocr(processed, preprocessing_method, ocr_mode, name)
+            ocr_text = parser.text
+    processed_path = _save_processed(name, preprocessing_method, processed)
+    
+    # 解析發票信息
+    with stage('parse'):
+        if attempts is None:
+            parser.extract_all()
+        # 以反饋學到的字元混淆表修正常見誤認
+        apply_corrections(parser.result)
+        invoice_data = parser.result
+        
+        # 保存解析結果
+        result_path = _save_parse_result(invoice_data, file_path, page)
+    
+    return {
+        "file_path": file_path,
+        "page": page,
+        "processed_path": processed_path,
+        "preprocessing_method": preprocessing_method,
+        "preprocessing_timings": preprocessing_timings,
+        "preprocessing_attempts": attempts,
+        "ocr_text": ocr_text,
+        "invoice_data": invoice_data,
+        "result_path": result_path
+    }
+
+def process_pages(file_path, content, fmt, preprocessing_method='adaptive', ocr_mode='text'):
+    """逐頁處理多頁 PDF / TIFF，各頁並行執行 預處理 → OCR → 解析
+    
+    頁面在送出處理時才光柵化，同時處理中的頁數有上限，
+    因此 30 頁的 PDF 不會一次全部載入記憶體。
+    
+    Yields:
+        各頁的處理結果（依完成順序），失敗的頁面包含 error
+    """
+    from page_splitter import iter_pages
+    
+    workers = app.config['PAGE_WORKERS']
+    
+    def page_result(future, page):
+        try:
+            return dict(future.result(), success=True)
+        except Exception as e:
+            return {"page": page, "success": False, "error": str(e)}
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for page, page_content in iter_pages(content, fmt):
+            future = executor.submit(process_invoice, file_path, preprocessing_method, ocr_mode,
+                                     content=page_content, page=page)
+            pending[future] = page
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield page_result(future, pending.pop(future))
+        for future in as_completed(list(pending)):
+            yield page_result(future, pending.pop(future))
+
+def _is_multi_page(content, fmt):
+    from page_splitter import is_multi_page
+    return fmt in ('pdf', 'tiff') and is_multi_page(content, fmt)
+
+def _single_page_image(content, fmt):
+    # 單頁 PDF 先光柵化，之後與一般圖像相同處理
+    from page_splitter import single_page_image
+    return single_page_image(content, fmt)
+
+def _run_job(params, job):
+    with open(params['file_path'], 'rb') as f:
+        content = f.read()
+    fmt = sniff_format(content[:16])
+    if _is_multi_page(content, fmt):
+        with job.stage('pages'):
+            pages = sorted(process_pages(content=content, fmt=fmt, **params), key=lambda r: r['page'])
+        return {"file_path": params['file_path'], "page_count": len(pages), "pages": pages}
+    return process_invoice(job=job, content=_single_page_image(content, fmt), **params)
+
+# 背景任務佇列，第一次提交任務時才啟動工作執行緒（導入 app 不會啟動）
+job_queue = JobQueue(_run_job)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    # 以 WSGI 伺服器執行時沒有經過 __main__，查詢任務時也確保佇列已啟動，繼續處理上次留下的任務
+    job_queue.start()
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found", "error_code": "JOB_NOT_FOUND"}), 404
+    return jsonify(job)
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     try:
@@ -64,53 +337,61 @@ def upload_file():
         if file.filename == '':
             return jsonify({"error": "No selected file", "error_code": "FILENAME_EMPTY"}), 400
         
-        file_size = len(file.read())
-        file.seek(0)  # 重置文件指針
-        if file_size > app.config['MAX_CONTENT_LENGTH']:
-            return jsonify({"error": "File too large", "error_code": "FILE_TOO_LARGE"}), 413
-        
         if file and allowed_file(file.filename):
-            if not validate_file_type(file):
-                return jsonify({"error": "Invalid file format", "error_code": "INVALID_FORMAT"}), 400
-            filename = secure_filename(file.filename)
-            timestamp = int(time.time())
-            filename = "{0}_{1}".format(timestamp, filename)  # 添加時間戳避免文件名衝突
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
+            preprocessing_method = request.form.get('preprocessing', 'adaptive')
+            ocr_mode = request.form.get('ocr_mode', 'text')
+            run_async = request.form.get('async', '').lower() in ('1', 'true', 'yes')
+            
+            # 非同步任務需要從磁碟讀取上傳文件，因此一定會保存
+            file_path = None
+            if app.config['PERSIST_UPLOADS'] or run_async:
+                filename = secure_filename(file.filename)
+                timestamp = int(time.time())
+                filename = "{0}_{1}".format(timestamp, filename)  # 添加時間戳避免文件名衝突
+                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             
+            # 單次分塊讀取：計算雜湊、檢查大小、判斷格式並寫入磁碟
             try:
-                # 預處理圖像
-                preprocessing_method = request.form.get('preprocessing', 'adaptive')
-                if preprocessing_method == 'all':
-                    processed_paths = try_all_preprocessing(file_path)
-                    # 使用第一個處理結果
-                    processed_path = list(processed_paths.values())[0] if processed_paths else file_path
-                else:
-                    processed_path = preprocess_image(file_path, preprocessing_method)
-                
-                # OCR 識別
-                ocr_mode = request.form.get('ocr_mode', 'text')
-                if ocr_mode == 'document':
-                    ocr_result = detect_document(processed_path)
-                    ocr_text = ocr_result['text']
-                else:
-                    ocr_text = detect_text(processed_path)
-                
-                # 解析發票信息
-                parser = InvoiceParser(ocr_text)
-                invoice_data = parser.extract_all()
-                
-                # 保存解析結果
-                result_path = parser.save_result()
-                
-                return jsonify({
-                    "success": True,
+                upload = ingest_upload(file.stream, app.config['MAX_FILE_SIZE'], file_path,
+                                       keep_content=not run_async)
+            except UploadTooLarge:
+                return jsonify({"error": "File too large", "error_code": "FILE_TOO_LARGE"}), 413
+            except InvalidUpload:
+                return jsonify({"error": "Invalid file format", "error_code": "INVALID_FORMAT"}), 400
+            
+            # 非同步模式：立即返回任務 ID，由背景工作執行緒處理
+            if run_async:
+                job_id = job_queue.submit({
                     "file_path": file_path,
-                    "processed_path": processed_path,
-                    "ocr_text": ocr_text,
-                    "invoice_data": invoice_data,
-                    "result_path": result_path
+                    "preprocessing_method": preprocessing_method,
+                    "ocr_mode": ocr_mode
                 })
+                return jsonify({
+                    "success": True,
+                    "job_id": job_id,
+                    "status_url": f"/api/jobs/{job_id}"
+                }), 202
+            
+            try:
+                # 多頁 PDF / TIFF：逐頁處理；stream=true 時每完成一頁就以一行 JSON 回傳
+                if _is_multi_page(upload.content, upload.format):
+                    pages = process_pages(file_path, upload.content, upload.format,
+                                          preprocessing_method, ocr_mode)
+                    if request.form.get('stream', '').lower() in ('1', 'true', 'yes'):
+                        lines = (json.dumps(page, ensure_ascii=False) + "\n" for page in pages)
+                        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+                    pages = sorted(pages, key=lambda r: r['page'])
+                    return jsonify({
+                        "success": True,
+                        "file_path": file_path,
+                        "sha256": upload.sha256,
+                        "page_count": len(pages),
+                        "pages": pages
+                    })
+                
+                result = process_invoice(file_path, preprocessing_method, ocr_mode,
+                                         content=_single_page_image(upload.content, upload.format))
+                return jsonify(dict(result, success=True, sha256=upload.sha256))
                 
             except Exception as e:
                 return jsonify({
@@ -126,14 +407,189 @@ def upload_file():
             "error_code": "INTERNAL_ERROR"
         }), 500
 
+def _count_batch_files(files):
+    """計算批次上傳的文件數，zip 檔以其中的文件數計算（只讀取目錄，不解壓）"""
+    count = 0
+    for file in files:
+        if file.filename.lower().endswith('.zip'):
+            try:
+                with zipfile.ZipFile(file) as archive:
+                    count += sum(1 for info in archive.infolist() if not info.is_dir())
+            except zipfile.BadZipFile:
+                count += 1
+            file.seek(0)
+        else:
+            count += 1
+    return count
+
+def _save_batch_uploads(files, timestamp):
+    """保存批次上傳的文件，zip 檔會被解壓
+    
+    Returns:
+        (保存的路徑列表, 被略過的文件列表, 多頁文件名列表)；多頁文件不會保存
+    """
+    saved, skipped, multi_page = [], [], []
+
+    def save(name, data):
+        filename = secure_filename(os.path.basename(name))
+        if not filename or not allowed_file(filename):
+            skipped.append({"filename": name, "error": "File type not allowed"})
+            return
+        if len(data) > app.config['MAX_FILE_SIZE']:
+            skipped.append({"filename": name, "error": "File too large"})
+            return
+        try:
+            fmt = sniff_format(data)
+            if fmt is None:
+                raise InvalidUpload("無法辨識的文件格式")
+            verify_header(fmt, content=data)
+        except InvalidUpload:
+            skipped.append({"filename": name, "error": "Invalid file format"})
+            return
+        if _is_multi_page(data, fmt):
+            multi_page.append(name)
+            return
+        if fmt == 'pdf':
+            # 批次預處理從磁碟讀取圖像，單頁 PDF 保存光柵化後的 PNG
+            data = _single_page_image(data, fmt)
+            filename = os.path.splitext(filename)[0] + '.png'
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'],
+                                 "{0}_{1}_{2}".format(timestamp, len(saved), filename))
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        saved.append(file_path)
+
+    for file in files:
+        if file.filename.lower().endswith('.zip'):
+            try:
+                with zipfile.ZipFile(file) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir():
+                            continue
+                        if info.file_size > app.config['MAX_FILE_SIZE']:
+                            skipped.append({"filename": info.filename, "error": "File too large"})
+                            continue
+                        save(info.filename, archive.read(info))
+            except zipfile.BadZipFile:
+                skipped.append({"filename": file.filename, "error": "Invalid zip file"})
+        else:
+            save(file.filename, file.read())
+    return saved, skipped, multi_page
+
+@app.route('/api/upload/batch', methods=['POST'])
+def upload_batch():
+    """批次上傳：多個文件或 zip 檔，預處理並行執行，OCR 以批次請求送出"""
+    from image_processor import preprocess_image
+    from ocr_service import detect_batch
+    
+    try:
+        files = [f for f in request.files.getlist('files') if f.filename]
+        if not files:
+            return jsonify({"error": "No files", "error_code": "FILE_MISSING"}), 400
+
+        # 批次 OCR 每個文件只做一次預處理與一次 OCR：
+        # 自動選擇預處理與多頁文件需要逐頁、多次 OCR，請改用 /api/upload
+        preprocessing_method = request.form.get('preprocessing', 'adaptive')
+        if preprocessing_method in ('auto', 'all'):
+            return jsonify({"error": "Batch upload does not support automatic preprocessing, use /api/upload",
+                            "error_code": "UNSUPPORTED_MODE"}), 400
+        file_count = _count_batch_files(files)
+        if file_count > app.config['BATCH_MAX_FILES']:
+            return jsonify({"error": f"Too many files: {file_count} (max {app.config['BATCH_MAX_FILES']})",
+                            "error_code": "TOO_MANY_FILES"}), 400
+
+        start = time.perf_counter()
+        file_paths, skipped, multi_page = _save_batch_uploads(files, int(time.time()))
+        if multi_page:
+            for file_path in file_paths:
+                os.remove(file_path)
+            return jsonify({"error": "Batch upload does not support multi-page files, use /api/upload",
+                            "error_code": "UNSUPPORTED_MODE",
+                            "multi_page": multi_page}), 400
+        if not file_paths:
+            return jsonify({"error": "No valid files", "error_code": "INVALID_FORMAT",
+                            "skipped": skipped}), 400
+        timings = {"save": time.perf_counter() - start}
+
+        # 並行預處理（OpenCV 運算時會釋放 GIL）
+        stage_start = time.perf_counter()
+
+        def preprocess(path):
+            try:
+                return preprocess_image(path, preprocessing_method), None
+            except Exception as e:
+                return path, str(e)
+
+        with ThreadPoolExecutor(max_workers=app.config['PREPROCESS_WORKERS']) as executor:
+            preprocessed = list(executor.map(preprocess, file_paths))
+        timings["preprocess"] = time.perf_counter() - stage_start
+
+        # 批次 OCR
+        ocr_mode = request.form.get('ocr_mode', 'text')
+        if ocr_mode not in ('text', 'layout', 'document'):
+            ocr_mode = 'text'
+        stage_start = time.perf_counter()
+        processed_paths = [path for path, _ in preprocessed]
+        ocr_outputs = detect_batch(processed_paths, ocr_mode, preprocessing_method)
+        timings["ocr"] = time.perf_counter() - stage_start
+
+        # 解析發票信息
+        stage_start = time.perf_counter()
+        os.makedirs('parsing_results', exist_ok=True)
+        results = []
+        for file_path, (processed_path, preprocess_error), output in zip(file_paths, preprocessed, ocr_outputs):
+            item = {
+                "file_path": file_path,
+                "processed_path": processed_path,
+                "preprocess_error": preprocess_error
+            }
+            if output['error']:
+                item.update(success=False, error=output['error'])
+            else:
+                parser = _make_parser(output['result'])
+                ocr_text = parser.text
+                parser.extract_all()
+                apply_corrections(parser.result)
+                item.update(
+                    success=True,
+                    ocr_text=ocr_text,
+                    invoice_data=parser.result,
+                    # 同一秒內會解析多份，以文件名區分結果檔
+                    result_path=parser.save_result(os.path.join(
+                        'parsing_results', 'invoice_{0}.json'.format(os.path.basename(file_path))))
+                )
+            results.append(item)
+        timings["parse"] = time.perf_counter() - stage_start
+
+        wall_clock = time.perf_counter() - start
+        timings["wall_clock"] = wall_clock
+        return jsonify({
+            "success": True,
+            "count": len(results),
+            "results": results,
+            "skipped": skipped,
+            "timings": timings,
+            "files_per_second": len(results) / wall_clock if wall_clock else None
+        })
+
+    except Exception as e:
+        return jsonify({
+            "error": str(e),
+            "error_code": "INTERNAL_ERROR"
+        }), 500
+
 @app.route('/api/analysis', methods=['GET'])
 def get_analysis():
     try:
-        analysis = analyze_error_patterns()
+        # days=7 / days=30 只統計最近的反饋
+        analysis = analyze_error_patterns(days=request.args.get('days', type=int))
         return jsonify({
             'total_samples': analysis.get('total_samples', 0),
             'error_patterns': analysis.get('error_patterns', []),
-            'recommendations': analysis.get('recommendations', [])
+            'recommendations': analysis.get('recommendations', []),
+            'by_tax_type': analysis.get('by_tax_type', {}),
+            'by_preprocessing': analysis.get('by_preprocessing', {}),
+            'daily': analysis.get('daily', [])
         })
     except Exception as e:
         return jsonify({
@@ -157,7 +613,8 @@ def submit_feedback():
         feedback_file = collect_feedback_data(
             data['original_result'],
             data['corrected_result'],
-            data['image_path']
+            data['image_path'],
+            data.get('preprocessing_method')
         )
         
         return jsonify({
@@ -172,25 +629,18 @@ def submit_feedback():
             "success": False
         }), 400
 
-@lru_cache(maxsize=100)
-def get_error_analysis():
-    try:
-        analysis = analyze_error_patterns()
-        return jsonify(analysis)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-def validate_file_type(file):
-    try:
-        from PIL import Image
-        image = Image.open(file)
-        image.verify()
-        file.seek(0)
-        return True
-    except:
-        return False
+@app.route('/api/ocr-cache/stats', methods=['GET'])
+def ocr_cache_stats():
+    cache = get_ocr_cache()
+    if cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(cache.stats(), enabled=True))
 
 if __name__ == '__main__':
     port = 5001  # 改用 5001 端口
+    # 啟動時就開始處理上次留下的任務，不等到下一次上傳；
+    # debug 模式的 reloader 監看程序不處理請求，只在實際服務的子程序中啟動
+    if is_running_from_reloader():
+        job_queue.start()
     print(f"Starting server on port {port}")
     app.run(host='0.0.0.0', port=port, debug=True) 
\ No newline at end of file
@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+
+"""效能基準測試
+
+用法：
+    python benchmark.py parser [--repeat N] [--pages N]
+    python benchmark.py layout [--repeat N]
+    python benchmark.py table [--rows N] [--budget-ms MS]
+    python benchmark.py einvoice [--repeat N]
+    python benchmark.py vision-client [--repeat N] [--setup-cost S] [--real]
+    python benchmark.py batch [--files N] [--latency S]
+    python benchmark.py preprocess IMAGE [--repeat N]
+    python benchmark.py pipelines IMAGE "a|b|c" ["a|b|d" ...]
+    python benchmark.py correction [--repeat N] [--budget-ms MS]
+    python benchmark.py import-time [--module app] [--budget-ms MS]
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from invoice_parser import InvoiceParser, scan_candidates
+
+def load_ocr_documents(ocr_dir="ocr_results"):
+    """讀取 detect_document 保存的完整 OCR 結果（包含段落位置）"""
+    documents = []
+    for path in sorted(glob.glob(os.path.join(ocr_dir, '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            documents.append(json.load(f))
+    return documents
+
+def load_ocr_corpus(ocr_dir="ocr_results"):
+    """讀取 detect_document 保存的 OCR 結果作為測試語料"""
+    return [document['text'] for document in load_ocr_documents(ocr_dir)]
+
+def _time_per_doc(func, docs, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for doc in docs:
+            func(doc)
+    return (time.perf_counter() - start) / (repeat * len(docs))
+
+def benchmark_parser(repeat=50, pages=1):
+    """InvoiceParser 每份文件的解析耗時"""
+    texts = load_ocr_corpus()
+    if not texts:
+        print("ocr_results/ 中沒有 OCR 結果可供測試")
+        return None
+    if pages > 1:
+        # 模擬多頁文件的 OCR 輸出
+        texts = ['\n'.join([text] * pages) for text in texts]
+
+    def parse(text):
+        return InvoiceParser(text).extract_all()
+
+    # 取多輪中最快的一輪，降低機器負載的干擾
+    scan = min(_time_per_doc(scan_candidates, texts, repeat) for _ in range(3))
+    full = min(_time_per_doc(parse, texts, repeat) for _ in range(3))
+
+    avg_len = sum(len(text) for text in texts) / len(texts)
+    print(f"文件數: {len(texts)}，平均長度: {avg_len:.0f} 字")
+    print(f"scan_candidates（所有欄位的候選）: {scan * 1e6:.1f} µs/份")
+    print(f"InvoiceParser.extract_all:         {full * 1e6:.1f} µs/份")
+    return {"scan_candidates": scan, "extract_all": full}
+
+def benchmark_layout(repeat=50):
+    """LayoutParser 與 InvoiceParser 的解析耗時，並列出兩者結果不同的欄位"""
+    from layout_parser import LayoutParser
+
+    documents = load_ocr_documents()
+    if not documents:
+        print("ocr_results/ 中沒有 OCR 結果可供測試")
+        return None
+
+    regex = min(_time_per_doc(lambda doc: InvoiceParser(doc['text']).extract_all(), documents, repeat)
+                for _ in range(3))
+    layout = min(_time_per_doc(lambda doc: LayoutParser(doc).extract_all(), documents, repeat)
+                 for _ in range(3))
+
+    fields = ("invoice_number", "seller_tax_id", "total_amount", "buyer", "address", "items")
+    differences = 0
+    for document in documents:
+        by_regex = InvoiceParser(document['text']).extract_all()
+        by_layout = LayoutParser(document).extract_all()
+        for field in fields:
+            if by_regex[field] != by_layout[field]:
+                differences += 1
+                print(f"  {field}: 正則={by_regex[field]!r} 版面={by_layout[field]!r}")
+
+    print(f"文件數: {len(documents)}，結果不同的欄位: {differences}")
+    print(f"InvoiceParser.extract_all: {regex * 1e6:.1f} µs/份")
+    print(f"LayoutParser.extract_all:  {layout * 1e6:.1f} µs/份")
+    return {"regex": regex, "layout": layout}
+
+def _synthetic_table(rows):
+    """合成批發發票的品項表格文字框：表頭、rows 列品項與合計列"""
+    def box(text, x0, y0, x1):
+        return {'text': text, 'bounding_box': [(x0, y0), (x1, y0), (x1, y0 + 20), (x0, y0 + 20)]}
+
+    layout = [box(text, x, 0, x + 40) for text, x in (('品名', 10), ('數量', 300), ('單價', 400), ('金額', 500))]
+    y = 0
+    for i in range(rows):
+        y += 28
+        quantity, unit_price = i % 9 + 1, 10 + i * 7 % 490
+        layout += [
+            box(f"商品{i:04d}", 10, y, 120),
+            box(str(quantity), 310, y, 320),
+            box(str(unit_price), 400, y, 430),
+            box(f"{quantity * unit_price:,}", 500, y, 545),
+        ]
+    layout.append(box('合計', 10, y + 28, 50))
+    return layout
+
+def benchmark_table(rows=200, repeat=20, budget_ms=20.0):
+    """品項表格重建的耗時（合成資料），超過預算時以非零狀態結束"""
+    from layout_parser import LayoutParser
+    from table_parser import extract_table_items
+
+    parser = LayoutParser(_synthetic_table(rows))
+    items, confidence = extract_table_items(parser.words, parser.layout.line_height)
+    per_table = min(
+        _time_per_doc(lambda words: extract_table_items(words, parser.layout.line_height), [parser.words], repeat)
+        for _ in range(3)
+    )
+
+    print(f"品項: {len(items)}/{rows}，驗證通過: {sum(item['validated'] for item in items)}，信心度: {confidence}")
+    print(f"表格重建: {per_table * 1e3:.2f} ms（預算 {budget_ms:.1f} ms）")
+    if per_table * 1e3 > budget_ms:
+        print("超過延遲預算")
+        sys.exit(1)
+    return per_table
+
+def benchmark_einvoice(repeat=10):
+    """電子發票 QR Code 快速路徑的解碼耗時（以 OpenCV 產生合成的證明聯）"""
+    import cv2
+    import numpy as np
+    from einvoice import decode_einvoice
+
+    left = ('AB12345678' '1130305' '1234' f"{95:08x}" f"{100:08x}" '00000000' '12345678' + 'A' * 24
+            + ':**********:2:2:1:咖啡:2:30:蛋糕:1:40')
+    encoder = cv2.QRCodeEncoder.create()
+    codes = [cv2.resize(encoder.encode(text), (300, 300), interpolation=cv2.INTER_NEAREST)
+             for text in (left, '**')]
+    # 證明聯大小的白底圖像，左右各一個 QR Code
+    page = np.full((1400, 800), 255, np.uint8)
+    page[900:1200, 60:360] = codes[0]
+    page[900:1200, 440:740] = codes[1]
+    content = cv2.imencode('.png', page)[1].tobytes()
+    blank = cv2.imencode('.png', np.full((1400, 800), 255, np.uint8))[1].tobytes()
+
+    result = decode_einvoice(content)
+    print(f"解碼結果: {result and {k: result[k] for k in ('invoice_number', 'date', 'total_amount')}}")
+    if result is None:
+        print("無法解碼合成的證明聯")
+        sys.exit(1)
+    hit = min(_time_per_doc(decode_einvoice, [content], repeat) for _ in range(3))
+    miss = min(_time_per_doc(decode_einvoice, [blank], repeat) for _ in range(3))
+    print(f"電子發票解碼:            {hit * 1e3:.1f} ms")
+    print(f"非電子發票（多花的時間）: {miss * 1e3:.1f} ms")
+    return {"hit": hit, "miss": miss}
+
+def benchmark_vision_client(repeat=20, setup_cost=0.05, real=False):
+    """每次請求新建 Vision client 與共用 client 的耗時比較
+
+    real=True 時使用真正的 ImageAnnotatorClient（需要憑證），
+    否則以 StubVisionClient 模擬建立通道的成本。
+    """
+    import ocr_service
+    from vision_stub import StubVisionClient
+
+    if real:
+        factory = ocr_service.vision.ImageAnnotatorClient
+    else:
+        factory = lambda: StubVisionClient(setup_cost=setup_cost)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        factory()
+    per_request = (time.perf_counter() - start) / repeat
+
+    ocr_service.set_vision_client(None if real else factory())
+    ocr_service.get_vision_client()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        ocr_service.get_vision_client()
+    shared = (time.perf_counter() - start) / repeat
+    ocr_service.set_vision_client(None)
+
+    print(f"每次新建 client: {per_request * 1e3:.2f} ms/請求")
+    print(f"共用 client:     {shared * 1e3:.4f} ms/請求")
+    print(f"每次請求節省:    {(per_request - shared) * 1e3:.2f} ms")
+    return {"per_request": per_request, "shared": shared}
+
+def benchmark_batch(files=64, latency=0.2):
+    """逐張 detect_text 與 detect_batch 的總耗時比較（使用 StubVisionClient，快取停用）"""
+    import ocr_cache
+    import ocr_service
+    from vision_stub import StubVisionClient
+
+    ocr_cache.OCR_CACHE_ENABLED = False
+    stub = StubVisionClient(text="統一發票", latency=latency)
+    ocr_service.set_vision_client(stub)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            for i in range(files):
+                path = os.path.join(tmp_dir, f"receipt_{i}.png")
+                with open(path, 'wb') as f:
+                    f.write(os.urandom(1024))
+                paths.append(path)
+
+            start = time.perf_counter()
+            for path in paths:
+                ocr_service.detect_text(path)
+            sequential = time.perf_counter() - start
+
+            stub.calls = 0
+            start = time.perf_counter()
+            ocr_service.detect_batch(paths, 'text')
+            batched = time.perf_counter() - start
+    finally:
+        ocr_service.set_vision_client(None)
+
+    print(f"文件數: {files}，模擬每次 API 延遲: {latency * 1e3:.0f} ms")
+    print(f"逐張呼叫: {sequential:.2f} s（{files / sequential:.1f} 份/秒）")
+    print(f"批次呼叫: {batched:.2f} s（{files / batched:.1f} 份/秒，{stub.calls} 次 API 呼叫）")
+    return {"sequential": sequential, "batch": batched}
+
+def benchmark_preprocess(image_path, repeat=3):
+    """所有預處理方法：逐一執行與進程池平行執行的耗時比較"""
+    from image_processor import run_all_preprocessing
+
+    # 先執行一次，讓進程池啟動的成本不計入
+    run_all_preprocessing(image_path, parallel=True)
+
+    timings = {}
+    for label, parallel in (("sequential", False), ("parallel", True)):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run_all_preprocessing(image_path, parallel=parallel)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[label] = best
+
+    print(f"逐一執行: {timings['sequential'] * 1e3:.0f} ms")
+    print(f"平行執行: {timings['parallel'] * 1e3:.0f} ms")
+    return timings
+
+def benchmark_pipelines(image_path, specs):
+    """依序執行多條流水線，列出各階段耗時與共用前綴的快取命中"""
+    import cv2
+    from image_processor import pipeline_cache, run_pipeline
+
+    image = cv2.imread(image_path)
+    if image is None:
+        print(f"無法讀取圖像: {image_path}")
+        return None
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    pipeline_cache.clear()
+
+    totals = {}
+    for spec in specs:
+        timings = []
+        start = time.perf_counter()
+        run_pipeline(gray, spec, timings=timings)
+        totals[spec] = time.perf_counter() - start
+        stages = '  '.join(
+            f"{t['stage']}=快取" if t['cached'] else f"{t['stage']}={t['seconds'] * 1e3:.0f}ms"
+            for t in timings)
+        print(f"{spec}: {totals[spec] * 1e3:.0f} ms  [{stages}]")
+
+    uncached = {}
+    for spec in specs:
+        start = time.perf_counter()
+        run_pipeline(gray, spec, cache=None)
+        uncached[spec] = time.perf_counter() - start
+    print(f"合計（共用前綴快取）: {sum(totals.values()) * 1e3:.0f} ms")
+    print(f"合計（不快取）:       {sum(uncached.values()) * 1e3:.0f} ms")
+    return {"cached": totals, "uncached": uncached}
+
+def benchmark_correction(repeat=200, budget_ms=1.0):
+    """字元修正模型的載入與每份發票的修正耗時，超過預算時以非零狀態結束"""
+    from correction_model import CorrectionModel, train_correction_model
+
+    texts = load_ocr_corpus()
+    if not texts:
+        print("ocr_results/ 中沒有 OCR 結果可供測試")
+        return None
+    results = [InvoiceParser(text).extract_all() for text in texts]
+
+    # 以常見的誤認（O→0、S→5、I→1、B→8）合成修正記錄
+    confusions = str.maketrans("0518", "OSIB")
+    corrections = []
+    for i in range(500):
+        number = f"{i * 7919 % 100000000:08d}"
+        for field, value in (("invoice_number", "AB" + number), ("seller_tax_id", number)):
+            corrections.append({
+                "field_name": field,
+                "original_value": value.translate(confusions),
+                "corrected_value": value
+            })
+    model = train_correction_model(corrections)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "correction_model.json")
+        model.save(path)
+        start = time.perf_counter()
+        CorrectionModel.load(path)
+        load_time = time.perf_counter() - start
+
+    def correct(result):
+        model.correct(dict(result))
+
+    per_invoice = min(_time_per_doc(correct, results, repeat) for _ in range(3))
+
+    print(f"替換規則: {model.substitutions}")
+    print(f"載入模型: {load_time * 1e3:.2f} ms")
+    print(f"每份發票修正: {per_invoice * 1e6:.1f} µs（預算 {budget_ms:.1f} ms）")
+    if per_invoice * 1e3 > budget_ms:
+        print("超過延遲預算")
+        sys.exit(1)
+    return {"load": load_time, "per_invoice": per_invoice}
+
+def benchmark_import_time(module="app", budget_ms=1500.0, top=10):
+    """以 python -X importtime 測量模組的導入時間，超過預算時以非零狀態結束
+
+    同時列出導入時間最長的模組，方便找出被意外提前導入的重型依賴。
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        sys.exit(proc.returncode)
+
+    # 每行格式：import time: self [us] | cumulative | imported package
+    timings = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings.append((name.rstrip(), int(cumulative)))
+
+    total = next((us for name, us in timings if name.strip() == module), 0) / 1000
+    print(f"import {module}: {total:.0f} ms（預算 {budget_ms:.0f} ms）")
+    for name, us in sorted(timings, key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {us / 1000:8.1f} ms  {name.strip()}")
+    if total > budget_ms:
+        print("超過導入時間預算")
+        sys.exit(1)
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="AccountingFirm 效能基準測試")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_cmd = subparsers.add_parser("parser", help="發票解析器")
+    parser_cmd.add_argument("--repeat", type=int, default=50)
+    parser_cmd.add_argument("--pages", type=int, default=1, help="模擬多頁文件的頁數")
+
+    layout_cmd = subparsers.add_parser("layout", help="版面解析器")
+    layout_cmd.add_argument("--repeat", type=int, default=50)
+
+    table_cmd = subparsers.add_parser("table", help="品項表格重建")
+    table_cmd.add_argument("--rows", type=int, default=200)
+    table_cmd.add_argument("--budget-ms", type=float, default=20.0)
+
+    einvoice_cmd = subparsers.add_parser("einvoice", help="電子發票 QR Code 快速路徑")
+    einvoice_cmd.add_argument("--repeat", type=int, default=10)
+
+    client_cmd = subparsers.add_parser("vision-client", help="Vision client 共用")
+    client_cmd.add_argument("--repeat", type=int, default=20)
+    client_cmd.add_argument("--setup-cost", type=float, default=0.05, help="stub 模擬的建立耗時（秒）")
+    client_cmd.add_argument("--real", action="store_true", help="使用真正的 Vision client")
+
+    batch_cmd = subparsers.add_parser("batch", help="批次 OCR")
+    batch_cmd.add_argument("--files", type=int, default=64)
+    batch_cmd.add_argument("--latency", type=float, default=0.2, help="stub 模擬的 API 延遲（秒）")
+
+    preprocess_cmd = subparsers.add_parser("preprocess", help="所有預處理方法")
+    preprocess_cmd.add_argument("image")
+    preprocess_cmd.add_argument("--repeat", type=int, default=3)
+
+    pipelines_cmd = subparsers.add_parser("pipelines", help="預處理流水線")
+    pipelines_cmd.add_argument("image")
+    pipelines_cmd.add_argument("specs", nargs="+", help='例如 "perspective|deskew|clahe|adaptive"')
+
+    correction_cmd = subparsers.add_parser("correction", help="字元修正模型")
+    correction_cmd.add_argument("--repeat", type=int, default=200)
+    correction_cmd.add_argument("--budget-ms", type=float, default=1.0, help="每份發票的延遲預算")
+
+    import_cmd = subparsers.add_parser("import-time", help="模組導入時間")
+    import_cmd.add_argument("--module", default="app")
+    import_cmd.add_argument("--budget-ms", type=float, default=1500.0)
+
+    args = parser.parse_args()
+    if args.command == "parser":
+        benchmark_parser(args.repeat, args.pages)
+    elif args.command == "layout":
+        benchmark_layout(args.repeat)
+    elif args.command == "table":
+        benchmark_table(args.rows, budget_ms=args.budget_ms)
+    elif args.command == "einvoice":
+        benchmark_einvoice(args.repeat)
+    elif args.command == "vision-client":
+        benchmark_vision_client(args.repeat, args.setup_cost, args.real)
+    elif args.command == "batch":
+        benchmark_batch(args.files, args.latency)
+    elif args.command == "preprocess":
+        benchmark_preprocess(args.image, args.repeat)
+    elif args.command == "pipelines":
+        benchmark_pipelines(args.image, args.specs)
+    elif args.command == "correction":
+        benchmark_correction(args.repeat, args.budget_ms)
+    elif args.command == "import-time":
+        benchmark_import_time(args.module, args.budget_ms)
+
+if __name__ == "__main__":
+    main()
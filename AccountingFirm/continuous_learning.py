@@ -4,13 +4,16 @@ import json
 import os
 from datetime import datetime
 
-def collect_feedback_data(original_result, corrected_result, image_path):
+from feedback_store import get_feedback_store
+
+def collect_feedback_data(original_result, corrected_result, image_path, preprocessing_method=None):
     """收集用戶反饋數據
     
     Args:
         original_result: OCR原始識別結果
         corrected_result: 用戶修正後的結果
         image_path: 原始圖像路徑
+        preprocessing_method: 該次辨識使用的預處理方法，用於分組統計
     """
     feedback_dir = "feedback_data"
     os.makedirs(feedback_dir, exist_ok=True)
@@ -21,6 +24,7 @@ def collect_feedback_data(original_result, corrected_result, image_path):
         "image_path": image_path,
         "original_result": original_result,
         "corrected_result": corrected_result,
+        "preprocessing_method": preprocessing_method,
         "fields_corrected": []
     }
     
@@ -57,51 +61,37 @@ def collect_feedback_data(original_result, corrected_result, image_path):
             print("📝 系統表現低於歷史平均，將加強學習")
     print("==================\n")
     
-    # 保存反饋數據
-    feedback_file = os.path.join(
-        feedback_dir, 
-        f"feedback_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    )
+    # 保存反饋數據（加上微秒，避免同一秒內的反饋互相覆蓋）
+    feedback_name = f"feedback_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.json"
+    feedback_file = os.path.join(feedback_dir, feedback_name)
     with open(feedback_file, 'w', encoding='utf-8') as f:
         json.dump(feedback, f, ensure_ascii=False, indent=2)
     
+    # 寫入反饋資料庫並更新統計
+    get_feedback_store(feedback_dir).add(feedback, source_file=feedback_name)
+    
     return feedback_file
 
 def get_historical_accuracy(feedback_dir):
     """計算歷史平均準確率"""
     if not os.path.exists(feedback_dir):
         return None
-        
-    feedback_files = [f for f in os.listdir(feedback_dir) if f.endswith('.json')]
-    if not feedback_files:
-        return None
     
-    total_accuracy = 0
-    file_count = 0
-    
-    for file in feedback_files:
-        try:
-            with open(os.path.join(feedback_dir, file), 'r', encoding='utf-8') as f:
-                feedback = json.load(f)
-                total_fields = len(feedback["corrected_result"])
-                corrected_fields = len(feedback["fields_corrected"])
-                if total_fields > 0:
-                    accuracy = ((total_fields - corrected_fields) / total_fields) * 100
-                    total_accuracy += accuracy
-                    file_count += 1
-        except:
-            continue
-    
-    return total_accuracy / file_count if file_count > 0 else None
+    return get_feedback_store(feedback_dir).historical_accuracy()
 
 def retrain_model_with_feedback(feedback_dir="feedback_data", min_samples=50):
     """使用反饋數據重新訓練模型"""
     # 檢查是否有足夠的新反饋數據
-    feedback_files = [f for f in os.listdir(feedback_dir) if f.endswith('.json')]
-    if len(feedback_files) < min_samples:
+    sample_count = get_feedback_store(feedback_dir).total_samples()
+    if sample_count < min_samples:
         print(f"反饋數據不足，需要至少 {min_samples} 個樣本才能重新訓練")
         return False
     
+    # 字元混淆修正模型不依賴 TensorFlow，先更新；線上服務會自動載入新模型
+    from correction_model import retrain_correction_model
+    correction_model = retrain_correction_model(feedback_dir)
+    print(f"字元修正模型已更新，共 {sum(len(m) for m in correction_model.substitutions.values())} 條替換規則")
+    
     try:
         # 嘗試導入模型訓練模塊
         from model_training import train_model, TENSORFLOW_AVAILABLE, SKLEARN_AVAILABLE
@@ -115,38 +105,33 @@ def retrain_model_with_feedback(feedback_dir="feedback_data", min_samples=50):
         success = train_model(feedback_dir)
         
         if success:
-            print(f"已使用 {len(feedback_files)} 個反饋樣本重新訓練模型")
+            print(f"已使用 {sample_count} 個反饋樣本重新訓練模型")
         
         return success
     except ImportError:
         print("無法導入模型訓練模塊。請確保所有依賴項已安裝。")
         return False
 
-def analyze_error_patterns(feedback_dir="feedback_data"):
+def analyze_error_patterns(feedback_dir="feedback_data", days=None):
     """分析錯誤模式，找出系統的弱點
     
     Args:
         feedback_dir: 反饋數據目錄
+        days: 只分析最近幾天的反饋，None 時分析全部
     """
-    # 加載所有反饋數據
-    feedback_files = [f for f in os.listdir(feedback_dir) if f.endswith('.json')]
-    if not feedback_files:
+    # 統計數據在寫入反饋時已更新，不需掃描所有反饋文件
+    store = get_feedback_store(feedback_dir)
+    window = None
+    if days:
+        window = store.window_stats(days)
+        total_samples = window["samples"]
+        field_error_counts = window["field_errors"]
+    else:
+        total_samples = store.total_samples()
+        field_error_counts = store.field_error_counts()
+    if not total_samples:
         return {"message": "沒有反饋數據可分析"}
     
-    # 統計各字段的錯誤頻率
-    field_error_counts = {}
-    total_samples = len(feedback_files)
-    
-    for file in feedback_files:
-        with open(os.path.join(feedback_dir, file), 'r', encoding='utf-8') as f:
-            feedback = json.load(f)
-            
-        for correction in feedback.get("fields_corrected", []):
-            field_name = correction["field_name"]
-            if field_name not in field_error_counts:
-                field_error_counts[field_name] = 0
-            field_error_counts[field_name] += 1
-    
     # 計算錯誤率
     error_rates = {
         field: count / total_samples * 100 
@@ -160,11 +145,17 @@ def analyze_error_patterns(feedback_dir="feedback_data"):
         reverse=True
     )
     
+    # 分組統計固定使用視窗，未指定天數時取最近 30 天
+    window = window or store.window_stats(30)
+    
     return {
         "total_samples": total_samples,
         "error_patterns": sorted_error_rates,
         "recommendations": [
             f"優先改進 '{field}' 字段的識別，錯誤率 {rate:.1f}%" 
             for field, rate in sorted_error_rates[:3]
-        ]
+        ],
+        "by_tax_type": window["by_tax_type"],
+        "by_preprocessing": window["by_preprocessing"],
+        "daily": window["daily"]
     } 
\ No newline at end of file
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""OCR 後的字元混淆修正模型
+
+從反饋中的 fields_corrected 學習各欄位常見的字元誤認（例如 O→0、S→5），
+以字元對照表在解析後直接修正，不需要載入 TensorFlow。
+只修正有固定格式、能驗證修正結果的欄位；買受人、地址等自由文字不會被改寫。
+"""
+
+import difflib
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+from invoice_parser import tax_id_checksum_valid
+
+CORRECTION_MODEL_PATH = os.getenv("CORRECTION_MODEL_PATH", os.path.join("models", "correction_model.json"))
+# 至少出現幾次、且佔該字元出現次數多少比例，才會套用
+MIN_SUPPORT = 2
+MIN_PROBABILITY = 0.6
+# 檢查模型文件是否更新的間隔（秒）
+RELOAD_INTERVAL = 5.0
+
+# 可修正的欄位與其格式檢查：只有原值不符合、修正後符合時才套用
+# 解析器輸出的統一編號一定是 8 位數字，因此以檢查碼判斷（例如 8→3 的誤認）
+FIELD_FORMATS = {
+    "invoice_number": re.compile(r"^[A-Z]{2}-?\d{8}$").match,
+    "seller_tax_id": tax_id_checksum_valid,
+}
+
+class CorrectionModel:
+    """各欄位的字元替換表
+
+    Args:
+        substitutions: {field: {誤認字元: 正確字元}}
+    """
+
+    def __init__(self, substitutions=None, trained_at=None, samples=0):
+        self.substitutions = substitutions or {}
+        self.trained_at = trained_at
+        self.samples = samples
+        self._tables = {
+            field: str.maketrans(mapping)
+            for field, mapping in self.substitutions.items()
+            if mapping and field in FIELD_FORMATS
+        }
+
+    def correct(self, result):
+        """修正 InvoiceParser.extract_all 的結果（原地修改）
+
+        Returns:
+            套用的修正列表，同時記錄在 result["auto_corrections"]
+        """
+        applied = []
+        for field, table in self._tables.items():
+            value = result.get(field)
+            if not isinstance(value, str) or not value:
+                continue
+            corrected = value.translate(table)
+            if corrected == value:
+                continue
+            is_valid = FIELD_FORMATS[field]
+            if is_valid(value) or not is_valid(corrected):
+                continue
+            result[field] = corrected
+            applied.append({"field_name": field, "original_value": value, "corrected_value": corrected})
+        result["auto_corrections"] = applied
+        return applied
+
+    def to_dict(self):
+        return {"substitutions": self.substitutions, "trained_at": self.trained_at, "samples": self.samples}
+
+    def save(self, path=CORRECTION_MODEL_PATH):
+        """保存模型；先寫入暫存檔再替換，讀取端不會讀到寫一半的文件"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=CORRECTION_MODEL_PATH):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get("substitutions"), data.get("trained_at"), data.get("samples", 0))
+
+def train_correction_model(corrections, min_support=MIN_SUPPORT, min_probability=MIN_PROBABILITY):
+    """從修正記錄學習字元替換表
+
+    Args:
+        corrections: 可迭代的 fields_corrected 項目
+            （包含 field_name、original_value、corrected_value）
+    """
+    seen = defaultdict(lambda: defaultdict(int))
+    pairs = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+    samples = 0
+
+    for correction in corrections:
+        original = correction.get("original_value")
+        corrected = correction.get("corrected_value")
+        if not isinstance(original, str) or not isinstance(corrected, str) or not original or not corrected:
+            continue
+        field = correction["field_name"]
+        if field not in FIELD_FORMATS:
+            continue
+        samples += 1
+        for char in original:
+            seen[field][char] += 1
+        # 只採用等長的替換片段，逐字元對應
+        matcher = difflib.SequenceMatcher(None, original, corrected, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'replace' and i2 - i1 == j2 - j1:
+                for wrong, right in zip(original[i1:i2], corrected[j1:j2]):
+                    pairs[field][wrong][right] += 1
+
+    substitutions = {}
+    for field, wrongs in pairs.items():
+        mapping = {}
+        for wrong, rights in wrongs.items():
+            right, count = max(rights.items(), key=lambda item: item[1])
+            if count >= min_support and count / seen[field][wrong] >= min_probability:
+                mapping[wrong] = right
+        if mapping:
+            substitutions[field] = mapping
+
+    return CorrectionModel(substitutions, time.time(), samples)
+
+def retrain_correction_model(feedback_dir="feedback_data", path=CORRECTION_MODEL_PATH):
+    """以反饋資料庫中的所有修正重新訓練並保存模型"""
+    from feedback_store import get_feedback_store
+
+    store = get_feedback_store(feedback_dir)
+    corrections = (
+        correction
+        for _, feedback in store.iter_feedback()
+        for correction in feedback.get("fields_corrected", [])
+    )
+    model = train_correction_model(corrections)
+    model.save(path)
+    return model
+
+_model = None
+_model_mtime = None
+_last_check = 0.0
+_model_lock = threading.Lock()
+
+def get_correction_model(path=CORRECTION_MODEL_PATH):
+    """取得目前的修正模型；模型文件更新後會自動重新載入，沒有模型時返回空模型"""
+    global _model, _model_mtime, _last_check
+    now = time.monotonic()
+    if _model is not None and now - _last_check < RELOAD_INTERVAL:
+        return _model
+
+    with _model_lock:
+        _last_check = now
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+        if _model is None or mtime != _model_mtime:
+            try:
+                _model = CorrectionModel.load(path) if mtime is not None else CorrectionModel()
+            except (OSError, ValueError) as e:
+                print(f"無法載入修正模型: {str(e)}")
+                _model = _model or CorrectionModel()
+            _model_mtime = mtime
+    return _model
+
+def apply_corrections(result):
+    """以目前的修正模型修正解析結果"""
+    return get_correction_model().correct(result)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""電子發票證明聯的 QR Code 解碼
+
+證明聯左側 QR Code 依財政部「電子發票證明聯一維及二維條碼規格」記載
+發票號碼、日期、隨機碼、金額、買賣方統編與品項；右側 QR Code 以 ** 開頭，接續放不下的品項。
+本地解碼成功時可直接得到解析結果，不需要預處理與 OCR。
+"""
+
+import base64
+import os
+import re
+
+from image_processor import CV2_AVAILABLE, decode_image
+
+if CV2_AVAILABLE:
+    import cv2
+
+# 解碼前將圖像縮小到的最長邊，限制非電子發票圖像多花的時間
+QR_MAX_SIDE = int(os.getenv('QR_MAX_SIDE', '1600'))
+
+# 發票號碼(10) 民國日期(7) 隨機碼(4) 銷售額(8 hex) 總計額(8 hex) 買方統編(8) 賣方統編(8) 加密驗證(24)
+LEFT_QR_RE = re.compile(
+    r'^([A-Z]{2}\d{8})(\d{3})(\d{2})(\d{2})(\d{4})([0-9A-Fa-f]{8})([0-9A-Fa-f]{8})(\d{8})(\d{8})(.{24})'
+)
+RIGHT_QR_PREFIX = '**'
+NO_BUYER = '00000000'
+
+# 品項名稱的編碼參數
+ITEM_ENCODINGS = {'0': 'big5', '1': 'utf-8', '2': 'base64'}
+
+PERIODS = {
+    1: "01-02月", 2: "01-02月", 3: "03-04月", 4: "03-04月",
+    5: "05-06月", 6: "05-06月", 7: "07-08月", 8: "07-08月",
+    9: "09-10月", 10: "09-10月", 11: "11-12月", 12: "11-12月"
+}
+
+# 一張圖像中最多解碼的 QR Code 數量（證明聯為左右兩個）
+QR_MAX_CODES = 4
+
+def _mask(image, quad):
+    """將 QR Code（含周圍一點空白）塗白，讓下一次偵測找其他條碼"""
+    center = quad.mean(axis=0)
+    polygon = center + (quad - center) * 1.2
+    cv2.fillConvexPoly(image, polygon.round().astype('int32'), (255, 255, 255))
+
+def _decode_region(detector, image, quad):
+    """解碼單一個偵測到的 QR Code；直接解碼失敗時裁切該區域後重新偵測"""
+    try:
+        text, _ = detector.decode(image, quad)
+    except cv2.error:
+        text = ''
+    if text:
+        return text
+    height, width = image.shape[:2]
+    margin = int(max(quad[:, 0].max() - quad[:, 0].min(), quad[:, 1].max() - quad[:, 1].min()) * 0.2)
+    x0, y0 = max(int(quad[:, 0].min()) - margin, 0), max(int(quad[:, 1].min()) - margin, 0)
+    x1, y1 = min(int(quad[:, 0].max()) + margin, width), min(int(quad[:, 1].max()) + margin, height)
+    text, _, _ = detector.detectAndDecode(image[y0:y1, x0:x1])
+    return text
+
+def decode_qr_codes(image):
+    """以 OpenCV 解碼圖像中所有的 QR Code，返回解碼成功的字串列表
+
+    證明聯左右兩個 QR Code 並排時，detectAndDecodeMulti 常只找到右側的 ** 條碼。
+    因此每找到一個條碼就將它塗白，再對整張圖像偵測一次，直到找不到新的條碼。
+    """
+    if not CV2_AVAILABLE:
+        return []
+    height, width = image.shape[:2]
+    scale = QR_MAX_SIDE / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    detector = cv2.QRCodeDetector()
+    texts = []
+
+    def add(text, quad):
+        if not text:
+            text = _decode_region(detector, image, quad)
+        if text and text not in texts:
+            texts.append(text)
+
+    ok, decoded, points, _ = detector.detectAndDecodeMulti(image)
+    quads = [quad.reshape(4, 2).astype('float32') for quad in points] if points is not None else []
+    for text, quad in zip(decoded if ok else [''] * len(quads), quads):
+        add(text, quad)
+
+    masked = image.copy() if quads else image
+    for quad in quads:
+        _mask(masked, quad)
+    while len(quads) < QR_MAX_CODES:
+        text, found, _ = detector.detectAndDecode(masked)
+        if found is None:
+            break
+        quad = found.reshape(4, 2).astype('float32')
+        add(text, quad)
+        quads.append(quad)
+        if masked is image:
+            masked = image.copy()
+        _mask(masked, quad)
+    return texts
+
+def _parse_items(fields):
+    """品項以 名稱:數量:單價 重複排列"""
+    items = []
+    for i in range(0, len(fields) - 2, 3):
+        name, quantity, unit_price = fields[i:i + 3]
+        try:
+            amount = float(quantity) * float(unit_price)
+        except ValueError:
+            break
+        items.append({
+            "name": name.strip(),
+            "quantity": quantity,
+            "unit_price": unit_price,
+            "amount": str(int(amount)) if amount.is_integer() else f"{amount:.2f}",
+            "validated": True
+        })
+    return items
+
+def _decode_item_fields(encoding, item_text):
+    if ITEM_ENCODINGS.get(encoding) == 'base64':
+        try:
+            item_text = base64.b64decode(item_text).decode('utf-8')
+        except (ValueError, UnicodeDecodeError):
+            return []
+    return item_text.split(':')
+
+def parse_einvoice_qr(texts):
+    """從 QR Code 字串中找出電子發票左右兩個 QR Code 並解析
+
+    Returns:
+        與 InvoiceParser.extract_all 相同格式的結果，不是電子發票時返回 None
+    """
+    left = next((text for text in texts if LEFT_QR_RE.match(text)), None)
+    if left is None:
+        return None
+    right = next((text for text in texts if text.startswith(RIGHT_QR_PREFIX)), '')
+
+    (invoice_number, year, month, day, random_code,
+     sales_hex, total_hex, buyer_tax_id, seller_tax_id, _) = LEFT_QR_RE.match(left).groups()
+    roc_year, month, day = int(year), int(month), int(day)
+    if not 1 <= month <= 12 or not 1 <= day <= 31:
+        return None
+    sales, total = int(sales_hex, 16), int(total_hex, 16)
+
+    # 加密驗證之後：:營業人自行使用區:QR 內品項數:全部品項數:編碼參數:品項...
+    fields = left[77:].split(':')
+    items = []
+    if len(fields) > 5:
+        item_text = ':'.join(fields[5:])
+        # 右側條碼的內容可能以 : 開頭，接續時不能多出空白欄位
+        rest = right[len(RIGHT_QR_PREFIX):].lstrip(':')
+        if rest:
+            item_text = item_text.rstrip(':') + ':' + rest
+        items = _parse_items(_decode_item_fields(fields[4], item_text))
+
+    result = {
+        "invoice_number": invoice_number,
+        "seller_tax_id": seller_tax_id,
+        "buyer_tax_id": None if buyer_tax_id == NO_BUYER else buyer_tax_id,
+        "invoice_period": f"中華民國{roc_year}年{PERIODS[month]}",
+        "date": f"{roc_year + 1911}/{month:02d}/{day:02d}",
+        "time": None,
+        "address": None,
+        "buyer": None,
+        "items": items,
+        "total_amount": f"{total:.2f}",
+        "tax_type": "應稅" if total > sales else None,
+        "random_code": random_code,
+        "has_stamp": False,
+        "source": "einvoice_qr",
+    }
+    result["confidence"] = {
+        field: 1.0 for field in ("invoice_number", "seller_tax_id", "invoice_period", "date", "total_amount")
+    }
+    if items:
+        result["confidence"]["items"] = 1.0
+    result["overall_confidence"] = 1.0
+    return result
+
+def decode_einvoice(content):
+    """嘗試從圖像位元組解碼電子發票，不是電子發票或無法解碼時返回 None"""
+    if not CV2_AVAILABLE:
+        return None
+    try:
+        image = decode_image(content)
+    except ValueError:
+        return None
+    return parse_einvoice_qr(decode_qr_codes(image))
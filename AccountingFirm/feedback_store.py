@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+# 反饋資料庫保存在反饋目錄中
+FEEDBACK_DB_NAME = "feedback.sqlite3"
+
+class FeedbackStore:
+    """只追加的反饋資料庫，寫入時同步更新統計，查詢不需掃描所有反饋"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS feedback (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                image_path TEXT,
+                total_fields INTEGER NOT NULL,
+                corrected_fields INTEGER NOT NULL,
+                accuracy REAL,
+                source_file TEXT UNIQUE,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS field_corrections (
+                feedback_id INTEGER NOT NULL REFERENCES feedback(id),
+                field_name TEXT NOT NULL,
+                original_value TEXT,
+                corrected_value TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_field_corrections_field ON field_corrections(field_name);
+            CREATE TABLE IF NOT EXISTS field_error_counts (
+                field_name TEXT PRIMARY KEY,
+                count INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS summary (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                samples INTEGER NOT NULL,
+                accuracy_sum REAL NOT NULL,
+                accuracy_count INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO summary (id, samples, accuracy_sum, accuracy_count) VALUES (1, 0, 0, 0);
+            CREATE TABLE IF NOT EXISTS daily_summary (
+                day TEXT PRIMARY KEY,
+                samples INTEGER NOT NULL,
+                accuracy_sum REAL NOT NULL,
+                accuracy_count INTEGER NOT NULL,
+                corrected_fields INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS daily_field_errors (
+                day TEXT NOT NULL,
+                field_name TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (day, field_name)
+            );
+            CREATE TABLE IF NOT EXISTS daily_group_stats (
+                day TEXT NOT NULL,
+                dimension TEXT NOT NULL,
+                value TEXT NOT NULL,
+                samples INTEGER NOT NULL,
+                corrected_fields INTEGER NOT NULL,
+                PRIMARY KEY (day, dimension, value)
+            );
+        """)
+        self._conn.commit()
+        self._backfill_daily()
+
+    def _backfill_daily(self):
+        # 舊版資料庫沒有每日統計，依既有反饋補算一次
+        with self._lock, self._conn:
+            if self._conn.execute("SELECT 1 FROM daily_summary LIMIT 1").fetchone():
+                return
+            rows = self._conn.execute("SELECT data FROM feedback ORDER BY id").fetchall()
+            for (data,) in rows:
+                feedback = json.loads(data)
+                self._update_daily(feedback, *_accuracy(feedback))
+
+    def _update_daily(self, feedback, total_fields, corrected_fields, accuracy):
+        day = (feedback.get("timestamp") or "")[:10] or date.today().isoformat()
+        self._conn.execute(
+            "INSERT INTO daily_summary (day, samples, accuracy_sum, accuracy_count, corrected_fields) "
+            "VALUES (?, 1, ?, ?, ?) ON CONFLICT(day) DO UPDATE SET samples = samples + 1, "
+            "accuracy_sum = accuracy_sum + excluded.accuracy_sum, "
+            "accuracy_count = accuracy_count + excluded.accuracy_count, "
+            "corrected_fields = corrected_fields + excluded.corrected_fields",
+            (day, accuracy or 0, 1 if accuracy is not None else 0, corrected_fields)
+        )
+        self._conn.executemany(
+            "INSERT INTO daily_field_errors (day, field_name, count) VALUES (?, ?, 1) "
+            "ON CONFLICT(day, field_name) DO UPDATE SET count = count + 1",
+            [(day, c["field_name"]) for c in feedback.get("fields_corrected", [])]
+        )
+        self._conn.executemany(
+            "INSERT INTO daily_group_stats (day, dimension, value, samples, corrected_fields) "
+            "VALUES (?, ?, ?, 1, ?) ON CONFLICT(day, dimension, value) DO UPDATE SET "
+            "samples = samples + 1, corrected_fields = corrected_fields + excluded.corrected_fields",
+            [(day, dimension, value, corrected_fields) for dimension, value in _groups(feedback)]
+        )
+
+    def add(self, feedback, source_file=None):
+        """寫入一筆反饋並更新統計
+
+        Args:
+            feedback: collect_feedback_data 產生的反饋記錄
+            source_file: 對應的 JSON 文件，同一文件只會寫入一次
+
+        Returns:
+            反饋 ID，source_file 已存在時返回 None
+        """
+        total_fields, corrected_fields, accuracy = _accuracy(feedback)
+        corrections = feedback.get("fields_corrected", [])
+
+        with self._lock, self._conn:
+            if source_file is not None and self._conn.execute(
+                "SELECT 1 FROM feedback WHERE source_file = ?", (source_file,)
+            ).fetchone():
+                return None
+
+            cursor = self._conn.execute(
+                "INSERT INTO feedback (timestamp, image_path, total_fields, corrected_fields, accuracy, source_file, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (feedback.get("timestamp"), feedback.get("image_path"), total_fields, corrected_fields,
+                 accuracy, source_file, json.dumps(feedback, ensure_ascii=False))
+            )
+            feedback_id = cursor.lastrowid
+
+            self._conn.executemany(
+                "INSERT INTO field_corrections (feedback_id, field_name, original_value, corrected_value) "
+                "VALUES (?, ?, ?, ?)",
+                [(feedback_id, c["field_name"],
+                  json.dumps(c.get("original_value"), ensure_ascii=False),
+                  json.dumps(c.get("corrected_value"), ensure_ascii=False)) for c in corrections]
+            )
+            self._conn.executemany(
+                "INSERT INTO field_error_counts (field_name, count) VALUES (?, 1) "
+                "ON CONFLICT(field_name) DO UPDATE SET count = count + 1",
+                [(c["field_name"],) for c in corrections]
+            )
+            self._conn.execute(
+                "UPDATE summary SET samples = samples + 1, accuracy_sum = accuracy_sum + ?, "
+                "accuracy_count = accuracy_count + ? WHERE id = 1",
+                (accuracy or 0, 1 if accuracy is not None else 0)
+            )
+            self._update_daily(feedback, total_fields, corrected_fields, accuracy)
+        return feedback_id
+
+    def window_stats(self, days):
+        """最近 days 天（含今天）的統計，只讀取每日彙總，與反饋數量無關
+
+        Returns:
+            dict，包含 samples、accuracy、field_errors、by_tax_type、by_preprocessing、daily
+        """
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        with self._lock:
+            daily = self._conn.execute(
+                "SELECT day, samples, accuracy_sum, accuracy_count, corrected_fields "
+                "FROM daily_summary WHERE day >= ? ORDER BY day", (since,)
+            ).fetchall()
+            field_errors = self._conn.execute(
+                "SELECT field_name, SUM(count) FROM daily_field_errors WHERE day >= ? GROUP BY field_name",
+                (since,)
+            ).fetchall()
+            groups = self._conn.execute(
+                "SELECT dimension, value, SUM(samples), SUM(corrected_fields) FROM daily_group_stats "
+                "WHERE day >= ? GROUP BY dimension, value", (since,)
+            ).fetchall()
+
+        samples = sum(row[1] for row in daily)
+        accuracy_sum = sum(row[2] for row in daily)
+        accuracy_count = sum(row[3] for row in daily)
+        by_group = {"tax_type": {}, "preprocessing": {}}
+        for dimension, value, group_samples, corrected in groups:
+            by_group.setdefault(dimension, {})[value] = {
+                "samples": group_samples,
+                "corrections_per_sample": corrected / group_samples if group_samples else 0
+            }
+        return {
+            "samples": samples,
+            "accuracy": accuracy_sum / accuracy_count if accuracy_count else None,
+            "field_errors": dict(field_errors),
+            "by_tax_type": by_group["tax_type"],
+            "by_preprocessing": by_group["preprocessing"],
+            "daily": [
+                {
+                    "day": day,
+                    "samples": day_samples,
+                    "accuracy": day_sum / day_count if day_count else None,
+                    "corrected_fields": corrected
+                }
+                for day, day_samples, day_sum, day_count, corrected in daily
+            ]
+        }
+
+    def total_samples(self):
+        with self._lock:
+            return self._conn.execute("SELECT samples FROM summary WHERE id = 1").fetchone()[0]
+
+    def historical_accuracy(self):
+        """歷史平均準確率，沒有資料時返回 None"""
+        with self._lock:
+            accuracy_sum, accuracy_count = self._conn.execute(
+                "SELECT accuracy_sum, accuracy_count FROM summary WHERE id = 1"
+            ).fetchone()
+        return accuracy_sum / accuracy_count if accuracy_count else None
+
+    def field_error_counts(self):
+        """各欄位被修正的次數"""
+        with self._lock:
+            rows = self._conn.execute("SELECT field_name, count FROM field_error_counts").fetchall()
+        return dict(rows)
+
+    def version(self):
+        """最新一筆反饋的 ID，反饋內容有變動時才會改變"""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM feedback").fetchone()[0]
+
+    def iter_feedback(self, after_id=0, batch_size=500):
+        """依寫入順序分批讀取反饋，產生 (id, feedback)"""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, data FROM feedback WHERE id > ? ORDER BY id LIMIT ?",
+                    (after_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for feedback_id, data in rows:
+                yield feedback_id, json.loads(data)
+            after_id = rows[-1][0]
+
+def _accuracy(feedback):
+    # 返回 (總欄位數, 修正欄位數, 準確率)，沒有欄位時準確率為 None
+    total_fields = len(feedback.get("corrected_result") or {})
+    corrected_fields = len(feedback.get("fields_corrected", []))
+    accuracy = ((total_fields - corrected_fields) / total_fields) * 100 if total_fields > 0 else None
+    return total_fields, corrected_fields, accuracy
+
+def _groups(feedback):
+    # 分組統計的維度：原始辨識的稅別、使用的預處理方法
+    original = feedback.get("original_result") or {}
+    return [
+        ("tax_type", str(original.get("tax_type") or "unknown")),
+        ("preprocessing", str(feedback.get("preprocessing_method") or "unknown")),
+    ]
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_feedback_store(feedback_dir="feedback_data"):
+    """取得反饋目錄對應的共用 FeedbackStore
+
+    資料庫第一次建立時會自動匯入目錄中既有的 feedback_*.json。
+    """
+    store = _stores.get(feedback_dir)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(feedback_dir)
+            if store is None:
+                store = FeedbackStore(os.path.join(feedback_dir, FEEDBACK_DB_NAME))
+                if store.total_samples() == 0:
+                    migrate_feedback_files(feedback_dir, store)
+                _stores[feedback_dir] = store
+    return store
+
+def migrate_feedback_files(feedback_dir, store):
+    """將既有的 feedback_*.json 匯入反饋資料庫，已匯入的文件會略過
+
+    Returns:
+        (匯入數, 略過數, 失敗數)
+    """
+    imported = skipped = failed = 0
+    for name in sorted(os.listdir(feedback_dir)):
+        if not (name.startswith("feedback_") and name.endswith(".json")):
+            continue
+        path = os.path.join(feedback_dir, name)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                feedback = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"無法讀取 {path}: {str(e)}")
+            failed += 1
+            continue
+        if store.add(feedback, source_file=name) is None:
+            skipped += 1
+        else:
+            imported += 1
+    return imported, skipped, failed
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="將 feedback_*.json 匯入反饋資料庫")
+    parser.add_argument("--feedback-dir", default="feedback_data")
+    args = parser.parse_args()
+
+    store = FeedbackStore(os.path.join(args.feedback_dir, FEEDBACK_DB_NAME))
+    imported, skipped, failed = migrate_feedback_files(args.feedback_dir, store)
+    print(f"匯入 {imported} 筆，略過 {skipped} 筆（已存在），失敗 {failed} 筆")
@@ -8,7 +8,29 @@ try:
 except ImportError:
     print("警告: OpenCV (cv2) 未安裝，圖像處理功能將被禁用")
     CV2_AVAILABLE = False
+import hashlib
 import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+import multiprocessing
+from multiprocessing import context as mp_context
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+PREPROCESSING_METHODS = ['adaptive', 'otsu', 'basic', 'deskew', 
+                         'morphological', 'clahe', 'denoise', 
+                         'text_region', 'perspective', 'sharpen']
+
+# 平行預處理使用的進程數（可由 .env 覆寫）
+PREPROCESS_PROCESSES = int(os.getenv('PREPROCESS_PROCESSES', str(min(len(PREPROCESSING_METHODS), os.cpu_count() or 1))))
+
+# 流水線以 | 串接多個方法，例如 "perspective|deskew|clahe|adaptive"
+PIPELINE_SEPARATOR = '|'
+# 流水線中間結果快取的容量上限
+PIPELINE_CACHE_MAX_BYTES = int(os.getenv('PIPELINE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
 
 def preprocess_image(image_path, method='adaptive'):
     """預處理發票圖像以提高 OCR 準確率
@@ -17,7 +39,7 @@ def preprocess_image(image_path, method='adaptive'):
         image_path: 圖像文件路徑
         method: 預處理方法，可選 'adaptive', 'otsu', 'basic', 'deskew', 
                'morphological', 'clahe', 'denoise', 'text_region', 
-               'perspective', 'sharpen'
+               'perspective', 'sharpen'，或以 | 串接的流水線
     
     Returns:
         處理後的圖像路徑
@@ -38,12 +60,148 @@ def preprocess_image(image_path, method='adaptive'):
     # 生成輸出文件名
     filename = os.path.basename(image_path)
     base_name, ext = os.path.splitext(filename)
-    processed_path = os.path.join(output_dir, f"{base_name}_{method}{ext}")
+    processed_path = os.path.join(output_dir, f"{base_name}_{_method_label(method)}{ext}")
     
     # 轉換為灰度圖
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    processed = run_pipeline(gray, method)
+    
+    # 保存處理後的圖像
+    cv2.imwrite(processed_path, processed)
+    
+    return processed_path
+
+def decode_image(content):
+    """將圖像文件的位元組解碼為 BGR 陣列"""
+    image = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("無法解碼圖像")
+    return image
+
+def encode_image(image, ext='.png'):
+    """將圖像陣列編碼為文件位元組"""
+    ok, buffer = cv2.imencode(ext, image)
+    if not ok:
+        raise ValueError(f"無法編碼圖像: {ext}")
+    return buffer.tobytes()
+
+def preprocess_bytes(content, method='adaptive', ext='.png', timings=None):
+    """在記憶體中預處理圖像，不讀寫磁碟
+    
+    Args:
+        content: 圖像文件的位元組
+        method: 預處理方法或流水線，同 preprocess_image
+        ext: 輸出的編碼格式
+        timings: 傳入列表時會附加各階段的耗時
+    
+    Returns:
+        處理後圖像的編碼位元組
+    """
+    if not CV2_AVAILABLE:
+        print("OpenCV 未安裝，返回原始圖像")
+        return content
+    
+    gray = cv2.cvtColor(decode_image(content), cv2.COLOR_BGR2GRAY)
+    return encode_image(run_pipeline(gray, method, timings=timings), ext)
+
+def _method_label(method):
+    # 流水線名稱中的 | 不適合放在文件名中
+    return method.replace(PIPELINE_SEPARATOR, '-')
+
+def parse_pipeline(spec):
+    """將 "a|b|c" 形式的流水線拆成方法列表，並檢查方法是否存在"""
+    stages = [stage.strip() for stage in spec.split(PIPELINE_SEPARATOR) if stage.strip()]
+    if not stages:
+        raise ValueError(f"空的預處理流水線: {spec!r}")
+    for stage in stages:
+        if stage not in PREPROCESSING_METHODS:
+            raise ValueError(f"不支持的預處理方法: {stage}")
+    return stages
+
+class PipelineCache:
+    """流水線中間結果的 LRU 快取，以 (圖像雜湊, 階段前綴) 為鍵，依總位元組數淘汰"""
+
+    def __init__(self, max_bytes=PIPELINE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._items.get(key)
+            if image is not None:
+                self._items.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        if image.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self.size_bytes -= self._items.pop(key).nbytes
+            self._items[key] = image
+            self.size_bytes += image.nbytes
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size_bytes = 0
+
+pipeline_cache = PipelineCache()
+
+def image_key(gray):
+    """圖像內容的雜湊，作為流水線快取鍵的一部分"""
+    digest = hashlib.blake2b(np.ascontiguousarray(gray).data, digest_size=16)
+    digest.update(str(gray.shape).encode())
+    return digest.hexdigest()
+
+def run_pipeline(gray, spec, cache=pipeline_cache, timings=None):
+    """執行單一方法或 "a|b|c" 形式的流水線
+    
+    各階段的中間結果以 (圖像雜湊, 階段前綴) 快取，共用前綴的流水線
+    會從最長的已快取前綴繼續，不需從頭計算。
     
-    # 根據選擇的方法進行處理
+    Args:
+        gray: 灰度圖
+        spec: 方法名稱或流水線
+        cache: PipelineCache，None 時不快取
+        timings: 傳入列表時會附加 {'stage', 'seconds', 'cached'}
+    
+    Returns:
+        處理後的圖像
+    """
+    stages = parse_pipeline(spec)
+    key = image_key(gray) if cache is not None else None
+
+    # 從最長的已快取前綴開始
+    done, current = 0, gray
+    if cache is not None:
+        for i in range(len(stages), 0, -1):
+            cached = cache.get((key, PIPELINE_SEPARATOR.join(stages[:i])))
+            if cached is not None:
+                done, current = i, cached
+                break
+
+    if timings is not None:
+        timings.extend({'stage': stage, 'seconds': 0.0, 'cached': True} for stage in stages[:done])
+
+    for i in range(done, len(stages)):
+        start = time.perf_counter()
+        current = apply_preprocessing(current, stages[i])
+        elapsed = time.perf_counter() - start
+        if cache is not None:
+            cache.put((key, PIPELINE_SEPARATOR.join(stages[:i + 1])), current)
+        if timings is not None:
+            timings.append({'stage': stages[i], 'seconds': elapsed, 'cached': False})
+
+    return current
+
+def apply_preprocessing(gray, method):
+    """對灰度圖執行指定的預處理方法，返回處理後的圖像（不讀寫磁碟）"""
     if method == 'adaptive':
         # 自適應閾值處理
         processed = cv2.adaptiveThreshold(
@@ -94,10 +252,7 @@ def preprocess_image(image_path, method='adaptive'):
     else:
         raise ValueError(f"不支持的預處理方法: {method}")
     
-    # 保存處理後的圖像
-    cv2.imwrite(processed_path, processed)
-    
-    return processed_path
+    return processed
 
 def morphological_processing(image):
     """形態學處理"""
@@ -220,6 +375,22 @@ def deskew(image):
     if not CV2_AVAILABLE:
         return image
     
+    angle = estimate_skew(image)
+    if angle is not None:
+        # 獲取圖像中心
+        (h, w) = image.shape[:2]
+        center = (w // 2, h // 2)
+        
+        # 執行旋轉
+        M = cv2.getRotationMatrix2D(center, angle, 1.0)
+        rotated = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+        return rotated
+    
+    # 如果無法檢測到線條或計算角度，返回原始圖像
+    return image
+
+def estimate_skew(image):
+    """估計圖像的傾斜角度（度），無法檢測時返回 None"""
     # 檢測邊緣
     edges = cv2.Canny(image, 50, 150, apertureSize=3)
     
@@ -242,35 +413,234 @@ def deskew(image):
                 angle = median_angle * 180 / np.pi
             else:
                 angle = (median_angle - np.pi/2) * 180 / np.pi
-            
-            # 獲取圖像中心
-            (h, w) = image.shape[:2]
-            center = (w // 2, h // 2)
-            
-            # 執行旋轉
-            M = cv2.getRotationMatrix2D(center, angle, 1.0)
-            rotated = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-            return rotated
+            return angle
     
-    # 如果無法檢測到線條或計算角度，返回原始圖像
-    return image
+    return None
 
-def try_all_preprocessing(image_path):
-    """嘗試所有預處理方法，返回所有處理後的圖像路徑"""
-    if not CV2_AVAILABLE:
-        print("OpenCV 未安裝，返回原始圖像")
-        return {"original": image_path}
+# 計算品質分數時先縮小圖像，降低成本
+QUALITY_MAX_SIDE = 1000
+
+def image_quality(gray):
+    """以低成本的局部指標評估預處理結果是否適合 OCR
     
-    methods = ['adaptive', 'otsu', 'basic', 'deskew', 
-              'morphological', 'clahe', 'denoise', 
-              'text_region', 'perspective', 'sharpen']
-    results = {}
+    Returns:
+        dict，包含 contrast、sharpness、skew、text_density 及綜合分數 score（0~1）
+    """
+    h, w = gray.shape[:2]
+    scale = QUALITY_MAX_SIDE / max(h, w)
+    small = cv2.resize(gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    
+    # 對比度：灰度標準差
+    contrast = min(float(small.std()) / 128, 1.0)
+    # 清晰度：拉普拉斯變異數
+    sharpness = min(float(cv2.Laplacian(small, cv2.CV_64F).var()) / 1000, 1.0)
+    # 傾斜角度：與水平或垂直方向的偏差
+    angle = abs(estimate_skew(small) or 0.0) % 90
+    skew = min(angle, 90 - angle)
+    # 文字密度：Otsu 二值化後的前景比例，發票約在 5%~25% 之間
+    _, binary = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    text_density = cv2.countNonZero(binary) / binary.size
+    density_score = max(0.0, 1 - abs(text_density - 0.15) / 0.15)
+    
+    score = (0.3 * contrast + 0.3 * sharpness + 0.2 * density_score
+             + 0.2 * max(0.0, 1 - skew / 10))
+    return {
+        "contrast": contrast,
+        "sharpness": sharpness,
+        "skew": skew,
+        "text_density": text_density,
+        "score": score
+    }
+
+def rank_preprocessing(results):
+    """依 image_quality 分數由高到低排序預處理結果
     
+    Args:
+        results: run_all_preprocessing 返回的 {method: PreprocessResult}
+    
+    Returns:
+        [(method, quality)] 列表
+    """
+    ranked = [(method, image_quality(result.image)) for method, result in results.items()]
+    ranked.sort(key=lambda item: item[1]["score"], reverse=True)
+    return ranked
+
+class PreprocessResult:
+    """記憶體中的預處理結果，第一次取用 path 時才寫入磁碟"""
+
+    def __init__(self, method, image, output_path):
+        self.method = method
+        self.image = image
+        self.output_path = output_path
+        self._written = False
+
+    def encode(self, ext='.png'):
+        """返回處理結果的編碼位元組"""
+        return encode_image(self.image, ext)
+
+    @property
+    def path(self):
+        if self.output_path is None:
+            return None
+        if not self._written:
+            os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+            cv2.imwrite(self.output_path, self.image)
+            self._written = True
+        return self.output_path
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+_main_module_lock = threading.Lock()
+
+class _WorkerMainProcess:
+    """啟動子進程時暫時以 preprocess_worker 作為 __main__，子進程不會重新執行 app.py"""
+
+    def start(self):
+        import preprocess_worker
+
+        with _main_module_lock:
+            main_module = sys.modules['__main__']
+            sys.modules['__main__'] = preprocess_worker
+            try:
+                super().start()
+            finally:
+                sys.modules['__main__'] = main_module
+
+class _SpawnWorkerProcess(_WorkerMainProcess, mp_context.SpawnProcess):
+    pass
+
+class _SpawnWorkerContext(mp_context.SpawnContext):
+    Process = _SpawnWorkerProcess
+
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    class _ForkServerWorkerProcess(_WorkerMainProcess, mp_context.ForkServerProcess):
+        pass
+
+    class _ForkServerWorkerContext(mp_context.ForkServerContext):
+        Process = _ForkServerWorkerProcess
+
+def _pool_context():
+    # Flask 是多執行緒的，fork 可能複製到其他執行緒持有中的鎖；改用 forkserver（Windows 上為 spawn）
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return _ForkServerWorkerContext()
+    return _SpawnWorkerContext()
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(max_workers=PREPROCESS_PROCESSES, mp_context=_pool_context())
+    return _process_pool
+
+def _discard_process_pool(pool):
+    """子進程異常結束（例如記憶體不足被終止）後進程池無法再使用，丟棄後下次重新建立"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _attach_shared_memory(name):
+    try:
+        # Python 3.13+：附加到既有區塊時不交給 resource tracker 管理
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def _apply_on_buffer(buffer, shape, dtype, method):
+    gray = np.ndarray(shape, dtype=dtype, buffer=buffer)
+    try:
+        # 複製結果，避免返回共享記憶體的視圖
+        # 子進程各自的快取無法共用，因此不快取
+        return np.array(run_pipeline(gray, method, cache=None)), None
+    except Exception as e:
+        return None, str(e)
+
+def _apply_shared(shm_name, shape, dtype, method):
+    """在子進程中執行：附加共享記憶體中的灰度圖並執行預處理"""
+    shm = _attach_shared_memory(shm_name)
+    try:
+        return _apply_on_buffer(shm.buf, shape, dtype, method)
+    finally:
+        shm.close()
+
+def run_all_preprocessing(image_path=None, methods=None, parallel=True, content=None):
+    """執行多種預處理方法，結果保存在記憶體中
+    
+    圖像只解碼一次；平行模式下灰度圖放在共享記憶體，由進程池中的
+    各個方法直接讀取，不需序列化整張圖像。
+    
+    Args:
+        image_path: 圖像文件路徑，也用於決定結果寫入磁碟時的文件名
+        methods: 預處理方法或流水線的列表，預設為全部單一方法
+        parallel: 是否使用進程池平行執行
+        content: 圖像文件的位元組，提供時不從 image_path 讀取
+    
+    Returns:
+        {method: PreprocessResult}，失敗的方法不會出現在結果中
+    """
+    if not CV2_AVAILABLE:
+        print("OpenCV 未安裝，無法執行預處理")
+        return {}
+    
+    methods = methods or PREPROCESSING_METHODS
+    if content is not None:
+        image = decode_image(content)
+    else:
+        image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError(f"無法讀取圖像: {image_path}")
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    def output_path(method):
+        if image_path is None:
+            return None
+        base_name, ext = os.path.splitext(os.path.basename(image_path))
+        return os.path.join(os.path.dirname(image_path), 'processed', f"{base_name}_{_method_label(method)}{ext}")
+
+    processed = {}
+    if parallel and PREPROCESS_PROCESSES > 1 and len(methods) > 1:
+        shm = shared_memory.SharedMemory(create=True, size=gray.nbytes)
+        pool = _get_process_pool()
+        try:
+            np.ndarray(gray.shape, dtype=gray.dtype, buffer=shm.buf)[:] = gray
+            futures = {
+                method: pool.submit(_apply_shared, shm.name, gray.shape, gray.dtype.str, method)
+                for method in methods
+            }
+            for method, future in futures.items():
+                processed[method] = future.result()
+        except BrokenProcessPool:
+            # 重建進程池供之後的請求使用，這次尚未完成的方法改在本進程依序執行
+            print("預處理進程池已損壞，重新建立並改為依序執行")
+            _discard_process_pool(pool)
+        finally:
+            shm.close()
+            shm.unlink()
+
     for method in methods:
+        if method in processed:
+            continue
         try:
-            processed_path = preprocess_image(image_path, method)
-            results[method] = processed_path
+            processed[method] = (run_pipeline(gray, method), None)
         except Exception as e:
-            print(f"方法 {method} 處理失敗: {e}")
+            processed[method] = (None, str(e))
+
+    results = {}
+    for method, (result, error) in processed.items():
+        if error is not None:
+            print(f"方法 {method} 處理失敗: {error}")
+            continue
+        results[method] = PreprocessResult(method, result, output_path(method))
+    return results
+
+def try_all_preprocessing(image_path, parallel=True):
+    """嘗試所有預處理方法，返回所有處理後的圖像路徑"""
+    if not CV2_AVAILABLE:
+        print("OpenCV 未安裝，返回原始圖像")
+        return {"original": image_path}
     
-    return results 
\ No newline at end of file
+    results = run_all_preprocessing(image_path, parallel=parallel)
+    return {method: result.path for method, result in results.items()}
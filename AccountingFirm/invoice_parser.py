@@ -4,10 +4,394 @@ import re
 import datetime
 import json
 import os
+from collections import namedtuple
+
+try:
+    from re import _parser as _sre_parse
+except ImportError:  # Python 3.10 以前
+    import sre_parse as _sre_parse
+
+# 各欄位使用的正則表達式（依欄位分組，順序即優先順序）
+PATTERN_SOURCES = {
+    # 台灣發票號碼格式（2個英文字母後跟8位數字）
+    "invoice_number": [
+        r'[A-Z]{2}[\d]{8}',
+    ],
+    # 寬鬆匹配
+    "invoice_number_loose": [
+        r'[A-Z]{1,2}[-\s]?[\d]{6,8}',
+    ],
+    # 基於關鍵詞的匹配
+    "invoice_number_keyword": [
+        r'發票號碼[：:]\s*([A-Z0-9]{8})',
+        r'統一發票\s*([A-Z0-9]{8})',
+        r'發票編號[：:]\s*([A-Z0-9]{8})',
+        r'NO[.:]\s*([A-Z0-9]{8})',
+        r'[發票號碼]\s*[:：]?\s*([A-Z0-9]{2,3}[-—]\s*[A-Z0-9]{8})',
+    ],
+    # 統一編號模式
+    "seller_tax_id": [
+        r'統一編號[：:]\s*(\d{8})',
+        r'統編[：:]\s*(\d{8})',
+        r'NO[.:]\s*(\d{8})',
+        r'賣方[：:]\s*(\d{8})',
+        r'商店編號[：:]\s*(\d{8})',
+        r'商號編號[：:]\s*(\d{8})',
+        r'營利事業統一編號[：:]\s*(\d{8})',
+    ],
+    # 沒有標記時，尋找符合格式的8位數字
+    "seller_tax_id_number": [
+        r'\b(\d{8})\b',
+    ],
+    # 多種日期格式模式
+    "date": [
+        # 標準日期格式 YYYY/MM/DD 或 YYYY-MM-DD 或 YYYY.MM.DD
+        r'發票日期[：:]\s*(\d{4}[-/\.年]\s*\d{1,2}[-/\.月]\s*\d{1,2}[日號]?)',
+        r'日期[：:]\s*(\d{4}[-/\.年]\s*\d{1,2}[-/\.月]\s*\d{1,2}[日號]?)',
+        r'Date[：:]\s*(\d{4}[-/\.]\s*\d{1,2}[-/\.]\s*\d{1,2})',
+        # 直接的日期格式（無前綴）
+        r'(\d{4}[-/\.]\d{1,2}[-/\.]\d{1,2})',
+        # 中文日期格式 年月日
+        r'(\d{4}\s*年\s*\d{1,2}\s*月\s*\d{1,2}\s*[日號])',
+        # 民國年日期格式（3位數）
+        r'民國\s*(\d{3})[-/\.年]\s*(\d{1,2})[-/\.月]\s*(\d{1,2})[日號]?',
+        r'中華民國\s*(\d{3})[-/\.年]\s*(\d{1,2})[-/\.月]\s*(\d{1,2})[日號]?',
+        # 民國年日期格式（2位數）
+        r'民國\s*(\d{1,2})[-/\.年]\s*(\d{1,2})[-/\.月]\s*(\d{1,2})[日號]?',
+        r'中華民國\s*(\d{1,2})[-/\.年]\s*(\d{1,2})[-/\.月]\s*(\d{1,2})[日號]?',
+        # 簡寫民國年（無標記）
+        r'(\d{3})[-/\.年]\s*(\d{1,2})[-/\.月]\s*(\d{1,2})[日號]?',
+        r'(\d{2})[-/\.年]\s*(\d{1,2})[-/\.月]\s*(\d{1,2})[日號]?',
+        # 日/月/年格式
+        r'(\d{1,2})[-/\.]\s*(\d{1,2})[-/\.]\s*(\d{4})',
+        # 月/日/年格式
+        r'(\d{1,2})[-/\.]\s*(\d{1,2})[-/\.]\s*(\d{4})',
+    ],
+    # 明確的西元年格式（4位數年份）
+    "date_western": [
+        r'(\d{4})[-/\.](\d{1,2})[-/\.](\d{1,2})',
+        r'(\d{4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*[日號]?',
+    ],
+    # 民國年格式 YYY/MM/DD 或 YY/MM/DD 或 DD/MM/YY
+    "date_taiwan": [
+        r'(\d{1,3})[/\-](\d{1,2})[/\-](\d{1,2})',
+    ],
+    # 排除發票期別的模式
+    "date_exclude": [
+        r'\d{1,2}[-~]\d{1,2}月',
+        r'發票期別',
+        r'期別',
+    ],
+    "invoice_period": [
+        # 完整民國年格式
+        r'中華民國\s*(\d{3})\s*年\s*(\d{1,2})[-~]\d{1,2}月份?',
+        r'民國\s*(\d{3})\s*年\s*(\d{1,2})[-~]\d{1,2}月份?',
+        # 中文數字年份格式
+        r'([一二三四五六七八九十]{2,3})年\s*([一二三四五六七八九十]{1,2})[、]\s*([一二三四五六七八九十]{1,2})月',
+        # 標準格式（如果前面有年份資訊，也要保留）
+        # 開頭的前瞻只是先排除不可能的起點，不影響匹配結果
+        r'(?=[中民發\s\d])(?:中華民國|民國)?\s*(?:(\d{3})\s*年)?\s*(?:發票期別[：:]\s*)?(\d{1,2})[-~](\d{1,2})月',
+        r'(?=[中民期\s\d])(?:中華民國|民國)?\s*(?:(\d{3})\s*年)?\s*(?:期別[：:]\s*)?(\d{1,2})[-~](\d{1,2})月',
+    ],
+    # 單月格式
+    "invoice_period_month": [
+        r'(\d{1,2})月\s*份',
+    ],
+    "address": [
+        r'地址[:：]?\s*(.+?)(?=電話|傳真|統一編號|$)',
+        r'Address[:：]?\s*(.+?)(?=Tel|Fax|$)',
+        r'(?:台|臺|新|桃|苗|彰|南|高|屏|宜|花|東)[^縣市]{0,3}[縣市].{5,30}',
+    ],
+    "buyer": [
+        # 「買受人註記欄」是另一個印刷標籤，不是買受人
+        r'買受人(?!註記欄)[:：]?\s*(.+?)(?=地址|電話|$)',
+        r'Customer[:：]?\s*(.+?)(?=Address|Tel|$)',
+        r'公司名稱[:：]?\s*(.+?)(?=地址|電話|$)',
+    ],
+    "total_amount": [
+        # 現金格式
+        r'現金[：:]?\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+        r'現金[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
+        r'現金收訖[：:]?\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+        r'現金收訖[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
+        # 標準格式
+        r'總計[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+        r'合計[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+        r'總金額[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+        # 純數字格式
+        r'總計[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
+        r'合計[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
+        r'總金額[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
+        r'應付金額[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
+        r'应收金额[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
+        r'座收金额[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
+        # 含有 "元整" 的格式
+        r'總計[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*)\s*元整',
+        r'合計[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*)\s*元整',
+        r'總金額[：:]\s*([\d,]{1,3}(?:,\d{3})*)\s*元整',
+        # 特殊格式（可能沒有冒號）
+        r'總計\s*NT?\$\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+        r'總額\s*NT?\$\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+        r'總計\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
+        r'總額\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
+        # 含稅金額
+        r'含稅總額[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+        r'含稅總額[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
+        # 銷售額相關
+        r'銷售額合計[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+        r'銷售額合計[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
+        r'課稅銷售額[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+        r'課稅銷售額[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
+        # 通用數字格式（優先級最低）
+        r'NT?\$\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+        r'TWD\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+    ],
+    # 排除模式（避免匹配到單品金額）
+    "total_amount_exclude": [
+        r'小計',
+        r'單價',
+        r'折扣',
+        r'税額',
+        r'找零',
+        r'餘額',
+    ],
+    # 金額前的幣別標記，用於判斷金額的上下文
+    "currency_prefix": [
+        r'NT\$',
+    ],
+    # 沒有課稅別關鍵詞時，檢查是否有稅額
+    "tax_amount": [
+        r'稅額[:：]?\s*NT?\$?\s*([\d,]+\.?\d*)',
+    ],
+    # 品名後跟數量、單價和金額
+    # 品名只從空白之後（或上一筆匹配結尾的數字之後）開始嘗試，
+    # 同一串非空白字元中間的起點必定與開頭的結果相同，不需要重複回溯
+    "items": [
+        r'(?:(?<!\S)|(?<=[\d.]))(\S+)\s+(\d+\.?\d*)\s+(\d+\.?\d*)\s+(\d+\.?\d*)',
+        r'(?:(?<!\S)|(?<=[\d.]))(\S+)\s+(\d+\.?\d*)\s+(\d+\.?\d*)',
+    ],
+    "time": [
+        r'時間[：:]\s*(\d{1,2}:\d{2})',
+        r'Time[：:]\s*(\d{1,2}:\d{2})',
+        r'(\d{1,2}:\d{2}:\d{2})',  # HH:MM:SS
+        r'(\d{1,2}時\d{1,2}分)',   # 中文時間格式
+        r'(\d{1,2}[:.]\d{2})\s*(AM|PM|am|pm)?',  # 12小時制
+    ],
+}
+
+# 清理用的正則表達式
+WHITESPACE_RE = re.compile(r'\s+')
+DATE_CHAR_RE = re.compile(r'[年月日號]')
+DATE_SEPARATOR_RE = re.compile(r'[-\.]')
+TABLE_SPLIT_RE = re.compile(r'\s{2,}')
+HMS_RE = re.compile(r'\d{1,2}:\d{2}:\d{2}')
+
+# anchor: 模式開頭必定出現的字面字串；required: 匹配時文字中必定出現的字元
+# slot 為全域唯一的序號，作為每份文件匹配快取的鍵
+PatternEntry = namedtuple('PatternEntry', ['field', 'index', 'regex', 'anchor', 'required', 'slot'])
+
+def _required_chars(items):
+    """走訪語法樹，收集任何匹配都一定包含的字元"""
+    chars = set()
+    for op, av in items:
+        if op == _sre_parse.LITERAL:
+            chars.add(chr(av))
+        elif op == _sre_parse.SUBPATTERN:
+            chars |= _required_chars(av[-1])
+        elif op in (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT) and av[0] >= 1:
+            chars |= _required_chars(av[2])
+        elif op == _sre_parse.ASSERT:
+            chars |= _required_chars(av[1])
+    return chars
+
+def _analyze_pattern(pattern):
+    """從正則表達式的語法樹取得錨點與必要字元"""
+    tree = _sre_parse.parse(pattern)
+    prefix = []
+    for op, av in tree:
+        if op != _sre_parse.LITERAL:
+            break
+        prefix.append(chr(av))
+    return ''.join(prefix) or None, frozenset(_required_chars(tree))
+
+def _compile_patterns(sources):
+    """在模組載入時一次編譯所有模式"""
+    registry = {}
+    slot = 0
+    for field, patterns in sources.items():
+        entries = []
+        for index, pattern in enumerate(patterns):
+            anchor, required = _analyze_pattern(pattern)
+            entries.append(PatternEntry(field, index, re.compile(pattern), anchor, required, slot))
+            slot += 1
+        registry[field] = tuple(entries)
+    return registry
+
+PATTERNS = _compile_patterns(PATTERN_SOURCES)
+
+# 所有錨點合併成一個交替式（較長者優先），整份文字只需掃描一次
+_ANCHORS = sorted(
+    {entry.anchor for entries in PATTERNS.values() for entry in entries if entry.anchor},
+    key=len, reverse=True
+)
+_ANCHOR_SCANNER = re.compile('|'.join(re.escape(anchor) for anchor in _ANCHORS))
+# 較長的錨點命中時，同一位置開頭的較短錨點也一併命中（例如 現金收訖 → 現金）
+_ANCHOR_ALIASES = {
+    anchor: tuple(other for other in _ANCHORS if anchor.startswith(other))
+    for anchor in _ANCHORS
+}
+# 可能從錨點內部開始的其他錨點（例如 統一發票號碼 中的 發票號碼），以 (位移, 錨點) 表示
+_ANCHOR_OVERLAPS = {
+    anchor: tuple(
+        (offset, other)
+        for offset in range(1, len(anchor))
+        for other in _ANCHORS
+        if anchor[offset:].startswith(other) or other.startswith(anchor[offset:])
+    )
+    for anchor in _ANCHORS
+}
+
+def _match_value(match):
+    """與 re.findall 相同的回傳形式"""
+    groups = match.groups(default='')
+    if not groups:
+        return match.group(0)
+    if len(groups) == 1:
+        return groups[0]
+    return groups
+
+class TextScan:
+    """對一份 OCR 文字做單次錨點掃描，並快取各模式的匹配結果"""
+
+    def __init__(self, text):
+        self.text = text
+        positions = {}
+        for match in _ANCHOR_SCANNER.finditer(text):
+            start = match.start()
+            found = match.group()
+            for anchor in _ANCHOR_ALIASES[found]:
+                positions.setdefault(anchor, []).append(start)
+            # 交替式不會重疊匹配，這裡補上從命中範圍內開始的錨點
+            for offset, anchor in _ANCHOR_OVERLAPS[found]:
+                if text.startswith(anchor, start + offset):
+                    positions.setdefault(anchor, []).append(start + offset)
+        for anchor_list in positions.values():
+            anchor_list.sort()
+        self.anchor_positions = positions
+        self.chars = frozenset(text)
+        self._matches = {}
+        self._keyword_ends = {}
+
+    def finditer(self, entry):
+        """回傳模式的所有不重疊匹配（與 regex.finditer 結果相同）"""
+        matches = self._matches.get(entry.slot)
+        if matches is None:
+            anchor = entry.anchor
+            if not entry.required <= self.chars:
+                # 缺少必要字元，這個模式不可能匹配
+                return ()
+            if anchor is None:
+                matches = list(entry.regex.finditer(self.text))
+            elif anchor not in self.anchor_positions:
+                return ()
+            else:
+                # 只在錨點出現的位置嘗試匹配
+                matches = []
+                end = 0
+                match_at = entry.regex.match
+                for position in self.anchor_positions[anchor]:
+                    if position < end:
+                        continue
+                    match = match_at(self.text, position)
+                    if match:
+                        matches.append(match)
+                        end = match.end()
+            self._matches[entry.slot] = matches
+        return matches
+
+    def keyword_before(self, field, position, window):
+        """position 前 window 個字元內是否完整出現某組關鍵字
+
+        關鍵字位置在第一次查詢時建立索引（結尾位置 → 最晚的起點），
+        之後每次查詢只需檢查 window 個位置。
+        """
+        ends = self._keyword_ends.get(field)
+        if ends is None:
+            ends = {}
+            for entry in PATTERNS[field]:
+                for match in self.finditer(entry):
+                    if match.start() > ends.get(match.end(), -1):
+                        ends[match.end()] = match.start()
+            self._keyword_ends[field] = ends
+        if not ends:
+            return False
+        lower = position - window
+        for end in range(max(lower, 0) + 1, position + 1):
+            start = ends.get(end)
+            if start is not None and start >= lower:
+                return True
+        return False
+
+    def findall(self, entry):
+        """與 re.findall 相同的結果"""
+        return [_match_value(match) for match in self.finditer(entry)]
+
+    def search(self, entry):
+        """與 re.search 相同的結果"""
+        matches = self.finditer(entry)
+        return matches[0] if matches else None
+
+    def candidates(self):
+        """列出所有欄位的候選結果：{欄位: [(模式索引, 值, 位置)]}"""
+        result = {}
+        for field, entries in PATTERNS.items():
+            result[field] = [
+                (entry.index, _match_value(match), match.span())
+                for entry in entries
+                for match in self.finditer(entry)
+            ]
+        return result
+
+def parse_number(text):
+    """把 '1,200'、'NT$60' 之類的金額字串轉為數字，無法轉換時返回 None"""
+    try:
+        return float(text.replace(',', '').lstrip('NT$'))
+    except (AttributeError, ValueError):
+        return None
+
+def valid_total_amount(text):
+    """總金額是否在合理範圍內（1 - 1,000,000）"""
+    amount = parse_number(text)
+    return amount is not None and 1 <= amount <= 1000000
+
+TAX_ID_WEIGHTS = (1, 2, 1, 2, 1, 2, 4, 1)
+
+def tax_id_checksum_valid(tax_id):
+    """統一編號檢查碼：各位數乘上權重後取各位數字之和，總和可被 5 整除
+    （第 7 位為 7 時，總和加 1 可被 5 整除亦可）"""
+    if not isinstance(tax_id, str) or len(tax_id) != 8 or not tax_id.isdigit():
+        return False
+    total = 0
+    for digit, weight in zip(tax_id, TAX_ID_WEIGHTS):
+        product = int(digit) * weight
+        total += product // 10 + product % 10
+    return total % 5 == 0 or (tax_id[6] == '7' and (total + 1) % 5 == 0)
+
+def line_item_consistent(quantity, unit_price, amount, tolerance=1.0):
+    """品項的 數量 × 單價 是否約等於金額（容許金額四捨五入到整數元的誤差）"""
+    quantity, unit_price, amount = parse_number(quantity), parse_number(unit_price), parse_number(amount)
+    if quantity is None or unit_price is None or amount is None:
+        return False
+    return abs(quantity * unit_price - amount) <= tolerance
+
+def scan_candidates(text):
+    """單次掃描 OCR 文字，回傳每個欄位帶標記的所有候選結果"""
+    return TextScan(text).candidates()
 
 class InvoiceParser:
     def __init__(self, ocr_text):
         self.text = ocr_text
+        self.scan = TextScan(ocr_text)
         self.result = {
             "invoice_number": None,
             "seller_tax_id": None,  # 新增賣方統一編號欄位
@@ -26,35 +410,25 @@ class InvoiceParser:
     def extract_invoice_number(self):
         """提取發票號碼"""
         # 方法一：直接匹配台灣發票號碼格式（2個英文字母後跟8位數字）
-        pattern = r'[A-Z]{2}[\d]{8}'
-        matches = re.findall(pattern, self.text)
+        matches = self.scan.findall(PATTERNS["invoice_number"][0])
         if matches:
             self.result["invoice_number"] = matches[0]
             self.result["confidence"]["invoice_number"] = 0.95  # 非常高的信心度
             return self
         
         # 方法二：寬鬆匹配
-        pattern = r'[A-Z]{1,2}[-\s]?[\d]{6,8}'
-        matches = re.findall(pattern, self.text)
+        matches = self.scan.findall(PATTERNS["invoice_number_loose"][0])
         if matches:
             self.result["invoice_number"] = matches[0].replace(' ', '').replace('-', '')
             self.result["confidence"]["invoice_number"] = 0.7  # 中等信心度
             return self
         
         # 方法三：基於關鍵詞的匹配（來自新版本）
-        patterns = [
-            r'發票號碼[：:]\s*([A-Z0-9]{8})',
-            r'統一發票\s*([A-Z0-9]{8})',
-            r'發票編號[：:]\s*([A-Z0-9]{8})',
-            r'NO[.:]\s*([A-Z0-9]{8})',
-            r'[發票號碼]\s*[:：]?\s*([A-Z0-9]{2,3}[-—]\s*[A-Z0-9]{8})'
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, self.text)
+        for entry in PATTERNS["invoice_number_keyword"]:
+            matches = self.scan.findall(entry)
             if matches:
                 # 清理空格和特殊字符
-                invoice_number = re.sub(r'\s+', '', matches[0])
+                invoice_number = WHITESPACE_RE.sub('', matches[0])
                 self.result['invoice_number'] = invoice_number
                 self.result["confidence"]["invoice_number"] = 0.85  # 較高信心度
                 return self
@@ -63,20 +437,9 @@ class InvoiceParser:
     
     def extract_seller_tax_id(self):
         """提取賣方統一編號"""
-        # 統一編號模式
-        tax_id_patterns = [
-            r'統一編號[：:]\s*(\d{8})',
-            r'統編[：:]\s*(\d{8})',
-            r'NO[.:]\s*(\d{8})',
-            r'賣方[：:]\s*(\d{8})',
-            r'商店編號[：:]\s*(\d{8})',
-            r'商號編號[：:]\s*(\d{8})',
-            r'營利事業統一編號[：:]\s*(\d{8})'
-        ]
-
         # 首先嘗試明確標記的統一編號
-        for pattern in tax_id_patterns:
-            matches = re.findall(pattern, self.text)
+        for entry in PATTERNS["seller_tax_id"]:
+            matches = self.scan.findall(entry)
             if matches:
                 tax_id = matches[0]
                 if self._validate_tax_id(tax_id):
@@ -86,8 +449,7 @@ class InvoiceParser:
 
         # 如果沒有找到明確標記的統一編號，嘗試尋找符合格式的8位數字
         # 但要避開發票號碼和其他已知的數字欄位
-        number_pattern = r'\b(\d{8})\b'
-        matches = re.findall(number_pattern, self.text)
+        matches = self.scan.findall(PATTERNS["seller_tax_id_number"][0])
         
         for match in matches:
             # 檢查這個數字是否已經被識別為發票號碼
@@ -116,45 +478,6 @@ class InvoiceParser:
     
     def extract_date(self):
         """提取發票日期"""
-        # 多種日期格式模式
-        date_patterns = [
-            # 標準日期格式 YYYY/MM/DD 或 YYYY-MM-DD 或 YYYY.MM.DD
-            r'發票日期[：:]\s*(\d{4}[-/\.年]\s*\d{1,2}[-/\.月]\s*\d{1,2}[日號]?)',
-            r'日期[：:]\s*(\d{4}[-/\.年]\s*\d{1,2}[-/\.月]\s*\d{1,2}[日號]?)',
-            r'Date[：:]\s*(\d{4}[-/\.]\s*\d{1,2}[-/\.]\s*\d{1,2})',
-            
-            # 直接的日期格式（無前綴）
-            r'(\d{4}[-/\.]\d{1,2}[-/\.]\d{1,2})',  # YYYY-MM-DD 或 YYYY/MM/DD 或 YYYY.MM.DD
-            
-            # 中文日期格式 年月日
-            r'(\d{4}\s*年\s*\d{1,2}\s*月\s*\d{1,2}\s*[日號])',
-            
-            # 民國年日期格式（3位數）
-            r'民國\s*(\d{3})[-/\.年]\s*(\d{1,2})[-/\.月]\s*(\d{1,2})[日號]?',
-            r'中華民國\s*(\d{3})[-/\.年]\s*(\d{1,2})[-/\.月]\s*(\d{1,2})[日號]?',
-            
-            # 民國年日期格式（2位數）
-            r'民國\s*(\d{1,2})[-/\.年]\s*(\d{1,2})[-/\.月]\s*(\d{1,2})[日號]?',
-            r'中華民國\s*(\d{1,2})[-/\.年]\s*(\d{1,2})[-/\.月]\s*(\d{1,2})[日號]?',
-            
-            # 簡寫民國年（無標記）
-            r'(\d{3})[-/\.年]\s*(\d{1,2})[-/\.月]\s*(\d{1,2})[日號]?',
-            r'(\d{2})[-/\.年]\s*(\d{1,2})[-/\.月]\s*(\d{1,2})[日號]?',
-            
-            # 日/月/年格式
-            r'(\d{1,2})[-/\.]\s*(\d{1,2})[-/\.]\s*(\d{4})',
-            
-            # 月/日/年格式
-            r'(\d{1,2})[-/\.]\s*(\d{1,2})[-/\.]\s*(\d{4})',
-        ]
-        
-        # 排除發票期別的模式
-        exclude_patterns = [
-            r'\d{1,2}[-~]\d{1,2}月',
-            r'發票期別',
-            r'期別'
-        ]
-        
         # 檢查是否是台灣發票的特徵
         is_taiwan_invoice = any(keyword in self.text for keyword in [
             "統一發票", "發票號碼", "營業人統一編號", "買受人", "銷售額", "課稅別", 
@@ -162,13 +485,8 @@ class InvoiceParser:
         ])
         
         # 首先嘗試提取明確的西元年格式（4位數年份）
-        western_date_patterns = [
-            r'(\d{4})[-/\.](\d{1,2})[-/\.](\d{1,2})',  # YYYY-MM-DD 或 YYYY/MM/DD 或 YYYY.MM.DD
-            r'(\d{4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*[日號]?'  # YYYY年MM月DD日
-        ]
-        
-        for pattern in western_date_patterns:
-            matches = re.findall(pattern, self.text)
+        for entry in PATTERNS["date_western"]:
+            matches = self.scan.findall(entry)
             for match in matches:
                 try:
                     year, month, day = map(int, match)
@@ -176,8 +494,8 @@ class InvoiceParser:
                     # 檢查是否是發票期別
                     date_str = f"{year}/{month}/{day}"
                     is_period = False
-                    for exclude in exclude_patterns:
-                        if re.search(exclude, date_str):
+                    for exclude in PATTERNS["date_exclude"]:
+                        if exclude.regex.search(date_str):
                             is_period = True
                             break
                     
@@ -196,12 +514,8 @@ class InvoiceParser:
         
         # 如果沒有找到明確的西元年格式，且是台灣發票，則嘗試民國年格式
         if is_taiwan_invoice:
-            taiwan_date_patterns = [
-                r'(\d{1,3})[/\-](\d{1,2})[/\-](\d{1,2})',  # YYY/MM/DD 或 YY/MM/DD 或 DD/MM/YY
-            ]
-            
-            for pattern in taiwan_date_patterns:
-                matches = re.findall(pattern, self.text)
+            for entry in PATTERNS["date_taiwan"]:
+                matches = self.scan.findall(entry)
                 for match in matches:
                     try:
                         part1, part2, part3 = map(int, match)
@@ -209,8 +523,8 @@ class InvoiceParser:
                         # 檢查是否是發票期別
                         date_str = f"{part1}/{part2}/{part3}"
                         is_period = False
-                        for exclude in exclude_patterns:
-                            if re.search(exclude, date_str):
+                        for exclude in PATTERNS["date_exclude"]:
+                            if exclude.regex.search(date_str):
                                 is_period = True
                                 break
                         
@@ -292,8 +606,8 @@ class InvoiceParser:
                         pass
         
         # 首先嘗試提取明確標記的日期
-        for pattern in date_patterns:
-            matches = re.findall(pattern, self.text)
+        for entry in PATTERNS["date"]:
+            matches = self.scan.findall(entry)
             if matches:
                 # 處理不同格式的匹配結果
                 if isinstance(matches[0], tuple) and len(matches[0]) == 3:
@@ -303,8 +617,8 @@ class InvoiceParser:
                     # 檢查是否是發票期別而非日期
                     is_period = False
                     date_str = f"{part1}/{part2}/{part3}"
-                    for exclude in exclude_patterns:
-                        if re.search(exclude, date_str):
+                    for exclude in PATTERNS["date_exclude"]:
+                        if exclude.regex.search(date_str):
                             is_period = True
                             break
                     
@@ -368,8 +682,8 @@ class InvoiceParser:
                     
                     # 檢查是否是發票期別而非日期
                     is_period = False
-                    for exclude in exclude_patterns:
-                        if re.search(exclude, date_str):
+                    for exclude in PATTERNS["date_exclude"]:
+                        if exclude.regex.search(date_str):
                             is_period = True
                             break
                     
@@ -377,9 +691,9 @@ class InvoiceParser:
                         # 嘗試標準化日期格式
                         try:
                             # 清理日期字符串
-                            date_str = re.sub(r'[年月日號]', '/', date_str)
-                            date_str = re.sub(r'[-\.]', '/', date_str)
-                            date_str = re.sub(r'\s+', '', date_str)
+                            date_str = DATE_CHAR_RE.sub('/', date_str)
+                            date_str = DATE_SEPARATOR_RE.sub('/', date_str)
+                            date_str = WHITESPACE_RE.sub('', date_str)
                             
                             # 處理不同的日期格式
                             parts = date_str.split('/')
@@ -478,19 +792,6 @@ class InvoiceParser:
     
     def extract_invoice_period_directly(self):
         """直接從文本中提取發票期別"""
-        period_patterns = [
-            # 完整民國年格式
-            r'中華民國\s*(\d{3})\s*年\s*(\d{1,2})[-~]\d{1,2}月份?',
-            r'民國\s*(\d{3})\s*年\s*(\d{1,2})[-~]\d{1,2}月份?',
-            
-            # 中文數字年份格式
-            r'([一二三四五六七八九十]{2,3})年\s*([一二三四五六七八九十]{1,2})[、]\s*([一二三四五六七八九十]{1,2})月',
-            
-            # 標準格式（如果前面有年份資訊，也要保留）
-            r'(?:中華民國|民國)?\s*(?:(\d{3})\s*年)?\s*(?:發票期別[：:]\s*)?(\d{1,2})[-~](\d{1,2})月',
-            r'(?:中華民國|民國)?\s*(?:(\d{3})\s*年)?\s*(?:期別[：:]\s*)?(\d{1,2})[-~](\d{1,2})月',
-        ]
-        
         # 中文數字轉阿拉伯數字的對照表
         cn_number = {
             '一': '1', '二': '2', '三': '3', '四': '4', '五': '5',
@@ -506,8 +807,9 @@ class InvoiceParser:
                     result = result * 10 + int(cn_number[char])
             return result
         
-        for pattern in period_patterns:
-            matches = re.findall(pattern, self.text)
+        for entry in PATTERNS["invoice_period"]:
+            pattern = entry.regex.pattern
+            matches = self.scan.findall(entry)
             if matches:
                 if isinstance(matches[0], tuple):
                     if '年' in pattern:
@@ -568,8 +870,7 @@ class InvoiceParser:
                         pass
         
         # 嘗試匹配單月格式
-        month_pattern = r'(\d{1,2})月\s*份'
-        matches = re.findall(month_pattern, self.text)
+        matches = self.scan.findall(PATTERNS["invoice_period_month"][0])
         if matches:
             month = int(matches[0])
             # 將單月轉換為期別，並嘗試加入年份
@@ -590,14 +891,9 @@ class InvoiceParser:
     def extract_address(self):
         """提取地址"""
         # 尋找地址相關關鍵詞
-        address_patterns = [
-            r'地址[:：]?\s*(.+?)(?=電話|傳真|統一編號|$)',
-            r'Address[:：]?\s*(.+?)(?=Tel|Fax|$)',
-            r'(?:台|臺|新|桃|苗|彰|南|高|屏|宜|花|東)[^縣市]{0,3}[縣市].{5,30}'
-        ]
-        
-        for pattern in address_patterns:
-            matches = re.search(pattern, self.text)
+        for entry in PATTERNS["address"]:
+            pattern = entry.regex.pattern
+            matches = self.scan.search(entry)
             if matches:
                 address = matches.group(1) if '地址' in pattern or 'Address' in pattern else matches.group(0)
                 address = address.strip()
@@ -609,14 +905,8 @@ class InvoiceParser:
     
     def extract_buyer(self):
         """提取買受人"""
-        buyer_patterns = [
-            r'買受人[:：]?\s*(.+?)(?=地址|電話|$)',
-            r'Customer[:：]?\s*(.+?)(?=Address|Tel|$)',
-            r'公司名稱[:：]?\s*(.+?)(?=地址|電話|$)'
-        ]
-        
-        for pattern in buyer_patterns:
-            matches = re.search(pattern, self.text)
+        for entry in PATTERNS["buyer"]:
+            matches = self.scan.search(entry)
             if matches:
                 buyer = matches.group(1).strip()
                 if len(buyer) > 1:  # 避免過短的錯誤匹配
@@ -627,88 +917,20 @@ class InvoiceParser:
     
     def extract_total_amount(self):
         """提取總金額"""
-        # 擴展金額識別模式
-        amount_patterns = [
-            # 現金格式（新增）
-            r'現金[：:]?\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            r'現金[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
-            r'現金收訖[：:]?\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            r'現金收訖[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
-            
-            # 原有的標準格式
-            r'總計[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            r'合計[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            r'總金額[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            
-            # 純數字格式
-            r'總計[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
-            r'合計[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
-            r'總金額[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
-            r'應付金額[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
-            r'应收金额[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
-            r'座收金额[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
-
-            # 含有 "元整" 的格式
-            r'總計[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*)\s*元整',
-            r'合計[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*)\s*元整',
-            r'總金額[：:]\s*([\d,]{1,3}(?:,\d{3})*)\s*元整',
-            
-            # 特殊格式（可能沒有冒號）
-            r'總計\s*NT?\$\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            r'總額\s*NT?\$\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            r'總計\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
-            r'總額\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
-            
-            # 含稅金額
-            r'含稅總額[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            r'含稅總額[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
-            
-            # 銷售額相關
-            r'銷售額合計[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            r'銷售額合計[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
-            r'課稅銷售額[：:]\s*NT?\$?\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            r'課稅銷售額[：:]\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)\s*(?:元|圓|塊)?',
-            
-            # 通用數字格式（優先級最低）
-            r'NT?\$\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            r'TWD\s*([\d,]{1,3}(?:,\d{3})*(?:\.\d{2})?)'
-        ]
-        
-        # 排除模式（避免匹配到單品金額）
-        exclude_patterns = [
-            r'小計',
-            r'單價',
-            r'折扣',
-            r'税額',
-            r'找零',  # 新增，避免匹配到找零金額
-            r'餘額'   # 新增，避免匹配到餘額
-        ]
-        
-        # 驗證金額的合理性
-        def is_valid_amount(amount_str):
-            try:
-                # 移除千位分隔符
-                clean_amount = amount_str.replace(',', '')
-                amount = float(clean_amount)
-                # 設定合理的金額範圍（例如：1-1,000,000）
-                return 1 <= amount <= 1000000
-            except:
-                return False
-        
         # 尋找最可能的總金額
         candidates = []
         
-        for pattern in amount_patterns:
-            matches = re.findall(pattern, self.text)
-            for match in matches:
-                # 檢查是否是排除項
-                should_exclude = False
-                for exclude in exclude_patterns:
-                    if re.search(exclude, self.text[max(0, self.text.find(match)-10):self.text.find(match)]):
-                        should_exclude = True
-                        break
+        for entry in PATTERNS["total_amount"]:
+            pattern = entry.regex.pattern
+            for found in self.scan.finditer(entry):
+                match = found.group(1)
+                # 使用這次匹配的實際位置，而不是金額字串第一次出現的位置
+                position = found.start(1)
                 
-                if not should_exclude and is_valid_amount(match):
+                # 檢查金額前面是否有排除項
+                should_exclude = self.scan.keyword_before("total_amount_exclude", position, 10)
+                
+                if not should_exclude and valid_total_amount(match):
                     # 計算可信度
                     confidence = 0.6  # 基礎可信度
                     
@@ -719,7 +941,7 @@ class InvoiceParser:
                         confidence += 0.2
                     if '元整' in pattern:
                         confidence += 0.1
-                    if 'NT$' in self.text[max(0, self.text.find(match)-5):self.text.find(match)]:
+                    if self.scan.keyword_before("currency_prefix", position, 5):
                         confidence += 0.1
                     # 針對純數字格式的特殊處理
                     elif any(keyword in pattern for keyword in ['總計', '合計', '總金額', '總額', '現金']):
@@ -756,7 +978,7 @@ class InvoiceParser:
                     return self
         
         # 如果沒有明確關鍵詞，檢查是否有稅額
-        if re.search(r'稅額[:：]?\s*NT?\$?\s*([\d,]+\.?\d*)', self.text):
+        if self.scan.search(PATTERNS["tax_amount"][0]):
             self.result["tax_type"] = "應稅"
             self.result["confidence"]["tax_type"] = 0.6
         
@@ -820,7 +1042,7 @@ class InvoiceParser:
                     
                     # 嘗試從行中提取項目信息
                     # 這裡使用一個簡單的啟發式方法，實際情況可能需要更複雜的解析
-                    parts = re.split(r'\s{2,}', line)  # 使用兩個或更多空格分割
+                    parts = TABLE_SPLIT_RE.split(line)  # 使用兩個或更多空格分割
                     
                     if len(parts) >= 2:
                         item = {
@@ -834,14 +1056,13 @@ class InvoiceParser:
         # 如果沒有找到表格結構，嘗試使用正則表達式提取項目
         if not items:
             # 尋找可能的項目模式：品名後跟數量、單價和金額
-            item_patterns = [
-                r'(\S+)\s+(\d+\.?\d*)\s+(\d+\.?\d*)\s+(\d+\.?\d*)',  # 品名 數量 單價 金額
-                r'(\S+)\s+(\d+\.?\d*)\s+(\d+\.?\d*)'  # 品名 數量/單價 金額
-            ]
-            
-            for pattern in item_patterns:
-                matches = re.findall(pattern, self.text)
+            for entry in PATTERNS["items"]:
+                matches = self.scan.findall(entry)
                 if matches:
+                    # 這個模式幾乎會匹配任何一串數字，有 數量 × 單價 ≈ 金額 的列時只保留這些列
+                    if len(matches[0]) == 4:
+                        consistent = [match for match in matches if line_item_consistent(*match[1:])]
+                        matches = consistent or matches
                     for match in matches:
                         if len(match) == 4:
                             item = {
@@ -880,17 +1101,8 @@ class InvoiceParser:
     
     def extract_time(self):
         """提取發票時間（HH:MM）"""
-        # 時間格式模式
-        time_patterns = [
-            r'時間[：:]\s*(\d{1,2}:\d{2})',
-            r'Time[：:]\s*(\d{1,2}:\d{2})',
-            r'(\d{1,2}:\d{2}:\d{2})',  # HH:MM:SS
-            r'(\d{1,2}時\d{1,2}分)',   # 中文時間格式
-            r'(\d{1,2}[:.]\d{2})\s*(AM|PM|am|pm)?'  # 12小時制
-        ]
-        
-        for pattern in time_patterns:
-            matches = re.findall(pattern, self.text)
+        for entry in PATTERNS["time"]:
+            matches = self.scan.findall(entry)
             if matches:
                 time_str = matches[0]
                 
@@ -900,8 +1112,8 @@ class InvoiceParser:
                     am_pm = time_str[1].upper() if len(time_str) > 1 else ""
                     
                     # 轉換中文時間格式
-                    time_part = re.sub(r'時', ':', time_part)
-                    time_part = re.sub(r'分', '', time_part)
+                    time_part = time_part.replace('時', ':')
+                    time_part = time_part.replace('分', '')
                     
                     # 處理12小時制
                     if am_pm:
@@ -920,11 +1132,11 @@ class InvoiceParser:
                 else:
                     # 處理簡單字符串結果
                     # 轉換中文時間格式
-                    time_str = re.sub(r'時', ':', time_str)
-                    time_str = re.sub(r'分', '', time_str)
+                    time_str = time_str.replace('時', ':')
+                    time_str = time_str.replace('分', '')
                     
                     # 如果是 HH:MM:SS 格式，只保留 HH:MM
-                    if re.match(r'\d{1,2}:\d{2}:\d{2}', time_str):
+                    if HMS_RE.match(time_str):
                         time_str = time_str[:5]
                     
                     self.result['time'] = time_str
@@ -958,11 +1170,15 @@ class InvoiceParser:
     
     def save_result(self, output_path=None):
         """保存解析結果到JSON文件"""
-        if output_path is None:
-            os.makedirs('parsing_results', exist_ok=True)
-            output_path = os.path.join('parsing_results', 'invoice_{0}.json'.format(datetime.datetime.now().strftime("%Y%m%d_%H%M%S")))
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(self.result, f, ensure_ascii=False, indent=2)
-        
-        return output_path 
\ No newline at end of file
+        return save_result(self.result, output_path)
+
+def save_result(result, output_path=None):
+    """保存解析結果到JSON文件（也用於不經過 InvoiceParser 的結果，例如電子發票 QR Code）"""
+    if output_path is None:
+        os.makedirs('parsing_results', exist_ok=True)
+        output_path = os.path.join('parsing_results', 'invoice_{0}.json'.format(datetime.datetime.now().strftime("%Y%m%d_%H%M%S")))
+    
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    
+    return output_path
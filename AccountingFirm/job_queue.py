@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# 任務佇列設定（可由 .env 覆寫）
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join("jobs", "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# 執行中的任務每隔 JOB_HEARTBEAT_INTERVAL 秒更新心跳，超過 JOB_STALE_AFTER 秒沒有心跳視為所屬程序已結束
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "60"))
+
+class JobContext:
+    """傳給任務處理函數，用於回報目前階段與各階段耗時"""
+
+    def __init__(self, job_queue, job_id):
+        self.job_queue = job_queue
+        self.job_id = job_id
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        self.job_queue._update(self.job_id, stage=name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+            self.job_queue._update(self.job_id, timings=json.dumps(self.timings))
+
+class JobQueue:
+    """以 SQLite 記錄狀態的本地任務佇列，由執行緒池執行任務
+
+    多個程序可共用同一個資料庫：任務以單一 UPDATE ... RETURNING 原子地領取，
+    並記錄領取的程序 ID 與心跳；只有心跳過期的任務才會被重新排入佇列。
+
+    Args:
+        handler: 任務處理函數 handler(params, job)，返回值會以 JSON 保存為結果
+        path: SQLite 資料庫路徑
+        workers: 工作執行緒數
+    """
+
+    def __init__(self, handler, path=JOB_DB_PATH, workers=JOB_WORKERS,
+                 heartbeat_interval=JOB_HEARTBEAT_INTERVAL, stale_after=JOB_STALE_AFTER):
+        self.handler = handler
+        self.path = path
+        self.workers = workers
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.pid = os.getpid()
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                stage TEXT,
+                params TEXT NOT NULL,
+                timings TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                owner_pid INTEGER,
+                heartbeat REAL
+            )
+        """)
+        # 舊版資料庫沒有 owner_pid / heartbeat 欄位
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, column_type in (("owner_pid", "INTEGER"), ("heartbeat", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+        self._conn.commit()
+
+    def start(self):
+        """啟動工作執行緒與心跳執行緒，並重新排入心跳過期的任務（由服務程序呼叫；重複呼叫不會再啟動）"""
+        with self._lock:
+            if self._threads:
+                return
+            self._requeue_stale()
+            pending = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            for _ in range(pending):
+                self._queue.put(None)
+
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _requeue_stale(self):
+        # 呼叫時需持有 self._lock；沒有心跳的執行中任務來自舊版或已結束的程序
+        cursor = self._conn.execute(
+            "UPDATE jobs SET status = 'queued', stage = NULL, owner_pid = NULL, heartbeat = NULL "
+            "WHERE status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)",
+            (time.time() - self.stale_after,)
+        )
+        self._conn.commit()
+        if cursor.rowcount:
+            print(f"重新排入 {cursor.rowcount} 個心跳過期的任務")
+        return cursor.rowcount
+
+    def submit(self, params):
+        """提交任務，立即返回任務 ID"""
+        self.start()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, params, created_at) VALUES (?, 'queued', ?, ?)",
+                (job_id, json.dumps(params, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+        self._queue.put(None)
+        return job_id
+
+    def get(self, job_id):
+        """查詢任務狀態，任務不存在時返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, stage, params, timings, result, error, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        job_id, status, stage, params, timings, result, error, created_at, started_at, finished_at = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "stage": stage,
+            "params": json.loads(params),
+            "timings": json.loads(timings) if timings else {},
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "queue_wait": started_at - created_at if started_at else None
+        }
+
+    def _update(self, job_id, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def _heartbeat(self):
+        # 更新本程序執行中任務的心跳，並接手其他已結束程序留下的任務
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                with self._lock:
+                    self._conn.execute(
+                        "UPDATE jobs SET heartbeat = ? WHERE status = 'running' AND owner_pid = ?",
+                        (time.time(), self.pid)
+                    )
+                    self._conn.commit()
+                    requeued = self._requeue_stale()
+                for _ in range(requeued):
+                    self._queue.put(None)
+            except sqlite3.Error as e:
+                print(f"更新任務心跳失敗: {str(e)}")
+
+    def _claim(self):
+        """原子地領取最早排入的任務，沒有任務時返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE jobs SET status = 'running', owner_pid = ?, heartbeat = ?, started_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1) "
+                "AND status = 'queued' RETURNING id, params",
+                (self.pid, now, now)
+            ).fetchone()
+            self._conn.commit()
+        return row
+
+    def _worker(self):
+        while True:
+            # 佇列中的項目只是喚醒信號，實際領取哪個任務由資料庫決定；
+            # 逾時也會檢查一次，以接手其他程序重新排入的任務
+            try:
+                self._queue.get(timeout=self.heartbeat_interval)
+            except queue.Empty:
+                pass
+            while True:
+                try:
+                    row = self._claim()
+                except sqlite3.Error as e:
+                    print(f"領取任務失敗: {str(e)}")
+                    break
+                if row is None:
+                    break
+                try:
+                    self._run(*row)
+                except Exception as e:
+                    print(f"任務 {row[0]} 執行失敗: {str(e)}")
+
+    def _run(self, job_id, params):
+        job = JobContext(self, job_id)
+        try:
+            result = self.handler(json.loads(params), job)
+        except Exception as e:
+            self._update(job_id, status='failed', error=str(e), stage=None, finished_at=time.time())
+            return
+        self._update(job_id, status='done', result=json.dumps(result, ensure_ascii=False),
+                     stage=None, finished_at=time.time())
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+"""以 OCR 文字框位置解析發票
+
+detect_text_with_layout / detect_document 的結果帶有每個文字框的位置。
+這裡把文字框放進均勻網格做空間索引，依「值在標籤右側 / 下方」、
+「表格欄位以 x 座標對齊」等幾何關係找出欄位值，找不到時才退回
+InvoiceParser 的正則表達式。
+"""
+
+import re
+from collections import namedtuple
+
+from invoice_parser import PATTERN_SOURCES, InvoiceParser, valid_total_amount
+from table_parser import extract_table_items
+
+Box = namedtuple('Box', ['text', 'x0', 'y0', 'x1', 'y1'])
+
+# 各欄位的標籤（依優先順序）、值的格式與標籤右側允許的最大空隙（以字高計，None 為整行）
+# 值必須緊接在標籤之後；有固定格式的欄位可以跨越表格欄位間的空白，自由文字欄位則不行
+LAYOUT_FIELDS = {
+    "invoice_number": (("發票號碼", "發票編號"), re.compile(r'([A-Z]{2}-?\d{8})'), None),
+    "seller_tax_id": (("營利事業統一編號", "統一編號", "統編", "賣方"), re.compile(r'(\d{8})\b'), None),
+    "total_amount": (("總計", "合計", "總金額", "應付金額", "現金"),
+                     re.compile(r'(?:NT)?\$?\s*(\d{1,3}(?:,\d{3})+(?:\.\d{2})?|\d+(?:\.\d{2})?)'), None),
+    "buyer": (("買受人",), re.compile(r'([^\s\d:：,，。(（]{2,40})'), 6),
+    "address": (("地址",), re.compile(r'(\S{0,6}[縣市]\S{2,50})'), 6),
+}
+# 幾何關係找到的值的信心度
+LAYOUT_CONFIDENCE = {"right": 0.9, "below": 0.8}
+# 發票上印刷的其他標籤：包含欄位標籤（買受人註記欄）或會被誤認為值（註記欄），
+# 掃描時以最長匹配優先，因此「買受人註記欄」不會被當作「買受人」
+PRINTED_LABELS = ("買受人註記欄", "註記欄")
+# 標籤或值之前出現這些字時不是總金額（與 InvoiceParser 相同的排除項）
+TOTAL_EXCLUDE_KEYWORDS = tuple(PATTERN_SOURCES["total_amount_exclude"])
+
+_LABEL_SCANNER = re.compile('|'.join(
+    re.escape(label) for label in sorted(
+        {label for labels, _, _ in LAYOUT_FIELDS.values() for label in labels} | set(PRINTED_LABELS),
+        key=len, reverse=True)
+))
+_LABEL_PUNCTUATION = ' :：'
+
+def _box_from_vertices(text, vertices):
+    # 文字可能傾斜，一律取四個頂點的外接矩形
+    xs, ys = zip(*vertices)
+    return Box(text, min(xs), min(ys), max(xs), max(ys))
+
+def boxes_from_layout(layout, words=False):
+    """把 detect_text_with_layout（文字框列表）或 detect_document（頁面 / 段落）的結果轉為 Box 列表
+
+    Args:
+        words: 段落有字詞位置時改用字詞（較舊的 OCR 結果沒有，仍使用段落）
+    """
+    if isinstance(layout, dict):
+        items = [
+            item
+            for page in layout.get('pages', [])
+            for block in page['blocks']
+            for paragraph in block['paragraphs']
+            for item in ((paragraph.get('words') or [paragraph]) if words else [paragraph])
+        ]
+    else:
+        items = layout
+    return [
+        _box_from_vertices(item['text'], item['bounding_box'])
+        for item in items
+        if item['text'].strip() and item['bounding_box']
+    ]
+
+class SpatialGrid:
+    """文字框的均勻網格索引，查詢只檢查與範圍相交的格子"""
+
+    def __init__(self, boxes, cell_size):
+        self.cell_size = max(cell_size, 1)
+        self.cells = {}
+        for index, box in enumerate(boxes):
+            for key in self._keys(box.x0, box.y0, box.x1, box.y1):
+                self.cells.setdefault(key, []).append(index)
+        self.boxes = boxes
+
+    def _keys(self, x0, y0, x1, y1):
+        size = self.cell_size
+        for cx in range(int(x0 // size), int(x1 // size) + 1):
+            for cy in range(int(y0 // size), int(y1 // size) + 1):
+                yield cx, cy
+
+    def query(self, x0, y0, x1, y1):
+        """返回與矩形相交的文字框索引"""
+        found = set()
+        for key in self._keys(x0, y0, x1, y1):
+            for index in self.cells.get(key, ()):
+                box = self.boxes[index]
+                if box.x1 >= x0 and box.x0 <= x1 and box.y1 >= y0 and box.y0 <= y1:
+                    found.add(index)
+        return found
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else 0
+
+class Layout:
+    """文字框、空間索引與依 y 座標分組的文字行"""
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+        self.line_height = _median([box.y1 - box.y0 for box in boxes]) or 1
+        self.width = max((box.x1 for box in boxes), default=0)
+        self.grid = SpatialGrid(boxes, self.line_height * 4)
+        self.lines = self._group_lines()
+        self.line_texts = [self.join([self.boxes[index] for index in line]) for line in self.lines]
+
+    def _group_lines(self):
+        # 依中心 y 排序後，與目前行的中心差距小於半個行高者視為同一行
+        order = sorted(range(len(self.boxes)), key=lambda i: self.boxes[i].y0 + self.boxes[i].y1)
+        lines, current, center = [], [], None
+        for index in order:
+            box = self.boxes[index]
+            box_center = (box.y0 + box.y1) / 2
+            if current and abs(box_center - center) > self.line_height / 2:
+                lines.append(current)
+                current = []
+            current.append(index)
+            # 以行內中心的移動平均追蹤略微傾斜的行
+            center = box_center if len(current) == 1 else (center + box_center) / 2
+        if current:
+            lines.append(current)
+        return [sorted(line, key=lambda i: self.boxes[i].x0) for line in lines]
+
+    def join(self, boxes):
+        """依 x 座標串接文字框；間距超過半個字高時插入空白"""
+        parts = []
+        previous = None
+        for box in boxes:
+            if previous is not None and box.x0 - previous.x1 > (previous.y1 - previous.y0) / 2:
+                # 表格欄位之間的距離較大，以兩個空白分隔
+                gap = box.x0 - previous.x1
+                parts.append('  ' if gap > 2 * self.line_height else ' ')
+            parts.append(box.text)
+            previous = box
+        return ''.join(parts)
+
+    @property
+    def text(self):
+        return '\n'.join(self.line_texts)
+
+    def find_labels(self):
+        """單次掃描所有文字框，返回 {標籤: [(文字框索引, 標籤結尾在框內的位置)]}"""
+        found = {}
+        for index, box in enumerate(self.boxes):
+            for match in _LABEL_SCANNER.finditer(box.text):
+                found.setdefault(match.group(), []).append((index, match.end()))
+        return found
+
+    def right_of(self, index, offset, max_gap=None):
+        """標籤右側同一行的文字（包含標籤所在文字框的剩餘部分）
+
+        max_gap: 文字框之間的空隙超過幾個字高時視為另一個欄位，不再往右延伸
+        """
+        label = self.boxes[index]
+        height = label.y1 - label.y0
+        rest = label.text[offset:]
+        candidates = sorted(
+            (self.boxes[i] for i in self.grid.query(label.x1, label.y0 + height / 4, self.width, label.y1 - height / 4)
+             if i != index and self.boxes[i].x0 >= label.x1 - height / 2),
+            key=lambda box: box.x0
+        )
+        neighbours = []
+        right = label.x1
+        for box in candidates:
+            if max_gap is not None and box.x0 - right > max_gap * height:
+                break
+            neighbours.append(box)
+            right = max(right, box.x1)
+        text = self.join(neighbours)
+        if rest.strip(_LABEL_PUNCTUATION):
+            text = rest + (' ' + text if text else '')
+        return text.lstrip(_LABEL_PUNCTUATION)
+
+    def below(self, index):
+        """標籤正下方最近一行、x 範圍重疊的文字"""
+        label = self.boxes[index]
+        height = label.y1 - label.y0
+        candidates = [
+            self.boxes[i] for i in self.grid.query(label.x0, label.y1 + 1, label.x1 + 4 * height, label.y1 + 3 * height)
+            if i != index and self.boxes[i].y0 >= label.y1 - height / 4
+        ]
+        if not candidates:
+            return ''
+        top = min(box.y0 for box in candidates)
+        row = sorted((box for box in candidates if box.y0 - top < height / 2), key=lambda box: box.x0)
+        return self.join(row).lstrip(_LABEL_PUNCTUATION)
+
+class LayoutParser(InvoiceParser):
+    """先以幾何關係找欄位值，找不到時使用 InvoiceParser 的正則表達式
+
+    Args:
+        layout: detect_text_with_layout 或 detect_document 的結果
+    """
+
+    def __init__(self, layout):
+        self.layout = Layout(boxes_from_layout(layout))
+        # 表格使用最細的文字框（有字詞位置時用字詞，否則用段落）
+        self.words = boxes_from_layout(layout, words=True)
+        # detect_document 已有完整文字，文字框列表則依位置重建
+        text = layout.get('text') if isinstance(layout, dict) else None
+        super().__init__(text if text is not None else self.layout.text)
+        self._labels = self.layout.find_labels()
+
+    def _layout_value(self, field, accept=None):
+        """依標籤順序，在標籤右側、再到下方找符合格式的值
+
+        Args:
+            accept: accept(值, 標籤所在文字框的文字) 為 False 時略過這個值
+
+        Returns:
+            (值, 信心度)，找不到時為 (None, None)
+        """
+        labels, pattern, max_gap = LAYOUT_FIELDS[field]
+        for label in labels:
+            for index, offset in self._labels.get(label, ()):
+                for relation in ("right", "below"):
+                    if relation == "right":
+                        text = self.layout.right_of(index, offset, max_gap)
+                    else:
+                        text = self.layout.below(index)
+                    match = pattern.match(text)
+                    # 值本身是另一個標籤時，表示這個標籤後面沒有填值
+                    if not match or _LABEL_SCANNER.search(match.group(1)):
+                        continue
+                    if accept and not accept(match.group(1), self.layout.boxes[index].text):
+                        continue
+                    return match.group(1), LAYOUT_CONFIDENCE[relation]
+        return None, None
+
+    def _extract_with_layout(self, field, fallback, clean=None, accept=None):
+        value, confidence = self._layout_value(field, accept)
+        if value is None:
+            return fallback()
+        self.result[field] = clean(value) if clean else value
+        self.result["confidence"][field] = confidence
+        return self
+
+    def extract_invoice_number(self):
+        # 沒有標籤時，符合格式的號碼本身已經很可靠
+        return self._extract_with_layout(
+            "invoice_number", super().extract_invoice_number, lambda value: value.replace('-', ''))
+
+    def extract_seller_tax_id(self):
+        return self._extract_with_layout("seller_tax_id", super().extract_seller_tax_id)
+
+    def extract_total_amount(self):
+        # 與正則表達式相同的驗證：排除「小計」「找零」等標籤與不合理的金額
+        def accept(value, label_text):
+            return valid_total_amount(value) and not any(
+                keyword in label_text for keyword in TOTAL_EXCLUDE_KEYWORDS)
+
+        return self._extract_with_layout(
+            "total_amount", super().extract_total_amount,
+            lambda value: "{:.2f}".format(float(value.replace(',', ''))), accept)
+
+    def extract_buyer(self):
+        return self._extract_with_layout("buyer", super().extract_buyer)
+
+    def extract_address(self):
+        return self._extract_with_layout("address", super().extract_address)
+
+    def extract_items(self):
+        """以文字框重建品項表格（見 table_parser），找不到表格時使用正則表達式"""
+        items, confidence = extract_table_items(self.words, self.layout.line_height)
+        if not items:
+            return super().extract_items()
+        self.result['items'] = items
+        self.result["confidence"]["items"] = confidence
+        return self
@@ -1,60 +1,220 @@
 # -*- coding: utf-8 -*-
 
+import importlib.util
 import os
 import json
 import numpy as np
 
-# 條件導入 TensorFlow
-try:
-    import tensorflow as tf
-    from tensorflow.keras import layers, models
-    TENSORFLOW_AVAILABLE = True
-except ImportError:
-    TENSORFLOW_AVAILABLE = False
+# 只檢查是否已安裝，TensorFlow 與 scikit-learn 在實際訓練時才導入（導入 TensorFlow 需要數秒）
+TENSORFLOW_AVAILABLE = importlib.util.find_spec("tensorflow") is not None
+if not TENSORFLOW_AVAILABLE:
     print("TensorFlow 未安裝。模型訓練功能將不可用，但系統其他功能不受影響。")
     print("當您收集了足夠的反饋數據後，可以安裝 TensorFlow 以啟用模型訓練功能。")
 
-try:
-    from sklearn.model_selection import train_test_split
-    SKLEARN_AVAILABLE = True
-except ImportError:
-    SKLEARN_AVAILABLE = False
+SKLEARN_AVAILABLE = importlib.util.find_spec("sklearn") is not None
+if not SKLEARN_AVAILABLE:
     print("scikit-learn 未安裝。模型訓練功能將不可用。")
 
-def prepare_training_data(feedback_dir="feedback_data"):
-    """準備訓練數據"""
-    data = []
-    labels = []
-    
-    # 加載反饋數據
-    feedback_files = [f for f in os.listdir(feedback_dir) if f.endswith('.json')]
-    for file in feedback_files:
-        with open(os.path.join(feedback_dir, file), 'r', encoding='utf-8') as f:
-            feedback = json.load(f)
-        
-        # 提取特徵和標籤
-        for correction in feedback.get("fields_corrected", []):
-            # 這裡需要根據您的具體需求設計特徵
-            # 例如，可以使用原始文本的詞袋模型、字符級特徵等
-            feature = extract_features(correction["original_value"])
-            label = correction["corrected_value"]
-            
-            data.append(feature)
-            labels.append(label)
+# 特徵設定：變更時需提高 FEATURE_VERSION，快取會自動重建
+FEATURE_VERSION = 1
+NGRAM_BUCKETS = 512          # 字元 1~3-gram 雜湊到的維度
+MAX_TEXT_LENGTH = 256        # 過長的值只取前段
+SHAPE_CLASSES = 5            # 數字、英文大寫、英文小寫、中日韓文字、其他
+FEATURE_DIM = NGRAM_BUCKETS + 3 + SHAPE_CLASSES + SHAPE_CLASSES * SHAPE_CLASSES
+FEATURE_BATCH_SIZE = 1024
+FEATURE_CACHE_DIR = os.path.join("models", "feature_cache")
+
+def _as_text(value):
+    # 反饋中的值可能是 None、布林或列表，統一轉成文字
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+def _char_shapes(codes):
+    """將字元碼轉成形狀類別：0 數字、1 大寫、2 小寫、3 中日韓文字、4 其他"""
+    shapes = np.full(codes.shape, 4, dtype=np.int64)
+    shapes[(codes >= 0x30) & (codes <= 0x39)] = 0
+    shapes[(codes >= 0x41) & (codes <= 0x5A)] = 1
+    shapes[(codes >= 0x61) & (codes <= 0x7A)] = 2
+    shapes[(codes >= 0x4E00) & (codes <= 0x9FFF)] = 3
+    return shapes
+
+def extract_features_batch(texts):
+    """向量化計算一批文字的特徵
+    
+    特徵包含：字元 1~3-gram 的雜湊計數、長度/空白/數字數、
+    字元形狀類別計數，以及形狀二元組計數（例如「數字後接數字」）。
+    
+    Returns:
+        float32 陣列，形狀為 (len(texts), FEATURE_DIM)
+    """
+    n = len(texts)
+    features = np.zeros((n, FEATURE_DIM), dtype=np.float32)
+    if n == 0:
+        return features
     
-    return np.array(data), np.array(labels)
+    texts = [_as_text(text)[:MAX_TEXT_LENGTH] for text in texts]
+    width = max(1, max(len(text) for text in texts))
+    # 以 UTF-32 字元碼矩陣表示整批文字，不足的部分補 0
+    codes = np.array(texts, dtype=f"U{width}").view(np.uint32).reshape(n, width).astype(np.int64)
+    valid = codes > 0
+    rows = np.broadcast_to(np.arange(n)[:, None], codes.shape)
+    
+    # 字元 n-gram 雜湊計數
+    ngram_hash = np.zeros_like(codes)
+    for size in (1, 2, 3):
+        if size > width:
+            break
+        span = width - size + 1
+        ngram_hash = ngram_hash[:, :span] * 1000003 + codes[:, size - 1:size - 1 + span]
+        mask = valid[:, size - 1:size - 1 + span]
+        buckets = (ngram_hash + size) % NGRAM_BUCKETS
+        flat = rows[:, :span][mask] * NGRAM_BUCKETS + buckets[mask]
+        features[:, :NGRAM_BUCKETS] += np.bincount(flat, minlength=n * NGRAM_BUCKETS).reshape(n, NGRAM_BUCKETS)
+    offset = NGRAM_BUCKETS
+    
+    # 長度、空白數、數字數（與舊版 extract_features 相同）
+    shapes = _char_shapes(codes)
+    features[:, offset] = valid.sum(axis=1)
+    features[:, offset + 1] = (codes == 0x20).sum(axis=1)
+    features[:, offset + 2] = ((shapes == 0) & valid).sum(axis=1)
+    offset += 3
+    
+    # 形狀類別計數
+    flat = rows[valid] * SHAPE_CLASSES + shapes[valid]
+    features[:, offset:offset + SHAPE_CLASSES] = np.bincount(
+        flat, minlength=n * SHAPE_CLASSES).reshape(n, SHAPE_CLASSES)
+    offset += SHAPE_CLASSES
+    
+    # 形狀二元組計數
+    if width > 1:
+        pair_valid = valid[:, 1:]
+        pairs = shapes[:, :-1] * SHAPE_CLASSES + shapes[:, 1:]
+        pair_count = SHAPE_CLASSES * SHAPE_CLASSES
+        flat = rows[:, 1:][pair_valid] * pair_count + pairs[pair_valid]
+        features[:, offset:offset + pair_count] = np.bincount(
+            flat, minlength=n * pair_count).reshape(n, pair_count)
+    
+    return features
 
 def extract_features(text):
     """從文本中提取特徵"""
-    # 這是一個簡單的示例，您需要根據實際需求設計更複雜的特徵提取
-    # 例如，可以使用詞袋模型、TF-IDF、字符級 n-gram 等
-    return [len(text), text.count(' '), sum(c.isdigit() for c in text)]
+    return extract_features_batch([text])[0]
+
+class FeatureCache:
+    """保存在磁碟上的特徵矩陣，以反饋資料庫的最新 ID 判斷需要增量處理的樣本
+    
+    特徵以 float32 依列附加到 features.f32，讀取時使用 memmap，
+    labels.jsonl 與 meta.json 分別記錄標籤與已處理到的反饋 ID。
+    """
+
+    def __init__(self, cache_dir=FEATURE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.features_path = os.path.join(cache_dir, "features.f32")
+        self.labels_path = os.path.join(cache_dir, "labels.jsonl")
+        self.meta_path = os.path.join(cache_dir, "meta.json")
+
+    def load_meta(self):
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def reset(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for path in (self.features_path, self.labels_path):
+            open(path, 'wb').close()
+        meta = {"feature_version": FEATURE_VERSION, "feature_dim": FEATURE_DIM, "last_id": 0, "rows": 0}
+        self.save_meta(meta)
+        return meta
+
+    def save_meta(self, meta):
+        # 先寫入暫存檔再替換，避免中斷時留下損壞的 meta
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def truncate(self, meta):
+        # 上次寫入中斷時，丟棄 meta 記錄之後的部分
+        with open(self.features_path, 'r+b') as f:
+            f.truncate(meta["rows"] * FEATURE_DIM * 4)
+        with open(self.labels_path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()[:meta["rows"]]
+        with open(self.labels_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+
+    def append(self, features, labels):
+        with open(self.features_path, 'ab') as f:
+            f.write(np.ascontiguousarray(features, dtype=np.float32).tobytes())
+        with open(self.labels_path, 'a', encoding='utf-8') as f:
+            for label in labels:
+                f.write(json.dumps(label, ensure_ascii=False) + "\n")
+
+    def load(self, rows):
+        if rows == 0:
+            return np.zeros((0, FEATURE_DIM), dtype=np.float32), np.array([])
+        features = np.memmap(self.features_path, dtype=np.float32, mode='r', shape=(rows, FEATURE_DIM))
+        with open(self.labels_path, 'r', encoding='utf-8') as f:
+            labels = [json.loads(line) for _, line in zip(range(rows), f)]
+        return features, np.array(labels)
+
+def build_training_set(feedback_dir="feedback_data", cache_dir=FEATURE_CACHE_DIR):
+    """增量建立訓練集：只對上次之後新增的反饋計算特徵
+    
+    Returns:
+        (特徵矩陣 memmap, 標籤陣列)
+    """
+    from feedback_store import get_feedback_store
+    
+    store = get_feedback_store(feedback_dir)
+    cache = FeatureCache(cache_dir)
+    meta = cache.load_meta()
+    # 特徵定義改變或反饋資料庫被重建時，從頭計算
+    if (meta is None or meta.get("feature_version") != FEATURE_VERSION
+            or meta.get("feature_dim") != FEATURE_DIM or meta["last_id"] > store.version()):
+        meta = cache.reset()
+    else:
+        cache.truncate(meta)
+    
+    texts, labels = [], []
+    
+    def flush(last_id):
+        if texts:
+            cache.append(extract_features_batch(texts), labels)
+            meta["rows"] += len(texts)
+            texts.clear()
+            labels.clear()
+        meta["last_id"] = last_id
+        cache.save_meta(meta)
+    
+    last_id = meta["last_id"]
+    for feedback_id, feedback in store.iter_feedback(after_id=last_id, batch_size=FEATURE_BATCH_SIZE):
+        # 提取特徵和標籤
+        for correction in feedback.get("fields_corrected", []):
+            texts.append(correction["original_value"])
+            labels.append(_as_text(correction["corrected_value"]))
+        last_id = feedback_id
+        if len(texts) >= FEATURE_BATCH_SIZE:
+            flush(last_id)
+    flush(last_id)
+    
+    return cache.load(meta["rows"])
+
+def prepare_training_data(feedback_dir="feedback_data"):
+    """準備訓練數據"""
+    return build_training_set(feedback_dir)
 
 def build_model(input_shape, num_classes):
     """構建神經網絡模型"""
     if not TENSORFLOW_AVAILABLE:
         raise ImportError("TensorFlow 未安裝，無法構建模型。請安裝 TensorFlow 後再試。")
     
+    from tensorflow.keras import layers, models
+    
     model = models.Sequential([
         layers.Dense(64, activation='relu', input_shape=(input_shape,)),
         layers.Dropout(0.2),
@@ -77,17 +237,22 @@ def train_model(feedback_dir="feedback_data", model_dir="models"):
         print("請安裝這些庫以啟用模型訓練功能。")
         return False
     
+    from sklearn.model_selection import train_test_split
+    
     # 準備數據
     X, y = prepare_training_data(feedback_dir)
     if len(X) < 10:  # 至少需要一定數量的樣本
         print(f"樣本數量不足，需要更多反饋數據")
         return False
     
+    # 標籤是修正後的文字，轉成類別編號
+    classes, y = np.unique(y, return_inverse=True)
+    
     # 劃分訓練集和測試集
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2)
     
     # 構建模型
-    model = build_model(X_train.shape[1], len(set(y)))
+    model = build_model(X_train.shape[1], len(classes))
     
     # 訓練模型
     model.fit(X_train, y_train, epochs=50, batch_size=32, validation_split=0.1)
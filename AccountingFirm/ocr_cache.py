@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 快取設定（可由 .env 覆寫）
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", os.path.join("ocr_cache", "ocr_cache.sqlite3"))
+OCR_CACHE_MAX_ENTRIES = int(os.getenv("OCR_CACHE_MAX_ENTRIES", "5000"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# 快取的 OCR 結果格式版本，結果的結構改變時遞增（2：layout 結果加入 words），舊版的項目不再命中並逐漸被淘汰
+OCR_CACHE_FORMAT = 2
+
+# 命中時的存取時間先記在記憶體，累積到一定筆數或時間後才一起寫入
+ACCESS_FLUSH_SIZE = 64
+ACCESS_FLUSH_INTERVAL = 30.0
+
+def make_cache_key(content, mode, preprocessing=None):
+    """以快取格式版本、圖像內容的 SHA-256、OCR 模式與預處理方法組成快取鍵"""
+    digest = hashlib.sha256(content).hexdigest()
+    return f"v{OCR_CACHE_FORMAT}:{digest}:{mode}:{preprocessing or 'none'}"
+
+class OCRCache:
+    """以 SQLite 儲存的 OCR 結果快取，依最後存取時間做 LRU 淘汰
+
+    項目數與總大小由觸發器維護在只有一列的 ocr_cache_stats，寫入時不需要掃描整張表；
+    多個程序共用同一個資料庫時也保持正確。
+    """
+
+    def __init__(self, path=OCR_CACHE_PATH, max_entries=OCR_CACHE_MAX_ENTRIES,
+                 max_bytes=OCR_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending_access = {}
+        self._last_flush = time.monotonic()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ocr_cache (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_cache_access ON ocr_cache(last_access)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ocr_cache_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                entries INTEGER NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        # 舊版資料庫沒有統計列，以現有的項目初始化一次
+        self._conn.execute(
+            "INSERT OR IGNORE INTO ocr_cache_stats (id, entries, size) "
+            "SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM ocr_cache"
+        )
+        self._conn.executescript("""
+            CREATE TRIGGER IF NOT EXISTS ocr_cache_insert AFTER INSERT ON ocr_cache BEGIN
+                UPDATE ocr_cache_stats SET entries = entries + 1, size = size + new.size WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS ocr_cache_delete AFTER DELETE ON ocr_cache BEGIN
+                UPDATE ocr_cache_stats SET entries = entries - 1, size = size - old.size WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS ocr_cache_resize AFTER UPDATE OF size ON ocr_cache BEGIN
+                UPDATE ocr_cache_stats SET size = size + new.size - old.size WHERE id = 0;
+            END;
+        """)
+        self._conn.commit()
+
+    def get(self, key):
+        """取得快取的 OCR 結果，未命中時返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._pending_access[key] = time.time()
+            if (len(self._pending_access) >= ACCESS_FLUSH_SIZE
+                    or time.monotonic() - self._last_flush >= ACCESS_FLUSH_INTERVAL):
+                self._flush_access()
+                self._conn.commit()
+        return json.loads(row[0])
+
+    def _flush_access(self):
+        # 呼叫時需持有 self._lock；程序結束前未寫入的存取時間只影響淘汰順序
+        if self._pending_access:
+            self._conn.executemany(
+                "UPDATE ocr_cache SET last_access = ? WHERE key = ?",
+                [(access, key) for key, access in self._pending_access.items()]
+            )
+            self._pending_access.clear()
+        self._last_flush = time.monotonic()
+
+    def put(self, key, result):
+        """保存 OCR 結果，超過容量時淘汰最久未使用的項目"""
+        data = json.dumps(result, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            # 以 UPSERT 覆寫既有項目（REPLACE 的刪除不會觸發觸發器）
+            self._conn.execute(
+                "INSERT INTO ocr_cache (key, result, size, created_at, last_access) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET result = excluded.result, size = excluded.size, "
+                "created_at = excluded.created_at, last_access = excluded.last_access",
+                (key, data, len(data.encode('utf-8')), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _totals(self):
+        return self._conn.execute("SELECT entries, size FROM ocr_cache_stats WHERE id = 0").fetchone()
+
+    def _evict(self):
+        count, total = self._totals()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # 淘汰前寫入累積的存取時間，最近命中的項目才不會被當成最舊的
+        self._flush_access()
+
+        # 依最後存取時間由舊到新刪除：超出的筆數直接以 LIMIT 取出
+        excess = count - self.max_entries
+        if excess > 0:
+            rows = self._conn.execute(
+                "SELECT key, size FROM ocr_cache ORDER BY last_access LIMIT ?", (excess,)
+            ).fetchall()
+            self._conn.executemany("DELETE FROM ocr_cache WHERE key = ?", [(key,) for key, _ in rows])
+            total -= sum(size for _, size in rows)
+
+        if total > self.max_bytes:
+            # 仍超過大小上限時逐筆讀取最舊的項目，讀到足夠為止，不載入整張表
+            removed = []
+            cursor = self._conn.execute("SELECT key, size FROM ocr_cache ORDER BY last_access")
+            for key, size in cursor:
+                if total <= self.max_bytes:
+                    break
+                removed.append((key,))
+                total -= size
+            cursor.close()
+            self._conn.executemany("DELETE FROM ocr_cache WHERE key = ?", removed)
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._pending_access.clear()
+            self._conn.execute("DELETE FROM ocr_cache")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """返回快取統計資訊"""
+        with self._lock:
+            count, total = self._totals()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "size_bytes": total,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_ocr_cache():
+    """取得全域的 OCR 快取（停用時返回 None）"""
+    global _cache
+    if not OCR_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = OCRCache()
+    return _cache
@@ -1,49 +1,111 @@
 # -*- coding: utf-8 -*-
 
 from google.cloud import vision
+from google.api_core import exceptions as api_exceptions
+from google.api_core import retry as api_retry
 import io
 import os
 import json
+import threading
 
 # 導入憑證設置
 import setup_credentials
+from ocr_cache import get_ocr_cache, make_cache_key
 
-def detect_text(image_path):
-    """使用 Google Cloud Vision API 檢測圖片中的文字"""
-    client = vision.ImageAnnotatorClient()
+# Vision API 呼叫設定（可由 .env 覆寫）
+VISION_TIMEOUT = float(os.getenv('VISION_TIMEOUT', '30'))
+VISION_RETRY_DEADLINE = float(os.getenv('VISION_RETRY_DEADLINE', '60'))
+VISION_API_ENDPOINT = os.getenv('VISION_API_ENDPOINT')
+# 每次 batch_annotate_images 的圖像數（API 上限為 16）
+VISION_BATCH_SIZE = max(1, min(int(os.getenv('VISION_BATCH_SIZE', '16')), 16))
+# 設為 stub 時改用離線的 StubVisionClient
+OCR_BACKEND = os.getenv('OCR_BACKEND', 'vision')
 
+# 只對暫時性錯誤重試
+VISION_RETRY = api_retry.Retry(
+    predicate=api_retry.if_exception_type(
+        api_exceptions.ServiceUnavailable,
+        api_exceptions.DeadlineExceeded,
+        api_exceptions.InternalServerError,
+        api_exceptions.TooManyRequests,
+    ),
+    initial=0.5,
+    maximum=8.0,
+    multiplier=2.0,
+    deadline=VISION_RETRY_DEADLINE,
+)
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def _reset_client_after_fork():
+    # gRPC 通道不能跨 fork 共用，子進程需要重新建立
+    global _client, _client_pid, _client_lock
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_client_after_fork)
+
+def get_vision_client():
+    """取得進程內共用的 Vision client，第一次使用時才建立"""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                if OCR_BACKEND == 'stub':
+                    from vision_stub import StubVisionClient
+                    _client = StubVisionClient(
+                        text=os.getenv('VISION_STUB_TEXT', ''),
+                        latency=float(os.getenv('VISION_STUB_LATENCY', '0'))
+                    )
+                else:
+                    client_options = {'api_endpoint': VISION_API_ENDPOINT} if VISION_API_ENDPOINT else None
+                    _client = vision.ImageAnnotatorClient(client_options=client_options)
+                _client_pid = pid
+    return _client
+
+def set_vision_client(client):
+    """注入 Vision client（例如測試用的 stub），傳入 None 則恢復為自動建立"""
+    global _client, _client_pid
+    with _client_lock:
+        _client = client
+        _client_pid = os.getpid() if client is not None else None
+
+def _read_image(image_path):
     with io.open(image_path, 'rb') as image_file:
-        content = image_file.read()
+        return image_file.read()
 
-    image = vision.Image(content=content)
-    response = client.text_detection(image=image)
-    texts = response.text_annotations
+def _cached_ocr(content, mode, preprocessing, run_ocr):
+    """先查詢 OCR 快取，未命中時才呼叫 Vision API 並寫入快取"""
+    cache = get_ocr_cache()
+    if cache is None:
+        return run_ocr(content)
 
+    key = make_cache_key(content, mode, preprocessing)
+    result = cache.get(key)
+    if result is None:
+        result = run_ocr(content)
+        cache.put(key, result)
+    return result
+
+def _check_error(response):
     if response.error.message:
         raise Exception(
             '{0}\nFor more info on error messages, check: '.format(response.error.message) +
             'https://cloud.google.com/apis/design/errors')
-            
+
+def _text_from_response(response):
     # 返回檢測到的所有文字
+    texts = response.text_annotations
     if texts:
         return texts[0].description
     return ""
 
-def detect_text_with_layout(image_path):
-    """檢測文字並保留位置信息"""
-    client = vision.ImageAnnotatorClient()
-
-    with io.open(image_path, 'rb') as image_file:
-        content = image_file.read()
-
-    image = vision.Image(content=content)
-    response = client.text_detection(image=image)
-    
-    if response.error.message:
-        raise Exception(
-            '{0}\nFor more info on error messages, check: '.format(response.error.message) +
-            'https://cloud.google.com/apis/design/errors')
-    
+def _layout_from_response(response):
     # 提取文字及其位置信息
     text_blocks = []
     for text in response.text_annotations[1:]:  # 跳過第一個，它包含所有文字
@@ -55,21 +117,7 @@ def detect_text_with_layout(image_path):
     
     return text_blocks
 
-def detect_document(image_path):
-    """使用文檔OCR模式，更適合結構化文檔如發票"""
-    client = vision.ImageAnnotatorClient()
-
-    with io.open(image_path, 'rb') as image_file:
-        content = image_file.read()
-
-    image = vision.Image(content=content)
-    response = client.document_text_detection(image=image)
-    
-    if response.error.message:
-        raise Exception(
-            '{0}\nFor more info on error messages, check: '.format(response.error.message) +
-            'https://cloud.google.com/apis/design/errors')
-    
+def _document_from_response(response):
     # 保存完整的OCR結果，包括頁面、段落、文字塊等結構
     result = {
         'text': response.full_text_annotation.text,
@@ -92,20 +140,158 @@ def detect_document(image_path):
             for paragraph in block.paragraphs:
                 para_text = ''.join([symbol.text for word in paragraph.words for symbol in word.symbols])
                 para_vertices = [(vertex.x, vertex.y) for vertex in paragraph.bounding_box.vertices]
+                # 字詞位置供品項表格重建使用（段落文字沒有空白，無法分辨欄位）
+                words = [{
+                    'text': ''.join(symbol.text for symbol in word.symbols),
+                    'bounding_box': [(vertex.x, vertex.y) for vertex in word.bounding_box.vertices]
+                } for word in paragraph.words]
                 
                 block_info['paragraphs'].append({
                     'text': para_text,
-                    'bounding_box': para_vertices
+                    'bounding_box': para_vertices,
+                    'words': words
                 })
             
             page_info['blocks'].append(block_info)
         
         result['pages'].append(page_info)
     
+    return result
+
+def _save_document_result(image_path, result):
     # 保存結果到文件，方便調試
     os.makedirs('ocr_results', exist_ok=True)
     result_file = os.path.join('ocr_results', os.path.basename(image_path) + '.json')
     with open(result_file, 'w', encoding='utf-8') as f:
         json.dump(result, f, ensure_ascii=False, indent=2)
+
+def detect_text(image_path, preprocessing=None):
+    """使用 Google Cloud Vision API 檢測圖片中的文字
     
-    return result 
\ No newline at end of file
+    Args:
+        image_path: 圖像文件路徑
+        preprocessing: 圖像使用的預處理方法，作為快取鍵的一部分
+    """
+    return detect_text_content(_read_image(image_path), preprocessing)
+
+def detect_text_content(content, preprocessing=None):
+    """與 detect_text 相同，但直接使用記憶體中的圖像位元組"""
+    return _cached_ocr(content, 'text', preprocessing, _annotate_text)
+
+def _annotate_text(content):
+    client = get_vision_client()
+
+    image = vision.Image(content=content)
+    response = client.text_detection(image=image, retry=VISION_RETRY, timeout=VISION_TIMEOUT)
+    _check_error(response)
+    return _text_from_response(response)
+
+def detect_text_with_layout(image_path, preprocessing=None):
+    """檢測文字並保留位置信息"""
+    return detect_layout_content(_read_image(image_path), preprocessing)
+
+def detect_layout_content(content, preprocessing=None):
+    """與 detect_text_with_layout 相同，但直接使用記憶體中的圖像位元組"""
+    return _cached_ocr(content, 'layout', preprocessing, _annotate_layout)
+
+def _annotate_layout(content):
+    client = get_vision_client()
+
+    image = vision.Image(content=content)
+    response = client.text_detection(image=image, retry=VISION_RETRY, timeout=VISION_TIMEOUT)
+    _check_error(response)
+    return _layout_from_response(response)
+
+def detect_document(image_path, preprocessing=None):
+    """使用文檔OCR模式，更適合結構化文檔如發票"""
+    return detect_document_content(_read_image(image_path), preprocessing, image_path)
+
+def detect_document_content(content, preprocessing=None, name=None):
+    """與 detect_document 相同，但直接使用記憶體中的圖像位元組
+    
+    Args:
+        name: 用於保存調試結果的文件名，None 時不保存
+    """
+    result = _cached_ocr(content, 'document', preprocessing, _annotate_document)
+    if name:
+        _save_document_result(name, result)
+    return result
+
+def _annotate_document(content):
+    client = get_vision_client()
+
+    image = vision.Image(content=content)
+    response = client.document_text_detection(image=image, retry=VISION_RETRY, timeout=VISION_TIMEOUT)
+    _check_error(response)
+    return _document_from_response(response)
+
+# OCR 模式對應的 Vision 功能與回應解析函數
+_BATCH_MODES = {
+    'text': (vision.Feature.Type.TEXT_DETECTION, _text_from_response),
+    'layout': (vision.Feature.Type.TEXT_DETECTION, _layout_from_response),
+    'document': (vision.Feature.Type.DOCUMENT_TEXT_DETECTION, _document_from_response),
+}
+
+def detect_batch(image_paths, mode='text', preprocessing=None):
+    """批次 OCR：快取未命中的圖像以 batch_annotate_images 分組送出
+    
+    Args:
+        image_paths: 圖像文件路徑列表
+        mode: 'text'、'layout' 或 'document'
+        preprocessing: 圖像使用的預處理方法，作為快取鍵的一部分
+    
+    Returns:
+        與 image_paths 順序對應的列表，每項為 {'result': ..., 'error': ...}；
+        單張圖像失敗不影響其他圖像
+    """
+    feature_type, parse_response = _BATCH_MODES[mode]
+    cache = get_ocr_cache()
+    outputs = [None] * len(image_paths)
+    pending = []
+
+    for index, image_path in enumerate(image_paths):
+        try:
+            content = _read_image(image_path)
+        except OSError as e:
+            outputs[index] = {'result': None, 'error': str(e)}
+            continue
+        key = make_cache_key(content, mode, preprocessing) if cache else None
+        result = cache.get(key) if cache else None
+        if result is not None:
+            outputs[index] = {'result': result, 'error': None}
+        else:
+            pending.append((index, content, key))
+
+    client = get_vision_client()
+    for start in range(0, len(pending), VISION_BATCH_SIZE):
+        chunk = pending[start:start + VISION_BATCH_SIZE]
+        requests = [
+            vision.AnnotateImageRequest(
+                image=vision.Image(content=content),
+                features=[vision.Feature(type_=feature_type)]
+            )
+            for _, content, _ in chunk
+        ]
+        try:
+            response = client.batch_annotate_images(
+                requests=requests, retry=VISION_RETRY, timeout=VISION_TIMEOUT)
+        except Exception as e:
+            for index, _, _ in chunk:
+                outputs[index] = {'result': None, 'error': str(e)}
+            continue
+
+        for (index, _, key), image_response in zip(chunk, response.responses):
+            if image_response.error.message:
+                outputs[index] = {'result': None, 'error': image_response.error.message}
+                continue
+            result = parse_response(image_response)
+            if cache:
+                cache.put(key, result)
+            outputs[index] = {'result': result, 'error': None}
+
+    if mode == 'document':
+        for image_path, output in zip(image_paths, outputs):
+            if output['result'] is not None:
+                _save_document_result(image_path, output['result'])
+
+    return outputs
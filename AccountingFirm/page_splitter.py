@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+
+# PDF 光柵化使用 PyMuPDF，未安裝時只能處理圖像與 TIFF
+try:
+    import fitz
+    PDF_AVAILABLE = True
+except ImportError:
+    print("警告: PyMuPDF (fitz) 未安裝，PDF 處理功能將被禁用")
+    PDF_AVAILABLE = False
+
+# PDF 光柵化的解析度（可由 .env 覆寫）
+PDF_RENDER_DPI = int(os.getenv('PDF_RENDER_DPI', '200'))
+
+def count_pages(content, fmt):
+    """返回文件的頁數（TIFF 為幀數），只讀取文件結構，不解碼頁面"""
+    if fmt == 'pdf':
+        if not PDF_AVAILABLE:
+            raise RuntimeError("PyMuPDF 未安裝，無法處理 PDF 文件")
+        with fitz.open(stream=content, filetype='pdf') as doc:
+            return doc.page_count
+    if fmt == 'tiff':
+        from PIL import Image
+        with Image.open(io.BytesIO(content)) as image:
+            return getattr(image, 'n_frames', 1)
+    return 1
+
+def is_multi_page(content, fmt):
+    """超過一頁的 PDF 與多幀 TIFF 需要逐頁處理；單頁文件與一般圖像相同，返回單張發票的結果"""
+    return fmt in ('pdf', 'tiff') and count_pages(content, fmt) > 1
+
+def single_page_image(content, fmt, dpi=PDF_RENDER_DPI):
+    """單頁文件轉為可直接預處理的圖像位元組：PDF 光柵化唯一的一頁，其他格式原樣返回"""
+    if fmt != 'pdf':
+        return content
+    for _, image in iter_pages(content, fmt, dpi):
+        return image
+    raise ValueError("PDF 文件沒有任何頁面")
+
+def iter_pages(content, fmt, dpi=PDF_RENDER_DPI):
+    """逐頁產生 (頁碼, PNG 位元組)，取用到該頁時才光柵化或解碼
+
+    Args:
+        content: 文件的位元組
+        fmt: upload_ingest.sniff_format 判斷的格式
+        dpi: PDF 光柵化的解析度
+    """
+    if fmt == 'pdf':
+        if not PDF_AVAILABLE:
+            raise RuntimeError("PyMuPDF 未安裝，無法處理 PDF 文件")
+        with fitz.open(stream=content, filetype='pdf') as doc:
+            for index, page in enumerate(doc):
+                yield index + 1, page.get_pixmap(dpi=dpi).tobytes('png')
+    elif fmt == 'tiff':
+        from PIL import Image
+        with Image.open(io.BytesIO(content)) as image:
+            for index in range(getattr(image, 'n_frames', 1)):
+                image.seek(index)
+                buffer = io.BytesIO()
+                image.convert('RGB').save(buffer, 'PNG')
+                yield index + 1, buffer.getvalue()
+    else:
+        yield 1, content
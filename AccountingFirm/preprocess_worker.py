@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+
+"""預處理進程池子進程的 __main__ 模組
+
+forkserver 與 spawn 啟動的子進程會重新執行父進程的 __main__。
+以 python app.py 啟動時 __main__ 是 app.py，子進程會再建立一次 Flask 應用與任務佇列，
+因此進程池啟動子進程時改以這個不導入任何東西的模組作為 __main__。
+"""
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+"""由 OCR 文字框重建品項表格
+
+文字框依中心 y 座標分桶成列、依表頭位置分配到欄位（品名 / 數量 / 單價 / 金額），
+再以 數量 × 單價 ≈ 金額 驗證每一列。分桶與欄位分配都不需要排序整份文件（只排序有文字框的桶），
+耗時與文字框數量而不是頁面高度成正比，數百列的批發發票也只需幾毫秒。
+"""
+
+import re
+from bisect import bisect
+
+from invoice_parser import line_item_consistent
+
+ITEM_HEADERS = {
+    "name": ("品名", "品項", "Item"),
+    "quantity": ("數量", "数量", "Quantity", "Qty"),
+    "unit_price": ("單價", "单价", "Price"),
+    "amount": ("金額", "金额", "Amount"),
+}
+ITEM_ROLES = tuple(ITEM_HEADERS)
+ITEM_END_KEYWORDS = ('合計', '總計', '小計', '合计', '总计', '小计', 'Total', 'Sum')
+
+_HEADER_ROLES = {header: role for role, headers in ITEM_HEADERS.items() for header in headers}
+_HEADER_SCANNER = re.compile('|'.join(re.escape(header) for header in _HEADER_ROLES))
+_END_SCANNER = re.compile('|'.join(re.escape(keyword) for keyword in ITEM_END_KEYWORDS))
+_TOKEN_RE = re.compile(r'\S+')
+_NUMBER_RE = re.compile(r'^(?:NT)?\$?\d[\d,]*(?:\.\d+)?$')
+
+def split_box(box):
+    """把含有空白的文字框依字元位置拆成多個文字框（段落中的數字常被合併成一框）"""
+    tokens = list(_TOKEN_RE.finditer(box.text))
+    if len(tokens) <= 1:
+        return [box] if tokens else []
+    width = (box.x1 - box.x0) / len(box.text)
+    return [
+        box._replace(text=token.group(), x0=box.x0 + token.start() * width, x1=box.x0 + token.end() * width)
+        for token in tokens
+    ]
+
+def cluster_rows(boxes, line_height):
+    """依中心 y 座標分桶，相鄰且非空的桶合併為同一列
+
+    桶寬為半個行高，因此同一行略微傾斜的文字框會落在相鄰的桶；
+    合併後的列跨越超過一個行高時，依兩個桶為單位切開，避免行距很小時整段黏成一列。
+    """
+    if not boxes:
+        return []
+    size = max(line_height / 2, 1)
+    buckets = {}
+    for box in boxes:
+        buckets.setdefault(int((box.y0 + box.y1) / 2 // size), []).append(box)
+
+    # 只走訪有文字框的桶，不相鄰（中間有空桶）時結束目前的列
+    rows, current, span, previous = [], [], 0, None
+    for key in sorted(buckets):
+        if current and (key != previous + 1 or span == 2):
+            rows.append(current)
+            current, span = [], 0
+        current.extend(buckets[key])
+        span += 1
+        previous = key
+    if current:
+        rows.append(current)
+    return [sorted(row, key=lambda box: box.x0) for row in rows]
+
+def _row_text(row):
+    return ' '.join(box.text for box in row)
+
+def find_header(rows):
+    """找出表頭列，返回 (列索引, {欄位角色: 中心 x})；找不到時為 (None, None)
+
+    同一個文字框包含多個表頭時（例如段落「品名數量單價金額」），依字元位置估計各欄的 x。
+    """
+    for row_no, row in enumerate(rows):
+        columns = {}
+        for box in row:
+            length = len(box.text)
+            for match in _HEADER_SCANNER.finditer(box.text):
+                center = (match.start() + match.end()) / 2 / length
+                columns.setdefault(_HEADER_ROLES[match.group()], box.x0 + (box.x1 - box.x0) * center)
+        if "amount" in columns and len(columns) >= 2:
+            return row_no, columns
+    return None, None
+
+def _make_item(cells):
+    item = {role: ' '.join(cells.get(role, [])) for role in ITEM_ROLES}
+    item["validated"] = line_item_consistent(item["quantity"], item["unit_price"], item["amount"])
+    return item
+
+def _items_by_columns(rows, columns):
+    roles = sorted(columns, key=columns.get)
+    centers = [columns[role] for role in roles]
+    # 相鄰欄位中心的中點作為欄位邊界
+    boundaries = [(left + right) / 2 for left, right in zip(centers, centers[1:])]
+
+    items = []
+    for row in rows:
+        if _END_SCANNER.search(_row_text(row)):
+            break
+        cells = {}
+        for box in row:
+            role = roles[bisect(boundaries, (box.x0 + box.x1) / 2)]
+            cells.setdefault(role, []).append(box.text)
+        if "amount" in cells:
+            if "name" in cells or "quantity" in cells:
+                items.append(_make_item(cells))
+        elif "name" in cells and items and len(cells) == 1:
+            # 只有品名的列是上一個品項換行的名稱，以空白分隔換行前後的文字
+            continuation = ' '.join(cells["name"])
+            items[-1]["name"] = f'{items[-1]["name"]} {continuation}' if items[-1]["name"] else continuation
+    return items
+
+def _items_by_arithmetic(rows):
+    """沒有表頭時，以列尾三個數字是否滿足 數量 × 單價 ≈ 金額 判斷品項列"""
+    items = []
+    for row in rows:
+        if _END_SCANNER.search(_row_text(row)):
+            if items:
+                break
+            continue
+        texts = [box.text for box in row]
+        numbers = [i for i, text in enumerate(texts) if _NUMBER_RE.match(text)]
+        if len(numbers) < 3 or numbers[0] == 0:
+            continue
+        quantity, unit_price, amount = (texts[i] for i in numbers[-3:])
+        if line_item_consistent(quantity, unit_price, amount):
+            items.append({
+                "name": ' '.join(texts[:numbers[-3]]),
+                "quantity": quantity,
+                "unit_price": unit_price,
+                "amount": amount,
+                "validated": True
+            })
+    return items
+
+def extract_table_items(boxes, line_height):
+    """從文字框重建品項表格
+
+    Returns:
+        (品項列表, 信心度)；找不到表格時為 ([], None)
+    """
+    rows = cluster_rows([piece for box in boxes for piece in split_box(box)], line_height)
+    header_row, columns = find_header(rows)
+    if header_row is not None:
+        items = _items_by_columns(rows[header_row + 1:], columns)
+    else:
+        items = _items_by_arithmetic(rows)
+    if not items:
+        return [], None
+    # 欄位位置本身已可靠，驗證通過的比例越高信心度越高
+    validated = sum(item["validated"] for item in items) / len(items)
+    return items, round(0.6 + 0.35 * validated, 2)
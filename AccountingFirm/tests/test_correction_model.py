@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+from correction_model import CorrectionModel, train_correction_model
+from invoice_parser import tax_id_checksum_valid
+
+def _corrections(field, pairs, repeat=3):
+    return [
+        {"field_name": field, "original_value": original, "corrected_value": corrected}
+        for original, corrected in pairs
+        for _ in range(repeat)
+    ]
+
+def test_tax_id_checksum():
+    assert tax_id_checksum_valid("22099131")
+    assert tax_id_checksum_valid("04595257")
+    # 第 7 位為 7 的特例
+    assert tax_id_checksum_valid("10458575")
+    assert not tax_id_checksum_valid("22099181")
+    assert not tax_id_checksum_valid("2209913")
+    assert not tax_id_checksum_valid("2209913O")
+
+def test_learns_invoice_number_confusions():
+    model = train_correction_model(_corrections("invoice_number", [("ABO1234567", "AB01234567")]))
+    assert model.substitutions == {"invoice_number": {"O": "0"}}
+
+    result = {"invoice_number": "CDO7654321"}
+    applied = model.correct(result)
+    assert result["invoice_number"] == "CD07654321"
+    assert applied == [{"field_name": "invoice_number", "original_value": "CDO7654321",
+                        "corrected_value": "CD07654321"}]
+    assert result["auto_corrections"] == applied
+
+def test_valid_value_is_left_alone():
+    model = CorrectionModel({"invoice_number": {"1": "7"}})
+    result = {"invoice_number": "AB12345678"}
+    assert model.correct(result) == []
+    assert result["invoice_number"] == "AB12345678"
+
+def test_rejects_correction_that_does_not_fix_format():
+    model = CorrectionModel({"invoice_number": {"O": "Q"}})
+    result = {"invoice_number": "ABO1234567"}
+    assert model.correct(result) == []
+    assert result["invoice_number"] == "ABO1234567"
+
+def test_seller_tax_id_corrected_by_checksum():
+    model = train_correction_model(_corrections("seller_tax_id", [("22099181", "22099131")]))
+    assert model.substitutions["seller_tax_id"]["8"] == "3"
+
+    result = {"seller_tax_id": "22099181"}
+    model.correct(result)
+    assert result["seller_tax_id"] == "22099131"
+
+    # 檢查碼已正確的統編不會被改寫
+    result = {"seller_tax_id": "04595257"}
+    assert model.correct(result) == []
+
+def test_free_text_fields_are_never_rewritten():
+    # 即使反饋中學到中文字的替換，也不會套用到買受人與地址
+    corrections = _corrections("buyer", [("田版社", "出版社")]) + _corrections("address", [("田口路", "出口路")])
+    model = train_correction_model(corrections)
+    assert model.substitutions == {}
+
+    legacy = CorrectionModel({"buyer": {"出": "田"}, "address": {"出": "田"}})
+    result = {"buyer": "出版社", "address": "台北市出口路1號"}
+    assert legacy.correct(result) == []
+    assert result == {"buyer": "出版社", "address": "台北市出口路1號", "auto_corrections": []}
+
+def test_save_and_load_roundtrip(tmp_path):
+    model = CorrectionModel({"invoice_number": {"O": "0"}}, trained_at=1.0, samples=3)
+    path = tmp_path / "correction_model.json"
+    model.save(str(path))
+    loaded = CorrectionModel.load(str(path))
+    assert loaded.to_dict() == model.to_dict()
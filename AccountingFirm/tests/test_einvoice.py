@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+from einvoice import decode_einvoice, decode_qr_codes
+
+LEFT = ('AB12345678' '1130305' '1234' f"{95:08x}" f"{100:08x}" '00000000' '12345678' + 'A' * 24
+        + ':**********:3:3:1:咖啡:2:30:蛋糕:1:40')
+RIGHT = '**:茶:1:25'
+
+def _page(*texts):
+    """證明聯大小的白底圖像，QR Code 由左到右並排"""
+    encoder = cv2.QRCodeEncoder.create()
+    page = np.full((1400, 800), 255, np.uint8)
+    for i, text in enumerate(texts):
+        x = 60 + 380 * i
+        page[900:1200, x:x + 300] = cv2.resize(encoder.encode(text), (300, 300), interpolation=cv2.INTER_NEAREST)
+    return page
+
+def test_side_by_side_codes_are_both_decoded():
+    assert sorted(decode_qr_codes(_page(LEFT, RIGHT))) == sorted([LEFT, RIGHT])
+
+def test_left_code_alone_is_decoded():
+    assert decode_qr_codes(_page(LEFT)) == [LEFT]
+
+def test_blank_page_has_no_codes():
+    assert decode_qr_codes(np.full((1400, 800), 255, np.uint8)) == []
+
+def test_decode_einvoice_joins_items_from_both_codes():
+    result = decode_einvoice(cv2.imencode('.png', _page(LEFT, RIGHT))[1].tobytes())
+    assert result["invoice_number"] == "AB12345678"
+    assert result["date"] == "2024/03/05"
+    assert result["total_amount"] == "100.00"
+    assert [item["name"] for item in result["items"]] == ["咖啡", "蛋糕", "茶"]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+from layout_parser import LayoutParser, _LABEL_SCANNER
+
+def _box(text, x0, y0, width=None, height=20):
+    x1 = x0 + (width if width is not None else 20 * len(text))
+    return {'text': text, 'bounding_box': [(x0, y0), (x1, y0), (x1, y0 + height), (x0, y0 + height)]}
+
+def test_label_scanner_prefers_printed_labels():
+    assert [m.group() for m in _LABEL_SCANNER.finditer("買受人註記欄")] == ["買受人註記欄"]
+    assert [m.group() for m in _LABEL_SCANNER.finditer("買受人:")] == ["買受人"]
+
+def test_buyer_annotation_label_is_not_a_buyer():
+    # 「買受人註記欄」在同一個文字框，或被切成兩個文字框
+    for layout in (
+        [_box("買受人註記欄", 10, 10), _box("|", 140, 10)],
+        [_box("買受人", 10, 10), _box("註記欄之註記方法", 70, 10)],
+    ):
+        assert LayoutParser(layout).extract_all()["buyer"] is None
+
+def test_buyer_right_of_label():
+    layout = [_box("買受人:", 10, 10), _box("德出企業有限公司", 90, 10)]
+    assert LayoutParser(layout).extract_all()["buyer"] == "德出企業有限公司"
+
+def test_total_amount_skips_change_and_out_of_range_values():
+    layout = [
+        _box("找零現金", 10, 10), _box("50", 100, 10),
+        _box("總計", 10, 40), _box("2,000,000", 60, 40),
+        _box("合計", 10, 70), _box("1,250", 60, 70),
+    ]
+    result = LayoutParser(layout).extract_all()
+    assert result["total_amount"] == "1250.00"
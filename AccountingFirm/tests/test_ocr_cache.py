@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+
+from ocr_cache import OCR_CACHE_FORMAT, OCRCache, make_cache_key
+
+def _table_totals(cache):
+    return cache._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()
+
+def test_key_includes_format_version():
+    assert make_cache_key(b"image", "layout").startswith(f"v{OCR_CACHE_FORMAT}:")
+    assert make_cache_key(b"image", "layout") != make_cache_key(b"image", "text")
+
+def test_running_totals_follow_inserts_overwrites_and_evictions(tmp_path):
+    cache = OCRCache(str(tmp_path / "cache.sqlite3"), max_entries=3, max_bytes=10_000)
+    for i in range(5):
+        cache.put(f"k{i}", {"text": "x" * i})
+    cache.put("k4", {"text": "longer text"})
+    assert _table_totals(cache) == cache._totals()
+    assert cache.stats()["entries"] == 3
+    cache.clear()
+    assert cache._totals() == (0, 0)
+
+def test_recent_hits_survive_eviction(tmp_path):
+    cache = OCRCache(str(tmp_path / "cache.sqlite3"), max_entries=2, max_bytes=10_000)
+    cache.put("old", {"text": "a"})
+    cache.put("new", {"text": "b"})
+    # 命中的存取時間還在記憶體中，淘汰前會先寫入
+    assert cache.get("old") == {"text": "a"}
+    cache.put("newest", {"text": "c"})
+    assert cache.get("old") is not None
+    assert cache.get("new") is None
+
+def test_existing_database_is_counted_on_open(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE ocr_cache (key TEXT PRIMARY KEY, result TEXT NOT NULL, size INTEGER NOT NULL, "
+                 "created_at REAL NOT NULL, last_access REAL NOT NULL)")
+    conn.executemany("INSERT INTO ocr_cache VALUES (?, '{}', ?, 0, 0)", [("a", 10), ("b", 20)])
+    conn.commit()
+    conn.close()
+    assert OCRCache(path)._totals() == (2, 30)
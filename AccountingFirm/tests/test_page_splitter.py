@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+import io
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+Image = pytest.importorskip("PIL.Image")
+
+from page_splitter import is_multi_page, single_page_image
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def _pdf(pages):
+    with fitz.open() as doc:
+        for _ in range(pages):
+            doc.new_page(width=200, height=300)
+        return doc.tobytes()
+
+def _tiff(frames):
+    buffer = io.BytesIO()
+    images = [Image.new('RGB', (20, 20), 'white') for _ in range(frames)]
+    images[0].save(buffer, 'TIFF', save_all=True, append_images=images[1:])
+    return buffer.getvalue()
+
+def test_single_page_files_are_not_split():
+    assert not is_multi_page(_pdf(1), 'pdf')
+    assert not is_multi_page(_tiff(1), 'tiff')
+    assert not is_multi_page(b'', 'png')
+
+def test_multi_page_files_are_split():
+    assert is_multi_page(_pdf(2), 'pdf')
+    assert is_multi_page(_tiff(3), 'tiff')
+
+def test_single_page_pdf_is_rasterized():
+    assert single_page_image(_pdf(1), 'pdf').startswith(PNG_SIGNATURE)
+    assert single_page_image(b'image', 'png') == b'image'
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+from layout_parser import Box
+from table_parser import cluster_rows, extract_table_items
+
+def _box(text, x0, y0, width=40, height=20):
+    return Box(text, x0, y0, x0 + width, y0 + height)
+
+def test_continuation_row_is_joined_with_a_space():
+    boxes = [
+        _box("品名", 10, 0), _box("數量", 300, 0), _box("單價", 400, 0), _box("金額", 500, 0),
+        _box("Organic", 10, 30, 80), _box("2", 310, 30, 10), _box("30", 400, 30), _box("60", 500, 30),
+        _box("coffee", 10, 60, 80),
+        _box("合計", 10, 90),
+    ]
+    items, _ = extract_table_items(boxes, 20)
+    assert [item["name"] for item in items] == ["Organic coffee"]
+
+def test_rows_far_apart_are_clustered_by_occupied_buckets():
+    boxes = [_box("a", 10, 0), _box("b", 60, 3), _box("c", 10, 10_000_000)]
+    rows = cluster_rows(boxes, 20)
+    assert [[box.text for box in row] for row in rows] == [["a", "b"], ["c"]]
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import io
+import os
+from collections import namedtuple
+
+CHUNK_SIZE = 256 * 1024
+
+# 文件開頭的魔術位元組 → 格式
+MAGIC_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+    (b'%PDF-', 'pdf'),
+]
+# 能交給 PIL 檢查檔頭的格式
+PIL_FORMATS = {'png', 'jpeg', 'gif', 'tiff'}
+
+IngestResult = namedtuple('IngestResult', ['size', 'sha256', 'format', 'path', 'content'])
+
+class UploadTooLarge(ValueError):
+    pass
+
+class InvalidUpload(ValueError):
+    pass
+
+def sniff_format(head):
+    """依文件開頭的魔術位元組判斷格式，無法辨識時返回 None"""
+    for signature, fmt in MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return fmt
+    return None
+
+def verify_header(fmt, content=None, path=None):
+    """以 PIL 讀取檔頭確認圖像可解析；Image.open 只讀取檔頭，不會解碼整張圖"""
+    if fmt not in PIL_FORMATS or (content is None and path is None):
+        return
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(content) if content is not None else path) as image:
+            if image.width <= 0 or image.height <= 0:
+                raise InvalidUpload("圖像尺寸無效")
+    except InvalidUpload:
+        raise
+    except Exception as e:
+        raise InvalidUpload(f"無法解析圖像檔頭: {str(e)}")
+
+def ingest_upload(stream, max_size, dest_path=None, keep_content=True):
+    """單次分塊讀取上傳內容：同時計算 SHA-256、檢查大小、判斷格式並寫入磁碟
+
+    Args:
+        stream: 上傳文件的串流（FileStorage.stream）
+        max_size: 大小上限，超過時立即停止讀取
+        dest_path: 寫入的路徑，None 時不寫入磁碟
+        keep_content: 是否保留內容供記憶體中的後續處理
+
+    Returns:
+        IngestResult
+
+    Raises:
+        UploadTooLarge: 超過大小上限
+        InvalidUpload: 無法辨識格式或檔頭無效
+    """
+    digest = hashlib.sha256()
+    chunks = [] if keep_content else None
+    size = 0
+    fmt = None
+    out = open(dest_path + '.part', 'wb') if dest_path else None
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if size == 0:
+                fmt = sniff_format(chunk)
+                if fmt is None:
+                    raise InvalidUpload("無法辨識的文件格式")
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLarge(f"文件超過 {max_size} 位元組")
+            digest.update(chunk)
+            if out:
+                out.write(chunk)
+            if chunks is not None:
+                chunks.append(chunk)
+        if size == 0:
+            raise InvalidUpload("空白文件")
+    except Exception:
+        if out:
+            out.close()
+            os.remove(dest_path + '.part')
+        raise
+
+    content = b''.join(chunks) if chunks is not None else None
+    if out:
+        out.close()
+    try:
+        verify_header(fmt, content=content, path=dest_path + '.part' if out else None)
+    except InvalidUpload:
+        if out:
+            os.remove(dest_path + '.part')
+        raise
+    if out:
+        os.replace(dest_path + '.part', dest_path)
+
+    return IngestResult(size, digest.hexdigest(), fmt, dest_path, content)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""離線測試用的 Vision client 替身
+
+用法：
+    from ocr_service import set_vision_client
+    set_vision_client(StubVisionClient(text="統一發票 ..."))
+"""
+
+import time
+from types import SimpleNamespace
+
+class StubVisionClient:
+    """模擬 vision.ImageAnnotatorClient 的回應格式，不連網
+
+    Args:
+        text: 每次辨識返回的文字
+        latency: 模擬每次 API 呼叫的延遲（秒）
+        setup_cost: 模擬建立 client（通道、憑證）的耗時（秒）
+    """
+
+    def __init__(self, text="", latency=0.0, setup_cost=0.0):
+        if setup_cost:
+            time.sleep(setup_cost)
+        self.text = text
+        self.latency = latency
+        self.calls = 0
+
+    def _respond(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._response()
+
+    def _response(self):
+        return SimpleNamespace(
+            error=SimpleNamespace(message=""),
+            text_annotations=[SimpleNamespace(description=self.text, bounding_poly=SimpleNamespace(vertices=[]))]
+            if self.text else [],
+            full_text_annotation=SimpleNamespace(text=self.text, pages=[])
+        )
+
+    def text_detection(self, image=None, retry=None, timeout=None, **kwargs):
+        return self._respond()
+
+    def document_text_detection(self, image=None, retry=None, timeout=None, **kwargs):
+        return self._respond()
+
+    def batch_annotate_images(self, requests=None, retry=None, timeout=None, **kwargs):
+        # 一次呼叫只付一次延遲，模擬批次請求省下的往返時間
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        responses = [self._response() for _ in requests or []]
+        return SimpleNamespace(responses=responses)
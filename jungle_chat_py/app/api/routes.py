@@ -82,4 +82,11 @@ async def get_knowledge_base_info():
         return {
             "status": "error",
             "message": str(e)
-        } 
\ No newline at end of file
+        } 
+
+@router.get("/chat/cache-stats")
+async def get_cache_stats():
+    return {
+        "status": "success",
+        **ai_service.vector_store.cache_stats()
+    }
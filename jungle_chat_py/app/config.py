@@ -13,4 +13,29 @@ class Settings:
     # 向量维度设置
     VECTOR_DIMENSION = 768  # all-mpnet-base-v2 模型的维度
     
+    # 向量索引后端：pinecone 或 local（本地索引，不需要网络连接）
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+    LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", os.path.join("data", "vector_index"))
+    
+    # 查询向量缓存（EMBEDDING_CACHE_PATH 为空时只缓存在内存）与检索结果缓存
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join("data", "embedding_cache.sqlite3"))
+    # 持久层最多保留的向量数（超过时删除最久未使用的），0 表示不限制
+    EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "20000"))
+    RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "256"))
+    RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+    
+    # 批量导入：每批嵌入的文档数与每次 upsert 的向量数
+    INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))
+    INGEST_UPSERT_BATCH_SIZE = int(os.getenv("INGEST_UPSERT_BATCH_SIZE", "100"))
+    
+    # 异步对话流程：嵌入线程数、同时进行的 LLM 请求数上限与单次请求超时（秒）
+    EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "4"))
+    LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+    
+    # 知识库同步清单：记录每个来源条目当前写入索引的向量 ID（每个索引各用一份）
+    # 留空时依索引决定：本地索引存放在索引目录中，Pinecone 为 data/kb_manifest_<索引名>.json
+    KB_MANIFEST_PATH = os.getenv("KB_MANIFEST_PATH", "")
+    
 settings = Settings() 
\ No newline at end of file
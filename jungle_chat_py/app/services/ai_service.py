@@ -1,5 +1,6 @@
 import google.generativeai as genai
 from app.services.vector_store import VectorStore
+from app.services.knowledge_base import make_document
 from app.config import settings
 import traceback
 from datetime import datetime
@@ -17,9 +18,22 @@ class AIService:
             # 使用 gemini-1.5-pro 替代 gemini-pro
             self.model = genai.GenerativeModel('gemini-1.5-pro')
             
-            # 檢查知識庫是否為空
-            if self.vector_store.get_document_count() == 0:
-                asyncio.create_task(self.initialize_knowledge_base())
+            # 限制同時進行的 LLM 請求數，超出的請求在此排隊而不是一起等 API 限流
+            self.llm_semaphore = asyncio.Semaphore(settings.LLM_CONCURRENCY)
+            
+            # 檢查知識庫是否為空；無法取得數量時不要當作空的（get_document_count 出錯時返回 0）
+            try:
+                needs_seed = self.vector_store.backend.count() == 0
+            except Exception as e:
+                print(f"Skipping knowledge base initialization: {e}")
+                needs_seed = False
+            if needs_seed:
+                try:
+                    # 保留任務的引用，避免任務在完成前被回收
+                    self._seed_task = asyncio.get_running_loop().create_task(self.initialize_knowledge_base())
+                except RuntimeError:
+                    # 在事件循環外建立（例如腳本中）時直接執行
+                    asyncio.run(self.initialize_knowledge_base())
             
         except Exception as e:
             print(f"Error initializing AI Service: {str(e)}")
@@ -28,7 +42,7 @@ class AIService:
     async def generate_response(self, message: str, chat_history: list = None):
         try:
             print(f"Searching for similar docs for message: {message}")
-            docs = self.vector_store.search_similar(message)
+            docs = await self.vector_store.asearch_similar(message)
             print(f"Found {len(docs)} similar documents")
             
             context = "\n".join([doc.page_content for doc in docs])
@@ -45,7 +59,8 @@ class AIService:
             
             try:
                 chat = self.model.start_chat(history=[])
-                response = chat.send_message(prompt)
+                async with self.llm_semaphore:
+                    response = await asyncio.wait_for(chat.send_message_async(prompt), settings.LLM_TIMEOUT)
                 
                 if response.text:
                     return {
@@ -60,6 +75,13 @@ class AIService:
                         "source_documents": []
                     }
                     
+            except asyncio.TimeoutError:
+                print(f"Chat generation timed out after {settings.LLM_TIMEOUT}s")
+                return {
+                    "response": "抱歉，回答時間過長。請稍後再試。",
+                    "confidence_score": 0,
+                    "source_documents": []
+                }
             except Exception as e:
                 print(f"Error in chat generation: {str(e)}")
                 return {
@@ -79,7 +101,8 @@ class AIService:
             }
     
     async def learn_from_conversation(self, message: str, metadata: dict):
-        self.vector_store.add_conversation(message, metadata)
+        # 嵌入與寫入是阻塞的，放到執行緒中
+        await asyncio.to_thread(self.vector_store.add_conversation, message, metadata)
     
     async def initialize_knowledge_base(self):
         """初始化知識庫的基本問答對"""
@@ -131,12 +154,17 @@ class AIService:
             }
         ]
         
+        documents = []
         for qa in basic_qa:
-            await self.learn_from_conversation(
-                f"Q: {qa['question']}\nA: {qa['answer']}", 
-                {
-                    "category": qa["category"],
-                    "type": "initial_training",
-                    "timestamp": datetime.now().isoformat()
-                }
-            ) 
\ No newline at end of file
+            # ID 由問題與內容決定（不含時間戳），重複初始化只會覆寫相同的向量
+            doc = make_document(
+                "initial_training",
+                qa["question"],
+                f"Q: {qa['question']}\nA: {qa['answer']}",
+                {"category": qa["category"], "type": "initial_training"}
+            )
+            doc["metadata"]["timestamp"] = datetime.now().isoformat()
+            documents.append(doc)
+        # 一次批量嵌入與寫入，放到執行緒中避免阻塞事件循環
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.vector_store.add_documents, documents) 
\ No newline at end of file
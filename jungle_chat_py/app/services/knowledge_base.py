@@ -1,60 +1,199 @@
-from app.services.vector_store import VectorStore
+import hashlib
+import json
+import os
 
-class KnowledgeBase:
-    def __init__(self):
-        self.vector_store = VectorStore()
-    
-    def add_product_info(self, products):
-        """添加产品信息到知识库"""
-        for product in products:
-            content = f"""
+from app.config import settings
+from app.services.vector_backends import LocalVectorIndex
+
+def document_id(source_type, source_id, text, metadata):
+    """由来源类型、来源 ID 与内容哈希得到固定的向量 ID
+
+    重复导入相同内容时写入同一个 ID（覆盖而不是新增），内容改变时 ID 也随之改变。
+    Pinecone 的 ID 只能是 ASCII，非 ASCII 的来源 ID（例如问题文字）以哈希代替。
+    """
+    source_id = str(source_id)
+    if not source_id.isascii() or len(source_id) > 64:
+        source_id = hashlib.sha1(source_id.encode("utf-8")).hexdigest()[:16]
+    content = json.dumps({"text": text, "metadata": metadata}, sort_keys=True, ensure_ascii=False)
+    return f"{source_type}-{source_id}-{hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]}"
+
+def make_document(source_type, source_id, text, metadata):
+    """组成带有固定 ID 的文档，key 是来源条目在同步清单中的键"""
+    return {
+        "id": document_id(source_type, source_id, text, metadata),
+        "key": f"{source_type}:{source_id}",
+        "text": text,
+        "metadata": metadata
+    }
+
+def product_document(product):
+    """产品信息转为待嵌入的文档"""
+    content = f"""
             产品名称: {product['name']}
             价格: {product['price']}
             描述: {product['description']}
             库存: {product['stock']}
             规格: {product['specifications']}
             """
-            
-            self.vector_store.add_conversation(
-                message=content,
-                metadata={
-                    "type": "product",
-                    "product_id": product["id"],
-                    "category": product["category"]
-                }
-            )
-            print(f"Added product: {product['name']}")
-    
-    def add_faq(self, faqs):
-        """添加常见问题到知识库"""
-        for faq in faqs:
-            content = f"""
+    return make_document("product", product["id"], content, {
+        "type": "product",
+        "product_id": product["id"],
+        "category": product["category"]
+    })
+
+def faq_document(faq):
+    """常见问题转为待嵌入的文档"""
+    content = f"""
             问题: {faq['question']}
             答案: {faq['answer']}
             """
-            
-            self.vector_store.add_conversation(
-                message=content,
-                metadata={
-                    "type": "faq",
-                    "category": faq["category"]
-                }
-            )
-            print(f"Added FAQ: {faq['question']}")
-    
-    def add_policy(self, policies):
-        """添加政策信息到知识库"""
-        for policy in policies:
-            content = f"""
+    return make_document("faq", faq["question"], content, {
+        "type": "faq",
+        "category": faq["category"]
+    })
+
+def policy_document(policy):
+    """政策信息转为待嵌入的文档"""
+    content = f"""
             政策名称: {policy['name']}
             内容: {policy['content']}
             """
-            
-            self.vector_store.add_conversation(
-                message=content,
-                metadata={
-                    "type": "policy",
-                    "category": policy["category"]
-                }
-            )
-            print(f"Added policy: {policy['name']}") 
\ No newline at end of file
+    return make_document("policy", policy["name"], content, {
+        "type": "policy",
+        "category": policy["category"]
+    })
+
+# 来源类型 -> (data 目录中的文件, 转换函数)
+KB_SOURCES = {
+    "product": ("products.json", product_document),
+    "faq": ("faqs.json", faq_document),
+    "policy": ("policies.json", policy_document),
+}
+
+def load_source_documents(data_dir="data"):
+    """读取 data 目录中存在的来源文件，返回 {来源类型: 文档列表}"""
+    sources = {}
+    for source_type, (file_name, to_document) in KB_SOURCES.items():
+        path = os.path.join(data_dir, file_name)
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            sources[source_type] = [to_document(item) for item in json.load(f)]
+    return sources
+
+def default_manifest_path(backend):
+    """同步清单的位置：KB_MANIFEST_PATH，未设置时每个索引各用一份"""
+    if settings.KB_MANIFEST_PATH:
+        return settings.KB_MANIFEST_PATH
+    if isinstance(backend, LocalVectorIndex):
+        # 放在索引目录中，删除索引时清单也一起删除
+        return os.path.join(backend.path, "kb_manifest.json")
+    return os.path.join("data", f"kb_manifest_{backend.index_name}.json")
+
+def load_manifest(path, index_name):
+    """读取同步清单，清单属于其他索引时拒绝使用
+
+    清单记录的是另一个索引中的向量 ID，套用到当前索引会把未写入的条目当成未改变。
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("index") != index_name:
+        raise ValueError(f"Manifest {path} belongs to index {data.get('index')!r}, not {index_name!r}; "
+                         f"delete it or point KB_MANIFEST_PATH to this index's manifest")
+    return data["entries"]
+
+def save_manifest(manifest, path, index_name):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"index": index_name, "entries": manifest}, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def diff_manifest(manifest, sources):
+    """比较同步清单与来源文档
+
+    只比较 sources 中出现的来源类型，缺少的来源文件不会导致该类型的向量被删除。
+    多个条目的 key 相同时（例如重复的问题）只保留第一个，重复的 key 记在 stats["duplicates"]。
+
+    Returns:
+        (需要写入的文档, 需要删除的向量 ID, 新的清单, 统计)
+    """
+    current, duplicates = {}, []
+    for documents in sources.values():
+        for doc in documents:
+            if doc["key"] in current:
+                duplicates.append(doc["key"])
+                continue
+            current[doc["key"]] = doc
+    synced_prefixes = tuple(f"{source_type}:" for source_type in sources)
+
+    to_upsert, to_delete = [], []
+    stats = {"added": 0, "updated": 0, "unchanged": 0, "deleted": 0, "duplicates": sorted(set(duplicates))}
+    for key, doc in current.items():
+        old_id = manifest.get(key)
+        if old_id == doc["id"]:
+            stats["unchanged"] += 1
+            continue
+        to_upsert.append(doc)
+        if old_id is None:
+            stats["added"] += 1
+        else:
+            # 内容改变后 ID 不同，旧的向量需要删除
+            to_delete.append(old_id)
+            stats["updated"] += 1
+    for key, old_id in manifest.items():
+        if key not in current and key.startswith(synced_prefixes):
+            to_delete.append(old_id)
+            stats["deleted"] += 1
+
+    new_manifest = {
+        key: old_id for key, old_id in manifest.items() if not key.startswith(synced_prefixes)
+    }
+    new_manifest.update({key: doc["id"] for key, doc in current.items()})
+    return to_upsert, to_delete, new_manifest, stats
+
+class KnowledgeBase:
+    def __init__(self):
+        # VectorStore 会加载嵌入模型（langchain），只在建立知识库时才导入，同步清单等函数不依赖它
+        from app.services.vector_store import VectorStore
+        self.vector_store = VectorStore()
+    
+    def add_product_info(self, products, **batch_options):
+        """添加产品信息到知识库（批量嵌入与写入，batch_options 传给 VectorStore.add_documents）"""
+        return self.vector_store.add_documents([product_document(product) for product in products], **batch_options)
+    
+    def add_faq(self, faqs, **batch_options):
+        """添加常见问题到知识库"""
+        return self.vector_store.add_documents([faq_document(faq) for faq in faqs], **batch_options)
+    
+    def add_policy(self, policies, **batch_options):
+        """添加政策信息到知识库"""
+        return self.vector_store.add_documents([policy_document(policy) for policy in policies], **batch_options)
+    
+    def sync(self, data_dir="data", manifest_path=None, **batch_options):
+        """将 data 目录同步到知识库：只嵌入与写入新增或改变的条目，删除已移除条目的向量"""
+        backend = self.vector_store.backend
+        manifest_path = manifest_path or default_manifest_path(backend)
+        manifest = load_manifest(manifest_path, backend.name)
+        if manifest and backend.count() == 0:
+            # 索引被清空或重建过，清单中的向量都已不存在
+            print(f"Index {backend.name} is empty, ignoring manifest {manifest_path}")
+            manifest = {}
+        to_upsert, to_delete, new_manifest, stats = diff_manifest(manifest, load_source_documents(data_dir))
+        if stats["duplicates"]:
+            print(f"Warning: duplicate knowledge base keys, only the first entry is synced: "
+                  f"{', '.join(stats['duplicates'])}")
+        print(f"Sync plan: {stats['added']} added, {stats['updated']} updated, "
+              f"{stats['unchanged']} unchanged, {stats['deleted']} deleted")
+        
+        # 先写入新的向量再删除旧的，中途失败时清单不变，下次同步会重试
+        if to_upsert:
+            stats.update(self.vector_store.add_documents(to_upsert, **batch_options))
+        if to_delete:
+            self.vector_store.delete(to_delete)
+        save_manifest(new_manifest, manifest_path, backend.name)
+        return stats
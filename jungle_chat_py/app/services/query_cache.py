@@ -0,0 +1,210 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# 句尾標點不影響語意（「每坪租金是多少？」與「每坪租金是多少」視為同一個問題）
+_TRAILING_PUNCTUATION = "?？!！。.～~ "
+
+def normalize_query(text: str) -> str:
+    """將問題正規化為快取鍵：全形轉半形、合併空白、去掉句尾標點
+
+    嵌入的是正規化後的文字，因此只做不改變語意的正規化；嵌入模型區分大小寫，不轉小寫。
+    """
+    text = unicodedata.normalize("NFKC", text)
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+class EmbeddingCache:
+    """查詢向量的快取：記憶體 LRU，加上可選的 SQLite 持久層（重啟後仍可命中）
+
+    Args:
+        max_entries: 記憶體中最多保留的向量數
+        path: SQLite 文件路徑，None 或空字串時不持久化
+        model: 嵌入模型名稱，持久層依模型區分，換模型後不會讀到舊的向量
+        max_rows: 持久層最多保留的向量數，超過時刪除最久未使用的；0 表示不限制
+    """
+
+    def __init__(self, max_entries: int = 1024, path: Optional[str] = None, model: str = "",
+                 max_rows: int = 20000):
+        self.max_entries = max_entries
+        self.model = model
+        self.max_rows = max_rows
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+        self._conn = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_access REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (model, key)
+                )
+            """)
+            # 舊版資料庫沒有 last_access 欄位，既有的向量視為最舊
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")}
+            if "last_access" not in columns:
+                self._conn.execute("ALTER TABLE embeddings ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_access ON embeddings(last_access)")
+            self._conn.commit()
+            self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _remember(self, key: str, vector: List[float]):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND key = ?", (self.model, key)
+                ).fetchone()
+                if row is not None:
+                    vector = array("f", row[0]).tolist()
+                    self._remember(key, vector)
+                    self.persistent_hits += 1
+                    # 只有記憶體中沒有時才會讀到持久層，更新存取時間的次數不多
+                    self._conn.execute(
+                        "UPDATE embeddings SET last_access = ? WHERE model = ? AND key = ?",
+                        (time.time(), self.model, key)
+                    )
+                    self._conn.commit()
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, key: str, vector: List[float]):
+        vector = list(vector)
+        with self._lock:
+            self._remember(key, vector)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, key, vector, last_access) VALUES (?, ?, ?, ?)",
+                    (self.model, key, array("f", vector).tobytes(), time.time())
+                )
+                # 覆寫既有的鍵也計入，只會讓實際計數提早一點進行
+                self._rows += 1
+                if self.max_rows and self._rows > self.max_rows:
+                    self._prune()
+                self._conn.commit()
+
+    def _prune(self):
+        """持久層超過 max_rows 時刪除最久未使用的向量（呼叫時需持有 self._lock）
+
+        計數只在記憶體中的估計值超過上限時才實際查詢；一次多刪除 10%，不必每次寫入都清理。
+        其他程序寫入的向量在這裡重新計數時才會算進來。
+        """
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._rows - self.max_rows
+        if excess > 0:
+            excess += self.max_rows // 10
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)", (excess,)
+            )
+            self._rows -= excess
+
+    def get_or_compute(self, key: str, compute: Callable[[], List[float]]) -> List[float]:
+        vector = self.get(key)
+        if vector is None:
+            vector = compute()
+            self.put(key, vector)
+        return vector
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.persistent_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.persistent_hits) / lookups if lookups else 0.0
+            }
+
+class RetrievalCache:
+    """檢索結果的快取，鍵包含索引版本：索引有寫入後舊的結果自動失效
+
+    本地索引會偵測其他程序的寫入並改變版本；Pinecone 無法得知其他程序
+    （例如訓練腳本）的寫入，這類變更最多在存活時間後才會反映。
+
+    Args:
+        max_entries: 最多保留的結果數
+        ttl: 結果的存活秒數
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query: str, k: int, filter: Optional[Dict[str, Any]]) -> tuple:
+        return query, k, json.dumps(filter, sort_keys=True, ensure_ascii=False) if filter else None
+
+    def _check_version(self, version):
+        # 版本改變時整個快取失效
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key: tuple, version) -> Optional[list]:
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, version, results: list):
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "version": self._version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
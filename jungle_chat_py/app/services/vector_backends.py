@@ -0,0 +1,473 @@
+import asyncio
+import json
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只能在單一程序內使用本地索引
+    fcntl = None
+
+@dataclass
+class Match:
+    id: str
+    score: float
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+class VectorBackend:
+    """向量索引後端介面，VectorStore 只透過這些方法存取索引
+
+    version 在索引改變後改變，用於讓檢索結果的快取失效；非同步檢索會在事件循環中讀取，不能阻塞。
+    name 識別索引本身（後端類型加上索引名稱或目錄），知識庫同步清單用它確認屬於哪個索引。
+    """
+
+    version = 0
+    name = ""
+
+    def upsert(self, vectors: List[Dict[str, Any]]) -> None:
+        """新增或覆寫向量，每筆為 {"id", "values", "metadata"}"""
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]) -> None:
+        raise NotImplementedError
+
+    def query(self, vector: List[float], top_k: int = 3, filter: Optional[Dict[str, Any]] = None) -> List[Match]:
+        """以 cosine 相似度搜尋，filter 使用 Pinecone 的 metadata 過濾語法"""
+        raise NotImplementedError
+
+    async def aquery(self, vector: List[float], top_k: int = 3, filter: Optional[Dict[str, Any]] = None) -> List[Match]:
+        """非同步查詢，預設在執行緒中執行 query（Pinecone 的 HTTP 請求不會阻塞事件循環）"""
+        return await asyncio.to_thread(self.query, vector, top_k, filter)
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def list_recent(self, limit: int = 5) -> List[Match]:
+        raise NotImplementedError
+
+class PineconeBackend(VectorBackend):
+    """Pinecone serverless 索引"""
+
+    def __init__(self, index_name: str = "customer-service", dimension: int = settings.VECTOR_DIMENSION):
+        from pinecone import Pinecone
+
+        print("Initializing Pinecone...")
+        self.pc = Pinecone(
+            api_key=settings.PINECONE_API_KEY,
+            environment=settings.PINECONE_ENV
+        )
+        print("Pinecone initialized successfully")
+
+        self.index_name = index_name
+        self.name = f"pinecone:{index_name}"
+        self.dimension = dimension
+
+        # 檢查索引是否存在
+        if self.index_name not in self.pc.list_indexes().names():
+            print(f"Creating new index: {self.index_name}")
+            self.pc.create_index(
+                name=self.index_name,
+                spec={
+                    "serverless": {
+                        "cloud": "aws",
+                        "region": "us-east-1"
+                    }
+                },
+                dimension=dimension,
+                metric="cosine"
+            )
+
+        self.index = self.pc.Index(self.index_name)
+        print("Index stats:", self.index.describe_index_stats())
+
+    @staticmethod
+    def _to_matches(results) -> List[Match]:
+        return [Match(match.id, match.score, dict(match.metadata or {})) for match in results.matches]
+
+    def upsert(self, vectors):
+        self.index.upsert(vectors=vectors)
+        self.version += 1
+
+    def delete(self, ids):
+        self.index.delete(ids=ids)
+        self.version += 1
+
+    def query(self, vector, top_k=3, filter=None):
+        return self._to_matches(self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True,
+            filter=filter
+        ))
+
+    def count(self):
+        return self.index.describe_index_stats().total_vector_count
+
+    def list_recent(self, limit=5):
+        # Pinecone 沒有依時間列出的功能，以零向量查詢取得任意幾筆
+        return self._to_matches(self.index.query(
+            vector=[0] * self.dimension,
+            top_k=limit,
+            include_metadata=True
+        ))
+
+def matches_filter(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """判斷 metadata 是否符合 Pinecone 風格的過濾條件
+
+    支援 {"欄位": 值}、$eq / $ne / $in / $nin / $gt / $gte / $lt / $lte，以及 $and / $or。
+    """
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, expected in condition.items():
+            if op == "$eq":
+                ok = value == expected
+            elif op == "$ne":
+                ok = value != expected
+            elif op == "$in":
+                ok = value in expected
+            elif op == "$nin":
+                ok = value not in expected
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                ok = {
+                    "$gt": value > expected,
+                    "$gte": value >= expected,
+                    "$lt": value < expected,
+                    "$lte": value <= expected,
+                }[op]
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+            if not ok:
+                return False
+    return True
+
+class LocalVectorIndex(VectorBackend):
+    """本地向量索引：正規化後的向量存放在記憶體映射的 .npy 矩陣，metadata 存放在只附加的 JSON Lines 記錄
+
+    查詢是一次矩陣乘法加上 argpartition，數千筆向量只需不到一毫秒，
+    也不需要網路連線。刪除的位置會在之後的新增中重複使用。
+
+    每次新增或刪除只在 meta.jsonl 附加對應的行（{"slot", "id", "seq", "metadata"}，刪除時 id 為 null），
+    不重寫整份 metadata；擴大矩陣或過期的行太多時才重寫一份只含現有向量的記錄。
+
+    多個程序（例如服務與訓練腳本）可以共用同一個目錄：寫入時持有檔案排他鎖，
+    並先套用其他程序附加的記錄；讀取時持有共享鎖，只讀取上次之後新附加的部分。
+
+    Args:
+        path: 索引目錄（vectors.npy、meta.jsonl 與 .lock）
+        dimension: 向量維度
+    """
+
+    def __init__(self, path: str = settings.LOCAL_INDEX_PATH, dimension: int = settings.VECTOR_DIMENSION,
+                 initial_capacity: int = 1024):
+        self.path = path
+        self.name = f"local:{os.path.abspath(path)}"
+        self.dimension = dimension
+        self._vectors_path = os.path.join(path, "vectors.npy")
+        self._log_path = os.path.join(path, "meta.jsonl")
+        self._lock = threading.RLock()
+        self._filter_masks: Dict[str, tuple] = {}
+        self._log_file = None
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, ".lock"), "a+")
+
+        with self._lock, self._file_lock(exclusive=True):
+            if os.path.exists(self._log_path):
+                self._load()
+                return
+            legacy_path = os.path.join(path, "meta.json")
+            if os.path.exists(legacy_path):
+                # 舊版索引的 metadata 是整份 JSON，轉換為記錄後刪除
+                self._reset(np.load(self._vectors_path, mmap_mode="r+"))
+                with open(legacy_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                self._check_dimension(meta["dimension"])
+                for slot, vector_id in enumerate(meta["ids"]):
+                    if vector_id is not None:
+                        self._apply({"slot": slot, "id": vector_id, "seq": meta["seq"][slot],
+                                     "metadata": meta["metadata"][slot]})
+                self._compact()
+                os.remove(legacy_path)
+            else:
+                self._reset(np.lib.format.open_memmap(
+                    self._vectors_path, mode="w+", dtype=np.float32, shape=(initial_capacity, dimension)))
+                self._compact()
+
+    @property
+    def version(self):
+        # 只讀取記錄文件的 inode、大小與修改時間，不取鎖也不載入，可以在事件循環中呼叫；
+        # 任何程序寫入後都會改變，讓檢索結果的快取失效。載入留給在執行緒中執行的 query
+        stat = os.stat(self._log_path)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _check_dimension(self, dimension: int):
+        if dimension != self.dimension:
+            raise ValueError(f"Index dimension {dimension} does not match {self.dimension}")
+
+    def _reset(self, matrix: np.ndarray):
+        self._matrix = matrix
+        self._ids: List[Optional[str]] = []
+        self._metadata: List[Optional[Dict[str, Any]]] = []
+        self._seq: List[int] = []
+        self._next_seq = 0
+        self._slots: Dict[str, int] = {}
+        self._free = set()
+        self._valid = np.zeros(len(matrix), dtype=bool)
+        self._filter_masks.clear()
+
+    def _apply(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """套用一筆記錄到記憶體中的狀態，返回該記錄"""
+        slot, vector_id = record["slot"], record["id"]
+        while len(self._ids) <= slot:
+            # 其他程序分配的新位置，中間尚未使用的位置可以重複使用
+            self._free.add(len(self._ids))
+            self._ids.append(None)
+            self._metadata.append(None)
+            self._seq.append(0)
+        old_id = self._ids[slot]
+        if old_id is not None and self._slots.get(old_id) == slot:
+            del self._slots[old_id]
+        if vector_id is None:
+            self._ids[slot] = self._metadata[slot] = None
+            self._valid[slot] = False
+            self._free.add(slot)
+        else:
+            previous = self._slots.get(vector_id)
+            if previous is not None and previous != slot:
+                self._ids[previous] = self._metadata[previous] = None
+                self._valid[previous] = False
+                self._free.add(previous)
+            self._ids[slot] = vector_id
+            self._metadata[slot] = record["metadata"]
+            self._seq[slot] = record["seq"]
+            self._next_seq = max(self._next_seq, record["seq"] + 1)
+            self._slots[vector_id] = slot
+            self._valid[slot] = True
+            self._free.discard(slot)
+        # 已快取的過濾結果只更新改變的位置
+        for key, (filter, mask) in list(self._filter_masks.items()):
+            if slot < len(mask):
+                mask[slot] = self._metadata[slot] is not None and matches_filter(self._metadata[slot], filter)
+            else:
+                del self._filter_masks[key]
+        return record
+
+    def _read_log(self):
+        """套用記錄文件中上次讀取之後附加的完整行（呼叫時需持有檔案鎖）"""
+        data = self._log_file.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            record = json.loads(line)
+            if "dimension" in record:
+                self._check_dimension(record["dimension"])
+                continue
+            self._apply(record)
+            self._log_lines += 1
+        # 寫入中斷留下的不完整行不套用，下次從這裡繼續
+        self._log_file.seek(end - len(data), os.SEEK_CUR)
+
+    def _open_log(self):
+        if self._log_file is not None:
+            self._log_file.close()
+        self._log_file = open(self._log_path, "rb")
+        self._log_lines = 0
+
+    def _load(self):
+        """完整載入記錄並重新映射向量矩陣（呼叫時需持有檔案鎖）"""
+        # 其他程序擴大矩陣時會替換文件，因此每次都重新映射
+        self._reset(np.load(self._vectors_path, mmap_mode="r+"))
+        self._open_log()
+        self._read_log()
+
+    def _reload_if_changed(self):
+        # 呼叫時需持有 self._lock 與檔案鎖。記錄文件被替換（壓縮）時完整載入，否則只讀取新附加的行；
+        # 持有舊文件的 handle，inode 不會被新文件重複使用
+        if os.stat(self._log_path).st_ino != os.fstat(self._log_file.fileno()).st_ino:
+            self._load()
+        elif os.fstat(self._log_file.fileno()).st_size > self._log_file.tell():
+            self._read_log()
+
+    @contextmanager
+    def _reading(self):
+        with self._lock, self._file_lock(exclusive=False):
+            self._reload_if_changed()
+            yield
+
+    @contextmanager
+    def _writing(self):
+        # 先套用其他程序的寫入，再附加這次的記錄；擴大矩陣或過期的行太多時改為重寫記錄
+        with self._lock, self._file_lock(exclusive=True):
+            self._reload_if_changed()
+            capacity = len(self._matrix)
+            records = []
+            yield records
+            self._matrix.flush()
+            if len(self._matrix) != capacity or self._log_lines + len(records) > 2 * len(self._slots) + 1024:
+                self._compact()
+            elif records:
+                data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+                with open(self._log_path, "r+b") as f:
+                    # 截掉寫入中斷留下的不完整行
+                    f.truncate(self._log_file.tell())
+                    f.seek(0, os.SEEK_END)
+                    f.write(data)
+                self._log_file.seek(len(data), os.SEEK_CUR)
+                self._log_lines += len(records)
+
+    def _compact(self):
+        """重寫只含現有向量的記錄並替換（呼叫時需持有排他檔案鎖）"""
+        self._matrix.flush()
+        tmp_path = self._log_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"dimension": self.dimension}) + "\n")
+            for slot in sorted(self._slots.values()):
+                f.write(json.dumps({
+                    "slot": slot,
+                    "id": self._ids[slot],
+                    "seq": self._seq[slot],
+                    "metadata": self._metadata[slot]
+                }, ensure_ascii=False) + "\n")
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+        os.replace(tmp_path, self._log_path)
+        self._open_log()
+        self._log_file.seek(0, os.SEEK_END)
+        self._log_lines = len(self._slots)
+
+    def _grow(self, capacity: int):
+        # 記憶體映射文件無法原地擴大，複製到新文件後替換
+        tmp_path = self._vectors_path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(capacity, self.dimension))
+        grown[:len(self._ids)] = self._matrix[:len(self._ids)]
+        grown.flush()
+        del grown
+        self._matrix = None
+        os.replace(tmp_path, self._vectors_path)
+        self._matrix = np.load(self._vectors_path, mmap_mode="r+")
+        self._valid = np.concatenate([self._valid, np.zeros(capacity - len(self._valid), dtype=bool)])
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if len(self._ids) == len(self._matrix):
+            self._grow(len(self._matrix) * 2)
+        return len(self._ids)
+
+    def upsert(self, vectors):
+        if not vectors:
+            return
+        values = np.asarray([vector["values"] for vector in vectors], dtype=np.float32)
+        if values.shape[1] != self.dimension:
+            raise ValueError(f"Vector dimension {values.shape[1]} does not match {self.dimension}")
+        # 預先正規化，查詢時 cosine 相似度就是內積
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        values /= np.where(norms == 0, 1, norms)
+
+        with self._writing() as records:
+            for vector, row in zip(vectors, values):
+                slot = self._slots.get(vector["id"])
+                if slot is None:
+                    slot = self._allocate()
+                self._matrix[slot] = row
+                records.append(self._apply({
+                    "slot": slot,
+                    "id": vector["id"],
+                    "seq": self._next_seq,
+                    "metadata": vector.get("metadata") or {}
+                }))
+
+    def delete(self, ids):
+        with self._writing() as records:
+            for vector_id in ids:
+                slot = self._slots.get(vector_id)
+                if slot is not None:
+                    records.append(self._apply({"slot": slot, "id": None}))
+
+    def _filter_mask(self, filter: Dict[str, Any]) -> np.ndarray:
+        # 同一個過濾條件在之後的查詢重複使用，寫入時只更新改變的位置
+        key = json.dumps(filter, sort_keys=True, ensure_ascii=False)
+        entry = self._filter_masks.get(key)
+        if entry is None or len(entry[1]) != len(self._metadata):
+            mask = np.fromiter(
+                (metadata is not None and matches_filter(metadata, filter) for metadata in self._metadata),
+                dtype=bool, count=len(self._metadata))
+            entry = self._filter_masks[key] = (filter, mask)
+        return entry[1]
+
+    def query(self, vector, top_k=3, filter=None):
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        with self._reading():
+            size = len(self._ids)
+            if size == 0:
+                return []
+            mask = self._valid[:size]
+            if filter:
+                mask = mask & self._filter_mask(filter)
+            candidates = np.flatnonzero(mask)
+            if len(candidates) == 0:
+                return []
+            # 沒有過濾時直接對整個矩陣做內積，避免複製
+            if len(candidates) == size:
+                scores = self._matrix[:size] @ query
+            else:
+                scores = self._matrix[candidates] @ query
+            k = min(top_k, len(candidates))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                Match(self._ids[candidates[i]], float(scores[i]), dict(self._metadata[candidates[i]]))
+                for i in top
+            ]
+
+    def count(self):
+        with self._reading():
+            return len(self._slots)
+
+    def list_recent(self, limit=5):
+        with self._reading():
+            recent = sorted(self._slots.values(), key=lambda slot: self._seq[slot], reverse=True)[:limit]
+            return [Match(self._ids[slot], 0.0, dict(self._metadata[slot])) for slot in recent]
+
+def create_backend(backend: str = settings.VECTOR_BACKEND) -> VectorBackend:
+    """依設定建立向量索引後端：pinecone 或 local"""
+    if backend == "local":
+        print(f"Using local vector index at {settings.LOCAL_INDEX_PATH}")
+        return LocalVectorIndex()
+    if backend == "pinecone":
+        return PineconeBackend()
+    raise ValueError(f"Unknown VECTOR_BACKEND: {backend}")
@@ -1,10 +1,16 @@
-from pinecone import Pinecone, ServerlessSpec
 from app.config import settings
+from app.services.vector_backends import create_backend
+from app.services.query_cache import EmbeddingCache, RetrievalCache, normalize_query
 from langchain_huggingface import HuggingFaceEmbeddings
+import asyncio
+import time
 import uuid
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 
+EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+
 @dataclass
 class Document:
     page_content: str
@@ -13,38 +19,23 @@ class Document:
 class VectorStore:
     def __init__(self):
         try:
-            print("Initializing Pinecone...")
-            self.pc = Pinecone(
-                api_key=settings.PINECONE_API_KEY,
-                environment=settings.PINECONE_ENV
-            )
-            print("Pinecone initialized successfully")
-            
-            self.index_name = "customer-service"
-            
             # 使用 1024 維度的模型
             self.embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/paraphrase-multilingual-mpnet-base-v2"  # 使用生成 768 維度的模型
+                model_name=EMBEDDING_MODEL  # 使用生成 768 維度的模型
             )
             
-            # 檢查索引是否存在
-            if self.index_name not in self.pc.list_indexes().names():
-                print(f"Creating new index: {self.index_name}")
-                self.pc.create_index(
-                    name=self.index_name,
-                    spec={
-                        "serverless": {
-                            "cloud": "aws",
-                            "region": "us-east-1"
-                        }
-                    },
-                    dimension=768,  # 修改為 768 維度以匹配模型
-                    metric="cosine"
-                )
+            # 客戶常重複問相同的問題，快取查詢向量與檢索結果
+            self.embedding_cache = EmbeddingCache(
+                settings.EMBEDDING_CACHE_SIZE, settings.EMBEDDING_CACHE_PATH, EMBEDDING_MODEL,
+                settings.EMBEDDING_CACHE_MAX_ROWS)
+            self.retrieval_cache = RetrievalCache(settings.RETRIEVAL_CACHE_SIZE, settings.RETRIEVAL_CACHE_TTL)
             
-            self.index = self.pc.Index(self.index_name)
-            stats = self.index.describe_index_stats()
-            print("Index stats:", stats)
+            # 非同步檢索時計算嵌入的執行緒池
+            self.embedding_executor = ThreadPoolExecutor(
+                max_workers=settings.EMBEDDING_WORKERS, thread_name_prefix="embedding")
+            
+            # 索引後端由 VECTOR_BACKEND 決定（pinecone 或 local）
+            self.backend = create_backend()
             
         except Exception as e:
             print(f"Error initializing vector store: {e}")
@@ -64,7 +55,7 @@ class VectorStore:
                 "metadata": {**metadata, "text": message}
             }
             
-            self.index.upsert(vectors=[vector_data])
+            self.backend.upsert([vector_data])
             print(f"Added conversation with ID: {vector_id}")
             
         except Exception as e:
@@ -72,39 +63,143 @@ class VectorStore:
             print(f"Error type: {type(e)}")
             raise  # 讓錯誤傳播以便調試
     
-    def search_similar(self, query: str, k: int = 3):
-        """搜索相似的對話"""
+    def _upsert_chunks(self, vectors: List[Dict[str, Any]], chunk_size: int):
+        for start in range(0, len(vectors), chunk_size):
+            self.backend.upsert(vectors[start:start + chunk_size])
+
+    def add_documents(self, documents: List[Dict[str, Any]], batch_size: Optional[int] = None,
+                      upsert_batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """批量添加文檔，每筆為 {"text", "metadata"}，可選 "id"（未提供時產生 uuid）
+
+        每批文檔一次嵌入，向量分塊 upsert；upsert 在背景執行緒進行，
+        與下一批的嵌入重疊，總耗時接近兩者中較慢的一方而不是兩者之和。
+
+        Returns:
+            {"count", "seconds", "docs_per_sec"}
+        """
+        batch_size = batch_size or settings.INGEST_EMBED_BATCH_SIZE
+        upsert_batch_size = upsert_batch_size or settings.INGEST_UPSERT_BATCH_SIZE
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=1) as uploader:
+            pending = None
+            for offset in range(0, len(documents), batch_size):
+                batch = documents[offset:offset + batch_size]
+                embeddings = self.embeddings.embed_documents([doc["text"] for doc in batch])
+                vectors = [
+                    {
+                        "id": doc.get("id") or str(uuid.uuid4()),
+                        "values": embedding,
+                        "metadata": {**doc.get("metadata", {}), "text": doc["text"]}
+                    }
+                    for doc, embedding in zip(batch, embeddings)
+                ]
+                # 等上一批寫入完成再送出這一批，同時最多只有一批在寫入
+                if pending is not None:
+                    pending.result()
+                pending = uploader.submit(self._upsert_chunks, vectors, upsert_batch_size)
+                done = offset + len(batch)
+                print(f"Embedded {done}/{len(documents)} documents "
+                      f"({done / (time.perf_counter() - start):.1f} docs/sec)")
+            if pending is not None:
+                pending.result()
+
+        seconds = time.perf_counter() - start
+        stats = {
+            "count": len(documents),
+            "seconds": seconds,
+            "docs_per_sec": len(documents) / seconds if seconds else 0.0
+        }
+        print(f"Added {stats['count']} documents in {seconds:.2f}s ({stats['docs_per_sec']:.1f} docs/sec)")
+        return stats
+
+    def delete(self, ids: List[str]):
+        """從向量數據庫刪除文檔"""
+        self.backend.delete(ids)
+    
+    @staticmethod
+    def _to_documents(matches) -> List[Document]:
+        """轉換為 Document 對象"""
+        return [
+            Document(
+                page_content=match.metadata.get("text", ""),
+                metadata={key: value for key, value in match.metadata.items() if key != "text"}
+            )
+            for match in matches
+        ]
+    
+    def search_similar(self, query: str, k: int = 3, filter: Optional[Dict[str, Any]] = None):
+        """搜索相似的對話
+        
+        Args:
+            filter: metadata 過濾條件，例如 {"type": "faq"}
+        """
         try:
-            # 生成查詢嵌入向量
-            query_embedding = self.embeddings.embed_query(query)
+            normalized = normalize_query(query)
+            cache_key = self.retrieval_cache.make_key(normalized, k, filter)
+            version = self.backend.version
+            cached = self.retrieval_cache.get(cache_key, version)
+            if cached is not None:
+                return list(cached)
+            
+            # 生成查詢嵌入向量（相同的問題只計算一次）；嵌入正規化後的文字，
+            # 對應同一個快取鍵的各種寫法才會得到相同的向量
+            query_embedding = self.embedding_cache.get_or_compute(
+                normalized, lambda: self.embeddings.embed_query(normalized))
             
-            # 在 Pinecone 中搜索
-            results = self.index.query(
-                vector=query_embedding,
-                top_k=k,
-                include_metadata=True
+            matches = self.backend.query(query_embedding, top_k=k, filter=filter)
+            documents = self._to_documents(matches)
+            
+            self.retrieval_cache.put(cache_key, version, tuple(documents))
+            return documents
+            
+        except Exception as e:
+            print(f"Error searching similar: {e}")
+            return []
+    
+    async def asearch_similar(self, query: str, k: int = 3, filter: Optional[Dict[str, Any]] = None):
+        """search_similar 的非同步版本，不會阻塞事件循環
+        
+        嵌入在有上限的執行緒池中計算（EMBEDDING_WORKERS），模型只載入一次且運算時釋放 GIL；
+        向量查詢透過後端的 aquery 執行。事件循環中只讀取後端的 version（不取鎖、不載入）。
+        """
+        try:
+            normalized = normalize_query(query)
+            cache_key = self.retrieval_cache.make_key(normalized, k, filter)
+            version = self.backend.version
+            cached = self.retrieval_cache.get(cache_key, version)
+            if cached is not None:
+                return list(cached)
+            
+            loop = asyncio.get_running_loop()
+            query_embedding = await loop.run_in_executor(
+                self.embedding_executor,
+                self.embedding_cache.get_or_compute,
+                normalized,
+                lambda: self.embeddings.embed_query(normalized)
             )
             
-            # 轉換為 Document 對象
-            documents = []
-            for match in results.matches:
-                doc = Document(
-                    page_content=match.metadata.get("text", ""),
-                    metadata={k: v for k, v in match.metadata.items() if k != "text"}
-                )
-                documents.append(doc)
+            matches = await self.backend.aquery(query_embedding, top_k=k, filter=filter)
+            documents = self._to_documents(matches)
             
+            self.retrieval_cache.put(cache_key, version, tuple(documents))
             return documents
             
         except Exception as e:
             print(f"Error searching similar: {e}")
             return []
 
+    def cache_stats(self):
+        """查詢向量快取與檢索結果快取的命中率"""
+        return {
+            "embedding_cache": self.embedding_cache.stats(),
+            "retrieval_cache": self.retrieval_cache.stats()
+        }
+
     def get_document_count(self):
         """獲取知識庫中的文檔數量"""
         try:
-            stats = self.index.describe_index_stats()
-            return stats.total_vector_count
+            return self.backend.count()
         except Exception as e:
             print(f"Error getting document count: {e}")
             return 0
@@ -112,18 +207,13 @@ class VectorStore:
     def list_recent_documents(self, limit=5):
         """列出最近添加的文檔"""
         try:
-            results = self.index.query(
-                vector=[0] * 768,  # 修改為 768 維度的假向量
-                top_k=limit,
-                include_metadata=True
-            )
             return [
                 {
                     "text": match.metadata.get("text", ""),
                     "category": match.metadata.get("category", ""),
                     "timestamp": match.metadata.get("timestamp", "")
                 }
-                for match in results.matches
+                for match in self.backend.list_recent(limit)
             ]
         except Exception as e:
             print(f"Error listing documents: {e}")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 測試以 jungle_chat_py/ 為根目錄導入 app 套件
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
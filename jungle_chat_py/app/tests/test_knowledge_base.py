@@ -0,0 +1,53 @@
+import pytest
+
+from app.services.knowledge_base import diff_manifest, faq_document, load_manifest, policy_document, save_manifest
+
+def _faq(question, answer="答案"):
+    return faq_document({"question": question, "answer": answer, "category": "一般"})
+
+def _policy(name, content="内容"):
+    return policy_document({"name": name, "content": content, "category": "退货"})
+
+def _manifest(*documents):
+    return {doc["key"]: doc["id"] for doc in documents}
+
+def test_first_sync_adds_everything():
+    docs = [_faq("Q1"), _faq("Q2")]
+    to_upsert, to_delete, manifest, stats = diff_manifest({}, {"faq": docs})
+    assert to_upsert == docs
+    assert to_delete == []
+    assert manifest == _manifest(*docs)
+    assert stats == {"added": 2, "updated": 0, "unchanged": 0, "deleted": 0, "duplicates": []}
+
+def test_unchanged_updated_and_deleted():
+    old_q1, q2, q3 = _faq("Q1"), _faq("Q2"), _faq("Q3")
+    new_q1 = _faq("Q1", "新的答案")
+    to_upsert, to_delete, manifest, stats = diff_manifest(_manifest(old_q1, q2, q3), {"faq": [new_q1, q2]})
+    assert to_upsert == [new_q1]
+    assert sorted(to_delete) == sorted([old_q1["id"], q3["id"]])
+    assert manifest == _manifest(new_q1, q2)
+    assert (stats["unchanged"], stats["updated"], stats["deleted"]) == (1, 1, 1)
+
+def test_duplicate_keys_keep_first_and_are_reported():
+    first, second = _faq("Q1", "第一个"), _faq("Q1", "第二个")
+    to_upsert, _, manifest, stats = diff_manifest({}, {"faq": [first, second, _faq("Q2")]})
+    assert first in to_upsert and second not in to_upsert
+    assert manifest[first["key"]] == first["id"]
+    assert stats["duplicates"] == [first["key"]]
+    assert stats["added"] == 2
+
+def test_missing_source_file_keeps_its_vectors():
+    faq, policy = _faq("Q1"), _policy("退货政策")
+    # policies.json 不存在时 sources 中没有 policy，它的向量不能被删除
+    to_upsert, to_delete, manifest, stats = diff_manifest(_manifest(faq, policy), {"faq": [faq]})
+    assert to_upsert == [] and to_delete == []
+    assert manifest == _manifest(faq, policy)
+    assert stats["deleted"] == 0
+
+def test_manifest_belongs_to_one_index(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    assert load_manifest(path, "local:/a") == {}
+    save_manifest({"faq:Q1": "faq-1"}, path, "local:/a")
+    assert load_manifest(path, "local:/a") == {"faq:Q1": "faq-1"}
+    with pytest.raises(ValueError):
+        load_manifest(path, "pinecone:customer-service")
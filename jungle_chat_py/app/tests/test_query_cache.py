@@ -0,0 +1,34 @@
+import pytest
+
+from app.services.query_cache import EmbeddingCache, RetrievalCache, normalize_query
+
+@pytest.mark.parametrize("text, expected", [
+    ("每坪租金是多少？", "每坪租金是多少"),
+    ("每坪租金是多少?!", "每坪租金是多少"),
+    ("  退货   流程\n怎么办 ", "退货 流程 怎么办"),
+    ("ＡＢＣ１２３", "ABC123"),
+    ("Return Policy", "Return Policy"),
+    ("？", ""),
+])
+def test_normalize_query(text, expected):
+    assert normalize_query(text) == expected
+
+def test_embedding_cache_persists_and_caps_rows(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(max_entries=2, path=path, model="m", max_rows=10)
+    for i in range(25):
+        cache.put(f"q{i}", [float(i)] * 4)
+    assert cache._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] <= 10
+
+    reopened = EmbeddingCache(max_entries=2, path=path, model="m", max_rows=10)
+    assert reopened.get("q24") == [24.0] * 4
+    assert reopened.get("q0") is None
+    # 不同模型的向量不互相命中
+    assert EmbeddingCache(path=path, model="other").get("q24") is None
+
+def test_retrieval_cache_invalidates_on_new_version():
+    cache = RetrievalCache(max_entries=4, ttl=60)
+    key = cache.make_key("q", 3, None)
+    cache.put(key, 1, ["doc"])
+    assert cache.get(key, 1) == ["doc"]
+    assert cache.get(key, 2) is None
@@ -0,0 +1,138 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from app.services.vector_backends import LocalVectorIndex, matches_filter
+
+DIMENSION = 8
+
+def _vector(seed):
+    return np.random.default_rng(seed).random(DIMENSION).tolist()
+
+def _docs(count, start=0):
+    return [
+        {"id": f"doc-{i}", "values": _vector(i), "metadata": {"n": i, "type": "faq" if i % 2 else "policy"}}
+        for i in range(start, start + count)
+    ]
+
+@pytest.fixture
+def index(tmp_path):
+    return LocalVectorIndex(str(tmp_path / "index"), dimension=DIMENSION, initial_capacity=4)
+
+def test_upsert_query_and_delete(index):
+    index.upsert(_docs(10))
+    assert index.count() == 10
+    top = index.query(_vector(3), top_k=3)
+    assert top[0].id == "doc-3"
+    assert top[0].score == pytest.approx(1.0)
+    assert [match.score for match in top] == sorted((match.score for match in top), reverse=True)
+
+    index.delete(["doc-3", "missing"])
+    assert index.count() == 9
+    assert "doc-3" not in [match.id for match in index.query(_vector(3), top_k=9)]
+
+def test_upsert_overwrites_existing_id(index):
+    index.upsert(_docs(3))
+    index.upsert([{"id": "doc-1", "values": _vector(1), "metadata": {"n": 100}}])
+    assert index.count() == 3
+    assert index.query(_vector(1), top_k=1)[0].metadata == {"n": 100}
+    assert index.list_recent(1)[0].id == "doc-1"
+
+def test_deleted_slot_is_reused(index):
+    index.upsert(_docs(4))
+    slot = index._slots["doc-2"]
+    index.delete(["doc-2"])
+    index.upsert([{"id": "new", "values": _vector(99), "metadata": {}}])
+    assert index._slots["new"] == slot
+    assert len(index._ids) == 4
+
+def test_grows_past_initial_capacity(index):
+    index.upsert(_docs(10))
+    index.upsert(_docs(10, start=10))
+    assert index.count() == 20
+    assert index.query(_vector(17), top_k=1)[0].id == "doc-17"
+
+@pytest.mark.parametrize("filter, expected", [
+    ({"type": "faq"}, True),
+    ({"type": {"$eq": "policy"}}, False),
+    ({"type": {"$ne": "policy"}}, True),
+    ({"type": {"$in": ["faq", "product"]}}, True),
+    ({"type": {"$nin": ["faq"]}}, False),
+    ({"n": {"$gt": 5}}, True),
+    ({"n": {"$gte": 7}}, True),
+    ({"n": {"$lt": 7}}, False),
+    ({"n": {"$lte": 7}}, True),
+    ({"n": {"$gt": 1, "$lt": 5}}, False),
+    ({"missing": {"$gt": 1}}, False),
+    ({"$and": [{"type": "faq"}, {"n": {"$gt": 5}}]}, True),
+    ({"$or": [{"type": "policy"}, {"n": 7}]}, True),
+    ({"$or": [{"type": "policy"}, {"n": 8}]}, False),
+])
+def test_filter_operators(filter, expected):
+    assert matches_filter({"type": "faq", "n": 7}, filter) is expected
+
+def test_unsupported_filter_operator():
+    with pytest.raises(ValueError):
+        matches_filter({"n": 1}, {"n": {"$regex": "1"}})
+
+def test_query_with_filter_sees_later_writes(index):
+    index.upsert(_docs(6))
+    assert {match.id for match in index.query(_vector(0), top_k=10, filter={"type": "faq"})} == \
+        {"doc-1", "doc-3", "doc-5"}
+    # 快取的過濾結果在寫入後更新
+    index.upsert([{"id": "doc-0", "values": _vector(0), "metadata": {"type": "faq"}}])
+    index.delete(["doc-5"])
+    assert {match.id for match in index.query(_vector(0), top_k=10, filter={"type": "faq"})} == \
+        {"doc-0", "doc-1", "doc-3"}
+
+def test_reopen_and_share_between_instances(tmp_path):
+    path = str(tmp_path / "index")
+    first = LocalVectorIndex(path, dimension=DIMENSION, initial_capacity=4)
+    second = LocalVectorIndex(path, dimension=DIMENSION, initial_capacity=4)
+    first.upsert(_docs(6))
+    version = second.version
+    assert second.count() == 6
+    second.delete(["doc-0"])
+    assert second.version != version
+    assert first.count() == 5
+
+    reopened = LocalVectorIndex(path, dimension=DIMENSION)
+    assert reopened.count() == 5
+    assert reopened.query(_vector(4), top_k=1)[0].id == "doc-4"
+    with pytest.raises(ValueError):
+        LocalVectorIndex(path, dimension=DIMENSION + 1)
+
+def test_version_is_stable_without_writes(index):
+    index.upsert(_docs(2))
+    version = index.version
+    index.query(_vector(0))
+    assert index.version == version
+
+def test_incomplete_log_line_is_ignored_and_truncated(tmp_path):
+    path = str(tmp_path / "index")
+    LocalVectorIndex(path, dimension=DIMENSION).upsert(_docs(3))
+    with open(os.path.join(path, "meta.jsonl"), "ab") as f:
+        f.write(b'{"slot": 9, "id": "tor')
+    index = LocalVectorIndex(path, dimension=DIMENSION)
+    assert index.count() == 3
+    index.upsert(_docs(1, start=3))
+    assert LocalVectorIndex(path, dimension=DIMENSION).count() == 4
+
+def test_legacy_meta_json_is_converted(tmp_path):
+    path = tmp_path / "index"
+    path.mkdir()
+    matrix = np.lib.format.open_memmap(str(path / "vectors.npy"), mode="w+", dtype=np.float32, shape=(4, DIMENSION))
+    matrix[0] = np.asarray(_vector(0)) / np.linalg.norm(_vector(0))
+    matrix.flush()
+    del matrix
+    (path / "meta.json").write_text(json.dumps({
+        "dimension": DIMENSION, "ids": ["legacy", None], "metadata": [{"type": "faq"}, None],
+        "seq": [0, 0], "next_seq": 1
+    }), encoding="utf-8")
+
+    index = LocalVectorIndex(str(path), dimension=DIMENSION)
+    assert not (path / "meta.json").exists()
+    assert index.query(_vector(0), top_k=1)[0].id == "legacy"
+    assert LocalVectorIndex(str(path), dimension=DIMENSION).count() == 1
@@ -0,0 +1,54 @@
+import sys
+import os
+import argparse
+import tempfile
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.config import settings
+from app.services.vector_backends import LocalVectorIndex
+
+def main():
+    parser = argparse.ArgumentParser(description="本地向量索引的检索延迟")
+    parser.add_argument("--vectors", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    dimension = settings.VECTOR_DIMENSION
+    vectors = rng.standard_normal((args.vectors, dimension), dtype=np.float32)
+    types = ["product", "faq", "policy"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = LocalVectorIndex(tmp_dir, dimension)
+
+        start = time.perf_counter()
+        index.upsert([
+            {"id": f"doc-{i}", "values": vector, "metadata": {"type": types[i % 3], "text": f"doc {i}"}}
+            for i, vector in enumerate(vectors)
+        ])
+        print(f"Upserted {args.vectors} vectors in {time.perf_counter() - start:.2f}s")
+
+        queries = rng.standard_normal((args.queries, dimension), dtype=np.float32)
+        for label, query_filter in (("no filter", None), ("type=faq", {"type": "faq"})):
+            start = time.perf_counter()
+            for query in queries:
+                index.query(query, top_k=args.top_k, filter=query_filter)
+            per_query = (time.perf_counter() - start) / args.queries
+            print(f"Query ({label}): {per_query * 1e3:.3f} ms")
+
+        # 检查最近邻是否正确：查询向量本身应该是第一名
+        match = index.query(vectors[42], top_k=1)[0]
+        print(f"Self match: {match.id} (score {match.score:.4f})")
+
+        start = time.perf_counter()
+        LocalVectorIndex(tmp_dir, dimension)
+        print(f"Reopen index: {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+if __name__ == "__main__":
+    main()
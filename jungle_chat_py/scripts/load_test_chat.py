@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+def load_questions(file_path='data/faqs.json'):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return [faq['question'] for faq in json.load(f)]
+
+def post_chat(url, content, timeout):
+    payload = json.dumps({
+        "content": content,
+        "role": "user",
+        "channel": "load-test",
+        "customer_id": "load-test"
+    }).encode('utf-8')
+    request = urllib.request.Request(url, data=payload, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+        ok = response.status == 200
+    return ok, time.perf_counter() - start
+
+async def run_level(url, questions, concurrency, total, unique, timeout):
+    """以固定的并发数发送 total 个请求，返回吞吐量与延迟"""
+    counter = iter(range(total))
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            content = questions[i % len(questions)]
+            if unique:
+                # 每个问题都不同，避开检索结果缓存
+                content = f"{content} ({i})"
+            try:
+                ok, latency = await asyncio.to_thread(post_chat, url, content, timeout)
+            except Exception as e:
+                print(f"Request failed: {e}")
+                errors += 1
+                continue
+            if ok:
+                latencies.append(latency)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "throughput": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": statistics.quantiles(latencies, n=20)[-1] if len(latencies) >= 2 else max(latencies, default=0.0),
+        "errors": errors
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="对 /api/chat/generate 做并发压测，观察吞吐量随并发数的变化")
+    parser.add_argument("--url", default="http://localhost:8001/api/chat/generate")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=32, help="每个并发级别的请求数")
+    parser.add_argument("--unique", action="store_true", help="每个请求使用不同的问题")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    questions = load_questions()
+    # 每个并发请求占用一个线程，默认线程池可能小于最高并发数
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max(args.concurrency)))
+    print(f"{'concurrency':>11} {'req/s':>8} {'p50 (s)':>8} {'p95 (s)':>8} {'errors':>6}")
+    for concurrency in args.concurrency:
+        result = await run_level(args.url, questions, concurrency, args.requests, args.unique, args.timeout)
+        print(f"{result['concurrency']:>11} {result['throughput']:>8.2f} {result['p50']:>8.2f} "
+              f"{result['p95']:>8.2f} {result['errors']:>6}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,7 @@
 import sys
 import os
 import json
+import argparse
 
 # 添加项目根目录到 Python 路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -12,33 +13,46 @@ def load_json_data(file_path):
         return json.load(f)
 
 def main():
+    parser = argparse.ArgumentParser(description="将 data/ 中的产品、常见问题与政策导入知识库")
+    parser.add_argument("--batch-size", type=int, default=None, help="每批嵌入的文档数（默认 INGEST_EMBED_BATCH_SIZE）")
+    parser.add_argument("--upsert-batch-size", type=int, default=None, help="每次 upsert 的向量数（默认 INGEST_UPSERT_BATCH_SIZE）")
+    parser.add_argument("--sync", action="store_true", help="增量同步：只写入改变的条目并删除已移除的条目")
+    args = parser.parse_args()
+    batch_options = {"batch_size": args.batch_size, "upsert_batch_size": args.upsert_batch_size}
+    
     kb = KnowledgeBase()
     
+    if args.sync:
+        stats = kb.sync('data', **batch_options)
+        print(f"Knowledge base sync completed: {stats['added']} added, {stats['updated']} updated, "
+              f"{stats['unchanged']} unchanged, {stats['deleted']} deleted")
+        return
+    
     # 加载产品数据
     try:
         products = load_json_data('data/products.json')
-        kb.add_product_info(products)
-        print(f"Added {len(products)} products to knowledge base")
+        stats = kb.add_product_info(products, **batch_options)
+        print(f"Added {len(products)} products to knowledge base ({stats['docs_per_sec']:.1f} docs/sec)")
     except Exception as e:
         print(f"Error loading products: {e}")
     
     # 加载常见问题
     try:
         faqs = load_json_data('data/faqs.json')
-        kb.add_faq(faqs)
-        print(f"Added {len(faqs)} FAQs to knowledge base")
+        stats = kb.add_faq(faqs, **batch_options)
+        print(f"Added {len(faqs)} FAQs to knowledge base ({stats['docs_per_sec']:.1f} docs/sec)")
     except Exception as e:
         print(f"Error loading FAQs: {e}")
     
     # 加载政策信息
     try:
         policies = load_json_data('data/policies.json')
-        kb.add_policy(policies)
-        print(f"Added {len(policies)} policies to knowledge base")
+        stats = kb.add_policy(policies, **batch_options)
+        print(f"Added {len(policies)} policies to knowledge base ({stats['docs_per_sec']:.1f} docs/sec)")
     except Exception as e:
         print(f"Error loading policies: {e}")
     
     print("Knowledge base training completed!")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file